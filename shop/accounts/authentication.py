@@ -0,0 +1,131 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class LocalLRUCache:
+    """Ограниченный по размеру кэш в памяти процесса с временем жизни записей"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()             # ключ -> (значение, момент истечения)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TokenUserCache:
+    """
+    Кэш соответствия токен → пользователь в два уровня: LRU в памяти процесса
+    (TOKEN_AUTH_LOCAL_SIZE записей на TOKEN_AUTH_LOCAL_TTL секунд) и общий кэш
+    TOKEN_AUTH_CACHE_ALIAS на TOKEN_AUTH_CACHE_TTL секунд. Сброс записи удаляет ее
+    из общего кэша и из памяти текущего процесса; в других процессах запись
+    живет не дольше TOKEN_AUTH_LOCAL_TTL. Это верно, только если TOKEN_AUTH_CACHE_ALIAS
+    общий для всех процессов (Redis или файловый кэш, см. CACHES); с LocMemCache
+    у каждого процесса своя копия, и сброс до них не доходит.
+    В LRU хранится сериализованный токен: каждое попадание получает свою копию токена
+    и пользователя, которую запрос может менять, не затрагивая параллельные запросы.
+    """
+
+    def __init__(self):
+        self._local = None
+        self._local_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOKEN_AUTH_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 300)
+
+    @property
+    def local(self):
+        if self._local is None:
+            with self._local_lock:
+                if self._local is None:
+                    self._local = LocalLRUCache(
+                        getattr(settings, 'TOKEN_AUTH_LOCAL_SIZE', 1024),
+                        getattr(settings, 'TOKEN_AUTH_LOCAL_TTL', 10),
+                    )
+        return self._local
+
+    @staticmethod
+    def key(token_key):
+        # В ключах кэша хранится хеш, а не сам токен
+        return f'auth_token:{hashlib.sha256(token_key.encode()).hexdigest()}'
+
+    def get(self, token_key):
+        """Возвращает токен с загруженным пользователем или None"""
+        key = self.key(token_key)
+        data = self.local.get(key)
+        if data is not None:
+            return pickle.loads(data)
+        token = self.cache.get(key)
+        if token is not None:
+            self.local.set(key, pickle.dumps(token, pickle.HIGHEST_PROTOCOL))
+        return token
+
+    def set(self, token):
+        key = self.key(token.key)
+        self.cache.set(key, token, timeout=self.timeout)
+        self.local.set(key, pickle.dumps(token, pickle.HIGHEST_PROTOCOL))
+
+    def invalidate(self, token_keys):
+        keys = [self.key(token_key) for token_key in token_keys]
+        self.cache.delete_many(keys)
+        for key in keys:
+            self.local.delete(key)
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, которая берет пользователя из token_user_cache и обращается
+    к базе только при промахе. Кэш сбрасывается сигналами при удалении токена
+    и при сохранении или удалении пользователя (например, при деактивации).
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_user_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_user_cache.set(token)
+            return user, token
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
@@ -0,0 +1,70 @@
+import json
+import statistics
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from accounts.telegram import sign_init_data
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Измеряет задержку входа через Telegram (p50/p95/p99) для новых и повторных входов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Количество пользователей')
+        parser.add_argument('--first-id', type=int, default=9_000_000_000, help='Первый telegram id для тестовых пользователей')
+
+    def handle(self, *args, **options):
+        # Если токен бота не задан, initData подписываются тестовым токеном
+        with override_settings(TELEGRAM_BOT_TOKEN=settings.TELEGRAM_BOT_TOKEN or '0:benchmark'):
+            try:
+                with transaction.atomic():
+                    self.run(options['users'], options['first_id'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+        started = time.perf_counter()
+        make_password('x' * 20)
+        self.stdout.write(f'Для сравнения: хеширование пароля при create_user {(time.perf_counter() - started) * 1000:.1f} мс')
+
+    def run(self, users, first_id):
+        client = Client(HTTP_HOST='localhost')
+        url = reverse('telegram-auth')
+        payloads = [self.init_data(first_id + i) for i in range(users)]
+        for title in ('Первый вход', 'Повторный вход'):
+            timings = []
+            for payload in payloads:
+                started = time.perf_counter()
+                response = client.post(url, {'init_data': payload}, content_type='application/json')
+                timings.append(time.perf_counter() - started)
+                if response.status_code not in (200, 201):
+                    self.stderr.write(f'Ответ {response.status_code}: {response.content[:200]!r}')
+                    return
+            self.stdout.write(
+                f'{title}: {users} запросов, среднее {statistics.mean(timings) * 1000:.2f} мс, '
+                f'p50 {percentile(timings, 50) * 1000:.2f} мс, p95 {percentile(timings, 95) * 1000:.2f} мс, '
+                f'p99 {percentile(timings, 99) * 1000:.2f} мс'
+            )
+
+    @staticmethod
+    def init_data(telegram_id):
+        fields = {
+            'auth_date': str(int(time.time())),
+            'query_id': f'AAH{telegram_id}',
+            'user': json.dumps({'id': telegram_id, 'first_name': 'Тест', 'last_name': str(telegram_id)}, ensure_ascii=False),
+        }
+        return urlencode({**fields, 'hash': sign_init_data(fields)})
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_address_counts(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    UserAddress = apps.get_model('accounts', 'UserAddress')
+    counts = UserAddress.objects.filter(user=OuterRef('user')).values('user').annotate(count=Count('id')).values('count')
+    Profile.objects.update(address_count=Coalesce(Subquery(counts), Value(0)))
+
+    # Перед ограничением оставляем у каждого пользователя один адрес по умолчанию (самый ранний)
+    duplicates = UserAddress.objects.filter(is_default=True).values('user').annotate(
+        count=Count('id'), first_id=Min('id')
+    ).filter(count__gt=1)
+    for row in duplicates:
+        UserAddress.objects.filter(user=row['user'], is_default=True).exclude(pk=row['first_id']).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_address_is_default_remove_address_name_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='address_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Число адресов'),
+        ),
+        migrations.RunPython(fill_address_counts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='useraddress',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('user',), name='user_address_single_default'),
+        ),
+    ]
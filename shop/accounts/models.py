@@ -1,8 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from shop.db import retry_on_locked
+from .profile_cache import invalidate_profile
+
+# Наибольшее число адресов у одного пользователя
+MAX_USER_ADDRESSES = 5
 
 class Address(models.Model):
     district = models.CharField(max_length=100, verbose_name="Район")
@@ -26,24 +32,45 @@ class UserAddress(models.Model):
         verbose_name_plural = "Адреса пользователей"
         unique_together = ('user', 'address')
         ordering = ['-is_default', 'id']
+        constraints = [
+            # Не больше одного адреса по умолчанию у пользователя, в том числе при одновременных запросах
+            models.UniqueConstraint(fields=['user'], condition=Q(is_default=True), name='user_address_single_default'),
+        ]
     
     def __str__(self):
         return f"{self.name or 'Адрес'} пользователя {self.user.username}"
     
     def save(self, *args, **kwargs):
-        # Проверяем, что у пользователя не более 5 адресов
-        if not self.pk and UserAddress.objects.filter(user=self.user).count() >= 5:
-            raise ValidationError("Пользователь не может иметь более 5 адресов")
-        
-        # Если этот адрес установлен как адрес по умолчанию, сбрасываем флаг у других адресов
-        if self.is_default:
-            UserAddress.objects.filter(user=self.user).exclude(pk=self.pk).update(is_default=False)
-        
-        # Если это первый адрес пользователя, делаем его адресом по умолчанию
-        if not self.pk and not UserAddress.objects.filter(user=self.user).exists():
-            self.is_default = True
-            
-        super().save(*args, **kwargs)
+        with transaction.atomic(savepoint=False):
+            if self._state.adding:
+                # Лимит адресов проверяется условным UPDATE счетчика в профиле вместо COUNT:
+                # из параллельных запросов место займет только один
+                if not Profile.objects.filter(
+                    user_id=self.user_id, address_count__lt=MAX_USER_ADDRESSES
+                ).update(address_count=F('address_count') + 1):
+                    raise ValidationError(f"Пользователь не может иметь более {MAX_USER_ADDRESSES} адресов")
+                # Адрес становится адресом по умолчанию, если другого такого у пользователя нет
+                if not self.is_default:
+                    self.is_default = not UserAddress.objects.filter(user_id=self.user_id, is_default=True).exists()
+                    super().save(*args, **kwargs)
+                    return
+            update_fields = kwargs.get('update_fields')
+            if self.is_default and (update_fields is None or 'is_default' in update_fields):
+                others = UserAddress.objects.filter(user_id=self.user_id, is_default=True)
+                if self.pk is not None:
+                    others = others.exclude(pk=self.pk)
+                others.update(is_default=False)
+            super().save(*args, **kwargs)
+
+    @retry_on_locked
+    def make_default(self):
+        """Делает адрес адресом по умолчанию; прежний сбрасывается в той же транзакции"""
+        with transaction.atomic():
+            UserAddress.objects.filter(user_id=self.user_id, is_default=True).exclude(pk=self.pk).update(is_default=False)
+            UserAddress.objects.filter(pk=self.pk).update(is_default=True)
+            # UPDATE не отправляет сигналов, поэтому кэш профиля сбрасывается здесь
+            invalidate_profile(self.user_id)
+        self.is_default = True
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -52,18 +79,70 @@ class Profile(models.Model):
     phone_number = models.CharField(max_length=20, blank=True, verbose_name="Номер телефона")
     # Оставляем поле address для обратной совместимости, но помечаем его как устаревшее
     address = models.ForeignKey(Address, on_delete=models.SET_NULL, null=True, blank=True, related_name='profiles')
+    address_count = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Число адресов")
     
     def __str__(self):
         return f"Профиль пользователя {self.user.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def changed_fields(self):
+        """Поля, изменившиеся после загрузки или последнего сохранения; None — неизвестно"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and getattr(self, field.attname) != loaded[field.attname]
+        ]
+
+    def save(self, *args, **kwargs):
+        """Записывает только изменившиеся поля и не обращается к базе, если изменений нет"""
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            changed = self.changed_fields()
+            if changed is not None:
+                if not changed:
+                    return
+                kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields if field.attname not in deferred
+        }
     
     @property
     def default_address(self):
         """Возвращает адрес по умолчанию пользователя"""
-        user_address = UserAddress.objects.filter(user=self.user, is_default=True).first()
+        # Адреса, загруженные вместе с профилем (profile_queryset), не требуют запроса
+        user_addresses = getattr(self.user, 'prefetched_addresses', None)
+        if user_addresses is not None:
+            user_address = next((item for item in user_addresses if item.is_default), None)
+        else:
+            user_address = UserAddress.objects.filter(user=self.user, is_default=True).select_related('address').first()
         if user_address:
             return user_address.address
         return self.address  # Возвращаем старый адрес, если новых нет
 
+
+def profile_queryset():
+    """
+    Профили вместе с пользователем и устаревшим адресом (JOIN) и списком адресов
+    пользователя (второй запрос): весь документ профиля загружается двумя запросами.
+    """
+    return Profile.objects.select_related('user', 'address').prefetch_related(
+        models.Prefetch(
+            'user__user_addresses',
+            queryset=UserAddress.objects.select_related('address'),
+            to_attr='prefetched_addresses',
+        )
+    )
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -71,4 +150,7 @@ def create_user_profile(sender, instance, created, **kwargs):
         
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    # Профиль сохраняется, только если он загружен вместе с пользователем и изменился:
+    # обновление last_login при входе не должно обращаться к профилю
+    if User.profile.is_cached(instance):
+        instance.profile.save()
@@ -0,0 +1,59 @@
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _cache():
+    return caches[getattr(settings, 'PROFILE_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300)
+
+
+def _version_key(user_id):
+    return f'profile:version:{user_id}'
+
+
+def profile_version(user_id):
+    """Версия профиля пользователя: меняется при каждом изменении профиля или адресов"""
+    cache = _cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() не перезапишет версию, созданную параллельно другим процессом
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_profile(user_id):
+    """
+    Сбрасывает кэшированный профиль. Версия удаляется сразу и еще раз после коммита:
+    запрос, прочитавший данные до коммита, сохранит их под версией, которую уже никто не прочитает.
+    """
+    cache = _cache()
+    cache.delete(_version_key(user_id))
+    transaction.on_commit(lambda: cache.delete(_version_key(user_id)))
+
+
+def cached_profile(user_id, build):
+    """
+    Сериализованный профиль пользователя из кэша; при промахе строится вызовом build()
+    и сохраняется на PROFILE_CACHE_TIMEOUT секунд (0 отключает кэширование).
+    Версия и документы хранятся в PROFILE_CACHE_ALIAS, который должен быть общим для всех
+    процессов (Redis или файловый кэш, см. CACHES): с LocMemCache сброс версии виден только
+    процессу, изменившему профиль, а остальные отдают старый документ до PROFILE_CACHE_TIMEOUT.
+    """
+    timeout = _timeout()
+    if not timeout:
+        return build()
+    cache = _cache()
+    key = f'profile:document:{user_id}:{profile_version(user_id)}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=timeout)
+    return data
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from shop.db import retry_on_locked
 from .models import Profile, Address, UserAddress
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -14,26 +17,38 @@ class UserAddressSerializer(serializers.ModelSerializer):
         model = UserAddress
         fields = ['id', 'address', 'is_default', 'name']
         
+    @retry_on_locked
     def create(self, validated_data):
         address_data = validated_data.pop('address')
-        address = Address.objects.create(**address_data)
-        return UserAddress.objects.create(address=address, **validated_data)
+        try:
+            with transaction.atomic():
+                address = Address.objects.create(**address_data)
+                return UserAddress.objects.create(address=address, **validated_data)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
     
+    @retry_on_locked
     def update(self, instance, validated_data):
         address_data = validated_data.pop('address', None)
         
-        # Обновляем поля UserAddress
-        instance.is_default = validated_data.get('is_default', instance.is_default)
-        instance.name = validated_data.get('name', instance.name)
+        # Обновляем только изменившиеся поля UserAddress
+        changed = [
+            field for field in ('is_default', 'name')
+            if field in validated_data and validated_data[field] != getattr(instance, field)
+        ]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
         
-        # Обновляем поля Address
-        if address_data:
-            address = instance.address
-            for attr, value in address_data.items():
-                setattr(address, attr, value)
-            address.save()
+        with transaction.atomic():
+            # Обновляем поля Address
+            if address_data:
+                address = instance.address
+                for attr, value in address_data.items():
+                    setattr(address, attr, value)
+                address.save(update_fields=list(address_data))
             
-        instance.save()
+            if changed:
+                instance.save(update_fields=changed)
         return instance
 
 class UserSerializer(serializers.ModelSerializer):
@@ -42,6 +57,12 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email']
         read_only_fields = ['id']
 
+class ProfileSummarySerializer(serializers.ModelSerializer):
+    """Профиль без адресов: для ответа на вход, который не должен выполнять лишних запросов"""
+    class Meta:
+        model = Profile
+        fields = ['id', 'first_name', 'last_name', 'phone_number']
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
     password2 = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
@@ -77,11 +98,15 @@ class ProfileSerializer(serializers.ModelSerializer):
     def get_addresses(self, obj):
         """Получает список адресов пользователя, безопасно обрабатывая случай отсутствия адресов."""
         try:
-            user_addresses = UserAddress.objects.filter(user=obj.user)
+            # Адреса, загруженные profile_queryset(), берутся без запроса
+            user_addresses = getattr(obj.user, 'prefetched_addresses', None)
+            if user_addresses is None:
+                user_addresses = UserAddress.objects.filter(user=obj.user).select_related('address')
             return UserAddressSerializer(user_addresses, many=True).data
         except Exception:
             return []
     
+    @retry_on_locked
     def update(self, instance, validated_data):
         address_data = validated_data.pop('address', None)
         
@@ -92,28 +117,37 @@ class ProfileSerializer(serializers.ModelSerializer):
         
         # Обновляем или создаем адрес (для обратной совместимости)
         if address_data:
-            if instance.address:
-                for attr, value in address_data.items():
-                    setattr(instance.address, attr, value)
-                instance.address.save()
-            else:
-                address = Address.objects.create(**address_data)
-                instance.address = address
-                
-                # Также создаем запись в UserAddress, если такого адреса еще нет
-                user_addresses = UserAddress.objects.filter(user=instance.user)
-                if not user_addresses.filter(address__district=address.district, 
-                                          address__street=address.street, 
-                                          address__house_number=address.house_number).exists():
-                    # Если у пользователя еще нет адресов, этот будет по умолчанию
-                    is_default = not user_addresses.exists()
+            with transaction.atomic():
+                self.update_legacy_address(instance, address_data)
+                instance.save()
+        else:
+            # Сохраняются только изменившиеся поля профиля
+            instance.save()
+        return instance
+    
+
+    def update_legacy_address(self, instance, address_data):
+        if instance.address:
+            for attr, value in address_data.items():
+                setattr(instance.address, attr, value)
+            instance.address.save(update_fields=list(address_data))
+            return
+        
+        address = Address.objects.create(**address_data)
+        instance.address = address
+        
+        # Также создаем запись в UserAddress, если такого адреса еще нет и лимит не исчерпан;
+        # если у пользователя нет адреса по умолчанию, этот станет им при сохранении
+        user_addresses = UserAddress.objects.filter(user=instance.user)
+        if not user_addresses.filter(address__district=address.district, 
+                                  address__street=address.street, 
+                                  address__house_number=address.house_number).exists():
+            try:
+                with transaction.atomic():
                     UserAddress.objects.create(
                         user=instance.user,
                         address=address,
-                        is_default=is_default,
                         name="Основной адрес"
                     )
-        
-        instance.save()
-        return instance
-    
\ No newline at end of file
+            except DjangoValidationError:
+                pass
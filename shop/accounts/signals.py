@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import token_user_cache
+from .models import Address, Profile, UserAddress
+from .profile_cache import invalidate_profile
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache_on_delete(sender, instance, **kwargs):
+    token_user_cache.invalidate([instance.key])
+    # После коммита еще раз: параллельный запрос мог успеть закэшировать токен до удаления
+    transaction.on_commit(lambda: token_user_cache.invalidate([instance.key]))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_token_cache_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # Новому пользователю токен еще не выдан, а устаревший last_login в кэше ни на что не влияет
+    if created or update_fields == frozenset(['last_login']):
+        return
+    # В кэше лежит копия пользователя: деактивация и другие изменения должны быть видны сразу
+    keys = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+    if keys:
+        token_user_cache.invalidate(keys)
+        transaction.on_commit(lambda: token_user_cache.invalidate(keys))
+
+
+@receiver(post_delete, sender=UserAddress)
+def decrease_address_count(sender, instance, **kwargs):
+    Profile.objects.filter(user_id=instance.user_id, address_count__gt=0).update(address_count=F('address_count') - 1)
+
+
+@receiver(post_save, sender=User)
+def invalidate_profile_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # Имя пользователя и email входят в документ профиля, last_login — нет
+    if not created and update_fields != frozenset(['last_login']):
+        invalidate_profile(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_profile_on_save(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
+
+
+@receiver(post_save, sender=UserAddress)
+@receiver(post_delete, sender=UserAddress)
+def invalidate_profile_on_address_change(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
+
+
+@receiver(post_save, sender=Address)
+def invalidate_profiles_on_address_save(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    # Адрес попадает в профиль через адреса пользователя и устаревшее поле Profile.address
+    user_ids = UserAddress.objects.filter(address=instance).order_by().values_list('user_id', flat=True).union(
+        Profile.objects.filter(address=instance).values_list('user_id', flat=True)
+    )
+    for user_id in user_ids:
+        invalidate_profile(user_id)
@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+import json
+import time
+from functools import lru_cache
+from urllib.parse import parse_qsl
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from rest_framework.authtoken.models import Token
+from shop.db import retry_on_locked
+
+# Допустимое опережение auth_date относительно часов сервера, в секундах
+CLOCK_SKEW = 60
+
+
+class InitDataError(Exception):
+    """initData не прошли проверку подписи или срока действия"""
+
+
+@lru_cache(maxsize=4)
+def _secret_key(bot_token):
+    return hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+
+
+def secret_key():
+    """
+    Ключ проверки initData, производный от токена бота. Вычисляется один раз
+    на процесс (для каждого токена), а не при каждом входе.
+    """
+    bot_token = getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
+    if not bot_token:
+        raise ImproperlyConfigured('Для входа через Telegram нужен TELEGRAM_BOT_TOKEN')
+    return _secret_key(bot_token)
+
+
+def sign_init_data(fields, key=None):
+    """Возвращает hash для полей initData (используется в тестах и бенчмарке)"""
+    data_check_string = '\n'.join(f'{name}={value}' for name, value in sorted(fields.items()))
+    return hmac.new(key or secret_key(), data_check_string.encode(), hashlib.sha256).hexdigest()
+
+
+def validate_init_data(init_data, max_age=None, now=None):
+    """
+    Проверяет подпись initData Telegram Mini App и возвращает разобранные поля,
+    где user — словарь с данными пользователя. Данные старше max_age секунд
+    (TELEGRAM_AUTH_MAX_AGE) отклоняются, чтобы перехваченную строку нельзя было
+    использовать для входа позже.
+    """
+    fields = dict(parse_qsl(init_data or '', keep_blank_values=True))
+    received_hash = fields.pop('hash', '')
+    if not received_hash:
+        raise InitDataError('В initData нет подписи')
+    if not hmac.compare_digest(sign_init_data(fields), received_hash):
+        raise InitDataError('Неверная подпись initData')
+
+    if max_age is None:
+        max_age = getattr(settings, 'TELEGRAM_AUTH_MAX_AGE', 3600)
+    now = time.time() if now is None else now
+    try:
+        auth_date = int(fields['auth_date'])
+    except (KeyError, ValueError):
+        raise InitDataError('В initData нет auth_date')
+    if auth_date > now + CLOCK_SKEW or now - auth_date > max_age:
+        raise InitDataError('Срок действия initData истек')
+
+    try:
+        fields['user'] = json.loads(fields['user'])
+        int(fields['user']['id'])
+    except (KeyError, TypeError, ValueError):
+        raise InitDataError('В initData нет данных пользователя')
+    return fields
+
+
+@retry_on_locked
+def get_or_create_telegram_user(telegram_user):
+    """
+    Возвращает (пользователь, токен, создан ли пользователь).
+    Существующий пользователь загружается вместе с профилем и токеном одним запросом,
+    новые пользователь, профиль и токен создаются одной транзакцией. Новому пользователю
+    ставится непригодный пароль: вход возможен только через Telegram, поэтому
+    хешировать случайный пароль PBKDF2 незачем.
+    """
+    telegram_id = int(telegram_user['id'])
+    username = f'tg_{telegram_id}'
+    users = User.objects.select_related('profile', 'auth_token')
+    user = users.filter(username=username).first()
+    if user is not None:
+        try:
+            return user, user.auth_token, False
+        except Token.DoesNotExist:
+            pass
+
+    created = False
+    with transaction.atomic():
+        if user is None:
+            try:
+                # Точка сохранения: при одновременном первом входе второй запрос прочитает созданного
+                with transaction.atomic():
+                    user = User.objects.create(
+                        username=username, email=f'{telegram_id}@telegram.user', password=make_password(None)
+                    )
+                created = True
+            except IntegrityError:
+                user = users.get(username=username)
+        if created:
+            # Профиль создан сигналом; имена из Telegram записываются одним UPDATE
+            profile = user.profile
+            profile.first_name = (telegram_user.get('first_name') or '')[:100]
+            profile.last_name = (telegram_user.get('last_name') or '')[:100]
+            profile.save(update_fields=['first_name', 'last_name'])
+            token = Token.objects.create(user=user)
+        else:
+            token, _ = Token.objects.get_or_create(user=user)
+    return user, token, created
@@ -1,3 +1,358 @@
-from django.test import TestCase
+import json
+import time
+from urllib.parse import urlencode
+from django.contrib.auth.models import User, update_last_login
+from unittest import mock
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from .authentication import CachedTokenAuthentication, TokenUserCache, token_user_cache
+from .models import MAX_USER_ADDRESSES, Address, Profile, UserAddress, profile_queryset
+from .profile_cache import invalidate_profile
+from .telegram import InitDataError, sign_init_data, validate_init_data
 
 # Create your tests here.
+
+BOT_TOKEN = '123456:test-token'
+
+
+def make_init_data(telegram_id=42, auth_date=None, **user):
+    fields = {
+        'auth_date': str(int(time.time() if auth_date is None else auth_date)),
+        'query_id': 'AAHdF6IQAAAAAN0XohDhrOrc',
+        'user': json.dumps({'id': telegram_id, 'first_name': 'Иван', 'last_name': 'Петров', **user}, ensure_ascii=False),
+    }
+    return urlencode({**fields, 'hash': sign_init_data(fields)})
+
+
+@override_settings(TELEGRAM_BOT_TOKEN=BOT_TOKEN, TELEGRAM_AUTH_MAX_AGE=3600)
+class InitDataValidationTest(TestCase):
+    """Тесты проверки подписи initData"""
+
+    def test_valid_init_data(self):
+        fields = validate_init_data(make_init_data())
+
+        self.assertEqual(fields['user']['id'], 42)
+
+    def test_tampered_init_data_is_rejected(self):
+        init_data = make_init_data(telegram_id=42).replace('42', '43')
+
+        with self.assertRaisesMessage(InitDataError, 'подпись'):
+            validate_init_data(init_data)
+
+    def test_other_bot_signature_is_rejected(self):
+        init_data = make_init_data()
+
+        with self.settings(TELEGRAM_BOT_TOKEN='654321:other-token'), self.assertRaises(InitDataError):
+            validate_init_data(init_data)
+
+    def test_replay_window(self):
+        now = time.time()
+
+        with self.assertRaisesMessage(InitDataError, 'Срок'):
+            validate_init_data(make_init_data(auth_date=now - 3601), now=now)
+        with self.assertRaisesMessage(InitDataError, 'Срок'):
+            validate_init_data(make_init_data(auth_date=now + 600), now=now)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN=BOT_TOKEN)
+class TelegramAuthTest(TestCase):
+    """Тесты входа через Telegram Mini App"""
+
+    def login(self, init_data):
+        return self.client.post(reverse('telegram-auth'), {'init_data': init_data}, content_type='application/json')
+
+    def test_first_login_creates_user_profile_and_token(self):
+        # Поиск пользователя, INSERT пользователя и профиля, UPDATE профиля именами
+        # из Telegram, INSERT токена; остальное — точки сохранения
+        with self.assertNumQueries(9):
+            response = self.login(make_init_data())
+
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username='tg_42')
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(user.profile.first_name, 'Иван')
+        self.assertEqual(response.json()['token'], user.auth_token.key)
+        self.assertEqual(response.json()['profile']['last_name'], 'Петров')
+
+    def test_repeat_login_uses_one_query(self):
+        token = self.login(make_init_data()).json()['token']
+
+        with self.assertNumQueries(1):
+            response = self.login(make_init_data(first_name='Другое имя'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], token)
+
+    def test_invalid_init_data_is_forbidden(self):
+        response = self.login(make_init_data() + '&chat_type=private')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(User.objects.exists())
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Тесты аутентификации по токену с кэшем"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self, key=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+        return self.authentication.authenticate(request)
+
+    def test_repeated_requests_skip_database(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_local_cache_returns_separate_copies(self):
+        self.authenticate()
+
+        first, _ = self.authenticate()
+        first.first_name = 'Изменено'
+        second, _ = self.authenticate()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, self.user.first_name)
+
+    def test_shared_cache_fills_local_cache(self):
+        self.authenticate()
+        token_user_cache.local.clear()
+
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+
+        self.assertEqual(user, self.user)
+
+    def test_deleted_token_is_rejected(self):
+        self.authenticate()
+
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deactivation_reaches_other_workers(self):
+        # Другой воркер: свой LRU в памяти и свое подключение к общему кэшу
+        worker_cache = TokenUserCache()
+        worker_connection = caches.create_connection('default')
+        with mock.patch.object(TokenUserCache, 'cache', worker_connection), \
+                mock.patch('accounts.authentication.token_user_cache', worker_cache):
+            self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        # Запись в LRU воркера истекла по TOKEN_AUTH_LOCAL_TTL, общий кэш уже сброшен
+        worker_cache.local.clear()
+        with mock.patch.object(TokenUserCache, 'cache', worker_connection), \
+                mock.patch('accounts.authentication.token_user_cache', worker_cache):
+            self.assertIsNone(worker_cache.get(self.token.key))
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_invalid_token_is_not_cached(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('0' * 40)
+        self.assertIsNone(token_user_cache.get('0' * 40))
+
+
+class AccountWriteQueriesTest(TestCase):
+    """
+    Число запросов на запись в профиль и адреса. В TestCase транзакции запросов
+    становятся точками сохранения, поэтому в счет входят SAVEPOINT и RELEASE.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.api = APIClient()
+
+    def request(self, method, url, data=None):
+        # Каждый запрос получает свежий объект пользователя, как при аутентификации по токену
+        self.api.force_authenticate(User.objects.get(pk=self.user.pk))
+        return getattr(self.api, method)(url, data, format='json')
+
+    def create_address(self, street, **kwargs):
+        address = Address.objects.create(district='Центральный', street=street, house_number='1')
+        return UserAddress.objects.create(user=self.user, address=address, **kwargs)
+
+    def address_data(self, street='Ленина'):
+        return {'address': {'district': 'Центральный', 'street': street, 'house_number': '1'}, 'name': 'Дом'}
+
+    def test_login_does_not_touch_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(1):
+            update_last_login(None, user)
+
+    def test_unchanged_profile_is_not_written(self):
+        profile = Profile.objects.get(user=self.user)
+
+        with self.assertNumQueries(0):
+            profile.save()
+
+        profile.phone_number = '+79990000000'
+        with self.assertNumQueries(1):
+            profile.save()
+        self.assertEqual(Profile.objects.get(pk=profile.pk).phone_number, '+79990000000')
+
+    def test_update_me(self):
+        url = reverse('profile-update-me')
+
+        # Профиль, UPDATE одного поля и адреса в ответе
+        with self.assertNumQueries(4):
+            self.request('patch', url, {'first_name': 'Иван'})
+        with self.assertNumQueries(3):
+            self.request('patch', url, {'first_name': 'Иван'})
+
+    def test_update_address(self):
+        with self.assertNumQueries(11):
+            response = self.request('put', reverse('profile-update-address'), self.address_data()['address'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(UserAddress.objects.get(user=self.user).is_default)
+
+    def test_create_address(self):
+        self.create_address('Первая')
+
+        # Счетчик адресов, проверка адреса по умолчанию, INSERT адреса и строки пользователя
+        with self.assertNumQueries(7):
+            response = self.request('post', reverse('user-address-list'), self.address_data())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.json()['is_default'])
+        self.assertEqual(Profile.objects.get(user=self.user).address_count, 2)
+
+    def test_address_limit(self):
+        for i in range(MAX_USER_ADDRESSES):
+            self.create_address(f'Улица {i}')
+
+        with self.assertNumQueries(6):
+            response = self.request('post', reverse('user-address-list'), self.address_data())
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserAddress.objects.filter(user=self.user).count(), MAX_USER_ADDRESSES)
+        self.assertEqual(Address.objects.count(), MAX_USER_ADDRESSES)
+
+    def test_update_user_address(self):
+        user_address = self.create_address('Первая')
+
+        with self.assertNumQueries(5):
+            response = self.request('patch', reverse('user-address-detail', args=[user_address.pk]), {'name': 'Работа'})
+
+        self.assertEqual(response.json()['name'], 'Работа')
+
+    def test_set_default(self):
+        first = self.create_address('Первая')
+        second = self.create_address('Вторая')
+
+        # Выборка адреса и два UPDATE в одной транзакции
+        with self.assertNumQueries(6):
+            self.request('post', reverse('user-address-set-default', args=[second.pk]))
+
+        self.assertEqual(list(UserAddress.objects.filter(is_default=True)), [second])
+        first.refresh_from_db()
+        self.assertFalse(first.is_default)
+
+    def test_destroy_default_address(self):
+        first = self.create_address('Первая')
+        second = self.create_address('Вторая')
+
+        # Выборка адреса, DELETE, уменьшение счетчика и назначение нового адреса по умолчанию
+        with self.assertNumQueries(7):
+            response = self.request('delete', reverse('user-address-detail', args=[first.pk]))
+
+        self.assertEqual(response.status_code, 204)
+        second.refresh_from_db()
+        self.assertTrue(second.is_default)
+        self.assertEqual(Profile.objects.get(user=self.user).address_count, 1)
+
+
+class ProfileDocumentTest(TestCase):
+    """Тесты документа профиля /api/accounts/profiles/me/"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', email='buyer@example.com')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        for street in ('Первая', 'Вторая', 'Третья'):
+            address = Address.objects.create(district='Центральный', street=street, house_number='1')
+            UserAddress.objects.create(user=self.user, address=address, name=street)
+        self.url = reverse('profile-me')
+
+    def me(self):
+        return self.api.get(self.url).json()
+
+    def test_document_is_loaded_with_two_queries_and_cached(self):
+        # Профиль с пользователем и адресом, затем адреса пользователя
+        with self.assertNumQueries(2):
+            data = self.me()
+
+        self.assertEqual(data['user']['email'], 'buyer@example.com')
+        self.assertEqual([item['address']['street'] for item in data['addresses']], ['Первая', 'Вторая', 'Третья'])
+        self.assertTrue(data['addresses'][0]['is_default'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(), data)
+
+    @override_settings(PROFILE_CACHE_TIMEOUT=0)
+    def test_default_address_uses_prefetched_addresses(self):
+        profile = profile_queryset().get(user=self.user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(profile.default_address.street, 'Первая')
+
+    def test_profile_write_invalidates_document(self):
+        self.me()
+
+        self.api.patch(reverse('profile-update-me'), {'first_name': 'Иван'}, format='json')
+
+        self.assertEqual(self.me()['first_name'], 'Иван')
+
+    def test_invalidation_reaches_other_workers(self):
+        # Другой воркер читает профиль через свое подключение к общему кэшу
+        worker_connection = caches.create_connection('default')
+        with mock.patch('accounts.profile_cache._cache', return_value=worker_connection):
+            self.me()
+
+        Profile.objects.filter(user=self.user).update(first_name='Иван')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_profile(self.user.pk)
+
+        with mock.patch('accounts.profile_cache._cache', return_value=worker_connection):
+            self.assertEqual(self.me()['first_name'], 'Иван')
+
+    def test_address_writes_invalidate_document(self):
+        self.me()
+        second = UserAddress.objects.get(name='Вторая')
+
+        self.api.post(reverse('user-address-set-default', args=[second.pk]))
+        self.assertEqual([item['name'] for item in self.me()['addresses'] if item['is_default']], ['Вторая'])
+
+        self.api.patch(
+            reverse('user-address-detail', args=[second.pk]), {'address': {'street': 'Новая'}}, format='json'
+        )
+        self.assertEqual(self.me()['addresses'][0]['address']['street'], 'Новая')
+
+        self.api.delete(reverse('user-address-detail', args=[second.pk]))
+        self.assertEqual(len(self.me()['addresses']), 2)
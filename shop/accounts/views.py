@@ -3,16 +3,17 @@ from rest_framework import viewsets, permissions, status, generics
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import Profile, Address, UserAddress
-from .serializers import ProfileSerializer, AddressSerializer, UserSerializer, RegisterSerializer, UserAddressSerializer
-from rest_framework.authtoken.models import Token
-import hashlib
-import hmac
-import time
-import json
-from django.conf import settings
-import secrets
-import string
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Subquery
+from shop.db import retry_on_locked
+from .models import Profile, Address, UserAddress, profile_queryset
+from .profile_cache import cached_profile
+from .serializers import (
+    ProfileSerializer, ProfileSummarySerializer, AddressSerializer, UserSerializer, RegisterSerializer,
+    UserAddressSerializer,
+)
+from .telegram import InitDataError, get_or_create_telegram_user, validate_init_data
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -34,7 +35,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         #Пользователь видит только свой профиль
-        return Profile.objects.filter(user=self.request.user)
+        return profile_queryset().filter(user=self.request.user)
     
     def retrieve(self, request, *args, **kwargs):
         #Получение профиля текущего пользователя
@@ -44,9 +45,11 @@ class ProfileViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def me(self, request):
-        profile = request.user.profile
-        serializer = self.get_serializer(profile)
-        return Response(serializer.data)
+        # Профиль открывается на каждом экране, поэтому документ кэшируется до изменения профиля или адресов
+        data = cached_profile(
+            request.user.pk, lambda: self.get_serializer(get_object_or_404(self.get_queryset())).data
+        )
+        return Response(data)
     
     @action(detail=False, methods=['put', 'patch'])
     def update_me(self, request):
@@ -58,6 +61,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['put', 'patch'])
+    @retry_on_locked
     def update_address(self, request):
         #эндпоинт для обновления адреса (для обратной совместимости)
         profile = request.user.profile
@@ -65,18 +69,22 @@ class ProfileViewSet(viewsets.ModelViewSet):
         if not profile.address:
             address_serializer = AddressSerializer(data=request.data)
             if address_serializer.is_valid():
-                address = address_serializer.save()
-                profile.address = address
-                profile.save()
-                
-                # Также создаем запись в UserAddress, если адресов меньше 5
-                if UserAddress.objects.filter(user=request.user).count() < 5:
-                    UserAddress.objects.create(
-                        user=request.user,
-                        address=address,
-                        is_default=True,
-                        name="Основной адрес"
-                    )
+                with transaction.atomic():
+                    address = address_serializer.save()
+                    profile.address = address
+                    profile.save()
+                    
+                    # Также создаем запись в UserAddress, если лимит адресов не исчерпан
+                    try:
+                        with transaction.atomic():
+                            UserAddress.objects.create(
+                                user=request.user,
+                                address=address,
+                                is_default=True,
+                                name="Основной адрес"
+                            )
+                    except ValidationError:
+                        pass
                 
                 return Response(address_serializer.data)
             return Response(address_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -93,7 +101,7 @@ class UserAddressViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Пользователь видит только свои адреса
-        return UserAddress.objects.filter(user=self.request.user)
+        return UserAddress.objects.filter(user=self.request.user).select_related('address')
     
     def perform_create(self, serializer):
         # При создании адреса устанавливаем текущего пользователя
@@ -103,125 +111,38 @@ class UserAddressViewSet(viewsets.ModelViewSet):
     def set_default(self, request, pk=None):
         # Устанавливаем адрес по умолчанию
         user_address = self.get_object()
-        user_address.is_default = True
-        user_address.save()
+        if not user_address.is_default:
+            user_address.make_default()
         return Response({"status": "Адрес установлен как адрес по умолчанию"})
     
-    def destroy(self, request, *args, **kwargs):
-        # Проверяем, что это не единственный адрес по умолчанию
-        user_address = self.get_object()
-        if user_address.is_default and UserAddress.objects.filter(user=request.user).count() > 1:
-            # Если удаляем адрес по умолчанию, назначаем другой адрес по умолчанию
-            next_address = UserAddress.objects.filter(user=request.user).exclude(pk=user_address.pk).first()
-            if next_address:
-                next_address.is_default = True
-                next_address.save()
-        
-        return super().destroy(request, *args, **kwargs)
+    @retry_on_locked
+    def perform_destroy(self, instance):
+        # Если удаляем адрес по умолчанию, назначаем по умолчанию самый ранний из оставшихся
+        with transaction.atomic():
+            instance.delete()
+            if instance.is_default:
+                first_remaining = UserAddress.objects.filter(user_id=instance.user_id).order_by('id').values('pk')[:1]
+                UserAddress.objects.filter(pk=Subquery(first_remaining)).update(is_default=True)
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def telegram_auth(request):
     """
     Аутентификация пользователя через Telegram Mini App.
-    Проверяет данные, полученные от Telegram, и создает или обновляет пользователя.
+    Данные пользователя берутся только из initData с проверенной подписью;
+    пользователь, профиль и токен создаются или загружаются одной транзакцией.
     """
     try:
-        data = request.data
-        
-        # Получение данных пользователя из запроса
-        telegram_id = data.get('telegram_id')
-        telegram_username = data.get('telegram_username', '')
-        telegram_first_name = data.get('telegram_first_name', '')
-        telegram_last_name = data.get('telegram_last_name', '')
-        telegram_photo_url = data.get('telegram_photo_url', '')
-        init_data = data.get('init_data', '')
-        
-        # Проверка наличия обязательных полей
-        if not telegram_id:
-            return Response({"error": "Отсутствует telegram_id"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Валидация данных от Telegram (в реальном проекте)
-        # Для этого нужен BOT_TOKEN в settings.py
-        # is_valid = validate_telegram_data(init_data)
-        # if not is_valid:
-        #     return Response({"error": "Недействительные данные Telegram"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Поиск или создание пользователя
-        username = f"tg_{telegram_id}"
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            # Создаем нового пользователя с безопасным случайным паролем
-            # Генерируем безопасный случайный пароль
-            alphabet = string.ascii_letters + string.digits
-            password = ''.join(secrets.choice(alphabet) for i in range(20))
-            
-            user = User.objects.create_user(
-                username=username,
-                password=password,
-                email=f"{telegram_id}@telegram.user"
-            )
-            
-            # Обновляем профиль пользователя
-            profile = user.profile
-            profile.first_name = telegram_first_name
-            profile.last_name = telegram_last_name
-            profile.save()
-        
-        # Получение или создание токена
-        token, created = Token.objects.get_or_create(user=user)
-        
-        # Получаем профиль пользователя с осторожностью, чтобы избежать ошибок с новыми полями
-        profile_data = ProfileSerializer(user.profile).data
-        
-        return Response({
-            "token": token.key,
-            "user": UserSerializer(user).data,
-            "profile": profile_data
-        }, status=status.HTTP_200_OK)
-    
-    except Exception as e:
-        import traceback
-        print(f"Telegram auth error: {str(e)}")
-        print(traceback.format_exc())
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        init_data = validate_init_data(request.data.get('init_data', ''))
+    except InitDataError as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_403_FORBIDDEN)
 
-def validate_telegram_data(init_data):
-    """
-    Валидация данных, полученных от Telegram.
-    В реальном проекте нужно реализовать проверку подписи.
-    """
-    # Пример реализации проверки подписи
-    # Для работы нужен BOT_TOKEN в settings.py
-    try:
-        # Разбор init_data
-        data_check_string = init_data
-        
-        # В реальном проекте нужно разобрать строку init_data и извлечь хеш и другие параметры
-        # Пример:
-        # data_check_arr = data_check_string.split('&')
-        # hash_value = None
-        # data_arr = []
-        
-        # for item in data_check_arr:
-        #     if item.startswith('hash='):
-        #         hash_value = item.split('=')[1]
-        #     else:
-        #         data_arr.append(item)
-        
-        # data_arr.sort()
-        # data_string = '\n'.join(data_arr)
-        
-        # secret_key = hmac.new(b'WebAppData', settings.BOT_TOKEN.encode(), hashlib.sha256).digest()
-        # calculated_hash = hmac.new(secret_key, data_string.encode(), hashlib.sha256).hexdigest()
-        
-        # return calculated_hash == hash_value
-        
-        # Для тестирования всегда возвращаем True
-        return True
-    except Exception:
-        return False
+    user, token, created = get_or_create_telegram_user(init_data['user'])
+    return Response({
+        "token": token.key,
+        "user": UserSerializer(user).data,
+        "profile": ProfileSummarySerializer(user.profile).data,
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 def telegram_app_view(request):
     """
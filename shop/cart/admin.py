@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import CartItem
 
 # Register your models here.
+
+@admin.register(CartItem)
+class CartItemAdmin(admin.ModelAdmin):
+    list_display = ['user', 'product', 'quantity', 'updated_at']
+    list_select_related = ['user', 'product']
+    raw_id_fields = ['user', 'product']
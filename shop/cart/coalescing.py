@@ -0,0 +1,132 @@
+import atexit
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз подряд повторять запись изменений пользователя, прежде чем отказаться от них
+MAX_FLUSH_ATTEMPTS = 5
+
+
+class DeltaCoalescer:
+    """
+    Объединяет частые изменения количества (быстрые нажатия «+» в Mini App) в одну запись.
+    Изменения пользователя копятся в памяти процесса в течение окна window секунд
+    после первого нажатия и затем применяются одним вызовом apply(user_id, deltas).
+    Сроки записи всех пользователей хранятся в куче и обрабатываются одним фоновым потоком.
+    Если apply завершился ошибкой, изменения возвращаются в очередь и запись повторяется
+    через окно, до MAX_FLUSH_ATTEMPTS раз.
+    Прибавления коммутативны, поэтому разные процессы могут копить изменения одного
+    пользователя независимо. Любая другая операция с корзиной сначала вызывает flush().
+    """
+
+    def __init__(self, apply, window=None):
+        self.apply = apply
+        self._window = window
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = defaultdict(Counter)      # id пользователя -> {id товара: изменение}
+        self._deadlines = {}                      # id пользователя -> срок записи
+        self._heap = []                           # (срок записи, id пользователя)
+        self._failures = Counter()                # id пользователя -> неудачных записей подряд
+        self._thread = None
+        # Дописываем накопленное при штатной остановке процесса
+        atexit.register(self.flush_all)
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, 'CART_COALESCE_WINDOW', 0.3)
+
+    def add(self, user_id, deltas):
+        """Добавляет изменения; без окна объединения применяет их сразу"""
+        if self.window <= 0:
+            self.apply(user_id, dict(deltas))
+            return
+        with self._lock:
+            self._pending[user_id].update(deltas)
+            if user_id not in self._deadlines:
+                self._schedule(user_id)
+
+    def pending(self, user_id):
+        """Еще не записанные изменения пользователя"""
+        with self._lock:
+            return dict(self._pending.get(user_id, {}))
+
+    def flush(self, user_id):
+        with self._lock:
+            deltas = self._pending.pop(user_id, None)
+            self._deadlines.pop(user_id, None)
+        if not deltas:
+            return
+        try:
+            self.apply(user_id, dict(deltas))
+        except Exception:
+            self._restore(user_id, deltas)
+            raise
+        with self._lock:
+            self._failures.pop(user_id, None)
+
+    def flush_all(self):
+        with self._lock:
+            user_ids = list(self._pending)
+        for user_id in user_ids:
+            self.flush(user_id)
+
+    def _schedule(self, user_id):
+        # Вызывается под self._lock; старые записи кучи для пользователя пропускаются по сроку
+        deadline = time.monotonic() + self.window
+        self._deadlines[user_id] = deadline
+        heapq.heappush(self._heap, (deadline, user_id))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cart-coalescer', daemon=True)
+            self._thread.start()
+        self._wakeup.notify()
+
+    def _restore(self, user_id, deltas):
+        """Возвращает неудачно записанные изменения в очередь и планирует повтор"""
+        with self._lock:
+            self._failures[user_id] += 1
+            if self._failures[user_id] >= MAX_FLUSH_ATTEMPTS:
+                del self._failures[user_id]
+                logger.error('Изменения корзины пользователя %s не записаны после %s попыток: %s',
+                             user_id, MAX_FLUSH_ATTEMPTS, dict(deltas))
+                return
+            # Нажатия, сделанные во время записи, складываются с возвращенными
+            self._pending[user_id].update(deltas)
+            if user_id not in self._deadlines:
+                self._schedule(user_id)
+
+    def _due_user(self):
+        """Ждет ближайший срок записи и возвращает id пользователя"""
+        with self._lock:
+            while True:
+                if not self._heap:
+                    self._wakeup.wait()
+                    continue
+                deadline, user_id = self._heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                # Срок из кучи устарел, если изменения уже записаны через flush()
+                if self._deadlines.get(user_id) == deadline:
+                    return user_id
+
+    def _run(self):
+        while True:
+            user_id = self._due_user()
+            try:
+                self.flush(user_id)
+            except Exception:
+                logger.exception('Не удалось записать изменения корзины пользователя %s', user_id)
+            finally:
+                # Поток записи держит собственное соединение с базой
+                connection.close()
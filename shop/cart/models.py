@@ -1,3 +1,24 @@
+from django.contrib.auth.models import User
 from django.db import models
+from catalog.models import Product
 
 # Create your models here.
+
+class CartItem(models.Model):
+    """Строка корзины: товар и его количество у пользователя"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items', verbose_name='Пользователь')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='Товар')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Строка корзины'
+        verbose_name_plural = 'Строки корзины'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_item_user_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} × {self.quantity} ({self.user_id})'
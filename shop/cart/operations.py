@@ -0,0 +1,86 @@
+from functools import partial
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from catalog.memory_index import searchable_products
+from shop.db import retry_on_locked
+from .models import CartItem
+from .pricing import bump_cart_version
+
+# Наибольшее количество одного товара в корзине
+MAX_LINE_QUANTITY = 999
+
+
+def orderable_product_ids(product_ids):
+    """Оставляет id товаров, которые показываются в каталоге и могут быть добавлены в корзину"""
+    return set(searchable_products().filter(pk__in=product_ids).values_list('pk', flat=True))
+
+
+def cart_quantities(user_id):
+    """Возвращает {id товара: количество} для корзины пользователя"""
+    return dict(CartItem.objects.filter(user_id=user_id).values_list('product_id', 'quantity'))
+
+
+@retry_on_locked
+def add_quantities(user_id, deltas):
+    """
+    Увеличивает (или уменьшает при отрицательном значении) количество товаров в корзине.
+    deltas — {id товара: изменение}. Все изменения применяются одной транзакцией:
+    недостающие строки создаются с нулевым количеством, затем один UPDATE
+    прибавляет изменения через F(), без чтения текущих значений. Строки,
+    количество которых стало нулевым, удаляются.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        # ignore_conflicts: строку мог создать параллельный запрос, тогда к ней просто прибавим
+        CartItem.objects.bulk_create(
+            [CartItem(user_id=user_id, product_id=product_id, quantity=0) for product_id in deltas],
+            ignore_conflicts=True,
+        )
+        increment = Case(
+            *[When(product_id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+            output_field=IntegerField(),
+        )
+        CartItem.objects.filter(user_id=user_id, product_id__in=deltas).update(
+            quantity=Least(Greatest(F('quantity') + increment, Value(0)), Value(MAX_LINE_QUANTITY)),
+            updated_at=timezone.now(),
+        )
+        CartItem.objects.filter(user_id=user_id, product_id__in=deltas, quantity=0).delete()
+        transaction.on_commit(partial(bump_cart_version, user_id))
+
+
+@retry_on_locked
+def set_quantities(user_id, quantities):
+    """
+    Устанавливает количество товаров одним INSERT ... ON CONFLICT DO UPDATE.
+    Нулевое количество удаляет строку.
+    """
+    to_remove = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+    to_set = [
+        CartItem(user_id=user_id, product_id=product_id, quantity=min(quantity, MAX_LINE_QUANTITY))
+        for product_id, quantity in quantities.items() if quantity > 0
+    ]
+    with transaction.atomic():
+        if to_set:
+            CartItem.objects.bulk_create(
+                to_set,
+                update_conflicts=True,
+                unique_fields=['user', 'product'],
+                update_fields=['quantity', 'updated_at'],
+            )
+        if to_remove:
+            CartItem.objects.filter(user_id=user_id, product_id__in=to_remove).delete()
+        transaction.on_commit(partial(bump_cart_version, user_id))
+
+
+def remove_products(user_id, product_ids):
+    CartItem.objects.filter(user_id=user_id, product_id__in=product_ids).delete()
+    transaction.on_commit(partial(bump_cart_version, user_id))
+
+
+def clear_cart(user_id):
+    CartItem.objects.filter(user_id=user_id).delete()
+    transaction.on_commit(partial(bump_cart_version, user_id))
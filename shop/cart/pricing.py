@@ -0,0 +1,87 @@
+import uuid
+from decimal import Decimal
+from django.db.models import BooleanField, Case, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When, Window
+from catalog.response_cache import response_cache
+from .models import CartItem
+
+# Товар можно купить, только если доступны он сам, его раздел и категория
+ORDERABLE = Q(product__available=True, product__section__available=True, product__section__category__available=True)
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _version_key(user_id):
+    return response_cache.key(f'cart_version:{user_id}')
+
+
+def cart_version(user_id):
+    """Версия корзины пользователя: меняется при каждом изменении корзины"""
+    key = _version_key(user_id)
+    version = response_cache.cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() не перезапишет версию, созданную параллельно другим процессом
+        if not response_cache.cache.add(key, version, timeout=None):
+            version = response_cache.cache.get(key, version)
+    return version
+
+
+def bump_cart_version(user_id):
+    response_cache.cache.delete(_version_key(user_id))
+
+
+def priced_lines(user_id):
+    """
+    Строки корзины с текущими ценами одним запросом: JOIN строк с товарами, разделами
+    и категориями, сумма строки и итог по доступным товарам (оконная функция SUM).
+    """
+    line_total = ExpressionWrapper(F('quantity') * F('product__price'), output_field=MONEY)
+    return CartItem.objects.filter(user_id=user_id).values('product_id', 'quantity').annotate(
+        name=F('product__name'),
+        price=F('product__price'),
+        section_id=F('product__section_id'),
+        category_id=F('product__section__category_id'),
+        available=ExpressionWrapper(ORDERABLE, output_field=BooleanField()),
+        total=line_total,
+        subtotal=Window(Sum(Case(When(ORDERABLE, then=line_total), default=Value(0), output_field=MONEY))),
+    )
+
+
+def compute_cart_totals(user_id):
+    """Возвращает (итоги корзины, теги объектов каталога, от которых они зависят)"""
+    items, tags = [], set()
+    subtotal = Decimal('0.00')
+    for line in priced_lines(user_id):
+        subtotal = line['subtotal']
+        items.append({
+            'product': line['product_id'],
+            'name': line['name'],
+            'quantity': line['quantity'],
+            'price': line['price'],
+            'total': line['total'],
+            'available': line['available'],
+        })
+        tags.update((f'product:{line["product_id"]}', f'section:{line["section_id"]}', f'category:{line["category_id"]}'))
+    totals = {
+        'items': items,
+        'subtotal': subtotal,
+        'unavailable': [item['product'] for item in items if not item['available']],
+    }
+    return totals, tags
+
+
+def cart_totals(user_id):
+    """
+    Итоги корзины с кэшированием снимка цен. Ключ записи включает версию корзины,
+    а теги — товары, разделы и категории строк, поэтому запись устаревает
+    при изменении корзины и при изменении цены или доступности любого ее товара.
+    """
+    if not response_cache.enabled:
+        return compute_cart_totals(user_id)[0]
+    key = response_cache.key(f'cart_totals:{user_id}:{cart_version(user_id)}')
+    totals = response_cache.get(key)
+    if totals is None:
+        epoch = response_cache.epoch()
+        totals, tags = compute_cart_totals(user_id)
+        response_cache.set(key, totals, tags, epoch)
+    return totals
@@ -0,0 +1,44 @@
+from rest_framework import serializers
+from .operations import MAX_LINE_QUANTITY
+
+
+class CartLineSerializer(serializers.Serializer):
+    """Товар и количество в запросах к корзине"""
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=-MAX_LINE_QUANTITY, max_value=MAX_LINE_QUANTITY, default=1)
+
+
+class CartRemoveSerializer(serializers.Serializer):
+    """Удаление товаров: {"product": 1} или {"products": [1, 2]}"""
+    product = serializers.IntegerField(min_value=1, required=False)
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        product_ids = list(attrs.get('products', []))
+        if 'product' in attrs:
+            product_ids.append(attrs['product'])
+        if not product_ids:
+            raise serializers.ValidationError('Укажите product или products')
+        return {'products': product_ids}
+
+
+class CartSetLineSerializer(CartLineSerializer):
+    """Строка для установки количества: 0 удаляет товар из корзины"""
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_LINE_QUANTITY)
+
+
+class CartPricedLineSerializer(serializers.Serializer):
+    """Строка корзины с ценой из каталога"""
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    available = serializers.BooleanField()
+
+
+class CartSerializer(serializers.Serializer):
+    """Корзина с итогом; недоступные товары в итог не входят и перечислены в unavailable"""
+    items = CartPricedLineSerializer(many=True)
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    unavailable = serializers.ListField(child=serializers.IntegerField())
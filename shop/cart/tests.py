@@ -1,3 +1,227 @@
-from django.test import TestCase
+from decimal import Decimal
+import threading
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from catalog.models import Category, Section, Product
+from .coalescing import DeltaCoalescer
+from .models import CartItem
+from .operations import add_quantities, set_quantities
+from .pricing import cart_totals
+from .views import cart_coalescer
 
-# Create your tests here.
+
+class CartTestMixin:
+    """Пользователь и товары для тестов корзины"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='password')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Фрукты', slug='fruits')
+        self.section = Section.objects.create(category=category, name='Яблоки', slug='apples')
+        self.apple = self.create_product('Антоновка', 'antonovka')
+        self.pear = self.create_product('Дюшес', 'duchess')
+
+    def create_product(self, name, slug, **kwargs):
+        kwargs.setdefault('price', Decimal('100.00'))
+        return Product.objects.create(
+            section=self.section, name=name, slug=slug, quantity_type='кг', quantity_value=Decimal('1'), **kwargs
+        )
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+
+@override_settings(CART_COALESCE_WINDOW=0)
+class CartAPITest(CartTestMixin, TestCase):
+    """Тесты API корзины"""
+
+    def post(self, name, data):
+        return self.client.post(reverse(f'cart-{name}'), data, content_type='application/json')
+
+    def test_add_increments_quantity(self):
+        self.post('add', {'product': self.apple.pk})
+        response = self.post('add', {'product': self.apple.pk, 'quantity': 2})
+
+        self.assertEqual(response.json()['items'], [{'product': self.apple.pk, 'quantity': 3}])
+        self.assertEqual(self.quantities(), {self.apple.pk: 3})
+
+    def test_batch_add_uses_fixed_number_of_queries(self):
+        products = [self.create_product(f'Товар {i}', f'product-{i}') for i in range(10)]
+        items = [{'product': product.pk, 'quantity': 2} for product in products]
+        self.post('add', {'items': items[:1]})
+
+        with self.assertNumQueries(9):
+            self.post('add', {'items': items})
+
+        expected = {product.pk: 2 for product in products}
+        expected[products[0].pk] = 4
+        self.assertEqual(self.quantities(), expected)
+
+    def test_decrement_to_zero_removes_line(self):
+        self.post('add', {'product': self.apple.pk, 'quantity': 2})
+
+        self.post('add', {'items': [{'product': self.apple.pk, 'quantity': -5}, {'product': self.pear.pk}]})
+
+        self.assertEqual(self.quantities(), {self.pear.pk: 1})
+
+    def test_set_quantities(self):
+        self.post('add', {'product': self.apple.pk})
+
+        response = self.post('set', {'items': [
+            {'product': self.apple.pk, 'quantity': 0},
+            {'product': self.pear.pk, 'quantity': 7},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.pear.pk: 7})
+
+    def test_remove_and_clear(self):
+        self.post('set', {'items': [{'product': self.apple.pk, 'quantity': 1}, {'product': self.pear.pk, 'quantity': 1}]})
+
+        self.post('remove', {'product': self.apple.pk})
+        self.assertEqual(self.quantities(), {self.pear.pk: 1})
+
+        self.post('clear', {})
+        self.assertEqual(self.quantities(), {})
+
+    def test_unavailable_product_is_rejected(self):
+        hidden = self.create_product('Нет в наличии', 'hidden', available=False)
+
+        response = self.post('add', {'product': hidden.pk})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_cart_requires_authentication(self):
+        self.client.logout()
+
+        self.assertIn(self.client.get(reverse('cart-list')).status_code, (401, 403))
+
+
+class CartPricingTest(CartTestMixin, TestCase):
+    """Тесты расчета итогов корзины"""
+
+    def setUp(self):
+        super().setUp()
+        self.pear.price = Decimal('55.50')
+        self.pear.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            set_quantities(self.user.pk, {self.apple.pk: 2, self.pear.pk: 3})
+
+    def test_totals_are_computed_by_one_query(self):
+        with self.settings(CATALOG_API_CACHE_TIMEOUT=0), self.assertNumQueries(1):
+            totals = cart_totals(self.user.pk)
+
+        self.assertEqual(totals['subtotal'], Decimal('366.50'))
+        self.assertEqual([item['total'] for item in totals['items']], [Decimal('200.00'), Decimal('166.50')])
+        self.assertEqual(totals['unavailable'], [])
+
+    def test_unavailable_lines_are_excluded_from_subtotal(self):
+        self.section.available = False
+        self.section.save()
+
+        totals = cart_totals(self.user.pk)
+
+        self.assertEqual(totals['subtotal'], Decimal('0'))
+        self.assertEqual(totals['unavailable'], [self.apple.pk, self.pear.pk])
+
+    def test_cached_totals_follow_cart_and_price_changes(self):
+        cart_totals(self.user.pk)
+        with self.assertNumQueries(0):
+            cart_totals(self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_quantities(self.user.pk, {self.apple.pk: 1})
+        self.assertEqual(cart_totals(self.user.pk)['subtotal'], Decimal('466.50'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.price = Decimal('10.00')
+            self.apple.save()
+        self.assertEqual(cart_totals(self.user.pk)['subtotal'], Decimal('196.50'))
+
+    def test_cart_api_returns_totals(self):
+        response = self.client.get(reverse('cart-list'))
+
+        self.assertEqual(response.json()['subtotal'], '366.50')
+        self.assertEqual(response.json()['items'][1], {
+            'product': self.pear.pk, 'name': 'Дюшес', 'quantity': 3,
+            'price': '55.50', 'total': '166.50', 'available': True,
+        })
+
+
+class CartCoalescingTest(CartTestMixin, TestCase):
+    """Тесты объединения быстрых нажатий"""
+
+    def tearDown(self):
+        cart_coalescer.flush_all()
+
+    @override_settings(CART_COALESCE_WINDOW=60)
+    def test_rapid_taps_are_written_once(self):
+        url = reverse('cart-add')
+        with mock.patch.object(cart_coalescer, 'apply', wraps=cart_coalescer.apply) as apply:
+            for _ in range(5):
+                response = self.client.post(url, {'product': self.apple.pk}, content_type='application/json')
+                self.assertEqual(response.json()['items'], [{'product': self.apple.pk, 'quantity': _ + 1}])
+            self.assertEqual(self.quantities(), {})
+
+            response = self.client.get(reverse('cart-list'))
+
+        self.assertEqual(apply.call_count, 1)
+        self.assertEqual(response.json()['items'][0]['quantity'], 5)
+
+    def test_pending_deltas_are_summed(self):
+        applied = []
+        coalescer = DeltaCoalescer(lambda user_id, deltas: applied.append((user_id, deltas)), window=60)
+
+        coalescer.add(1, {10: 1})
+        coalescer.add(1, {10: 1, 11: 2})
+        coalescer.add(2, {10: -1})
+        coalescer.flush_all()
+
+        self.assertEqual(sorted(applied), [(1, {10: 2, 11: 2}), (2, {10: -1})])
+
+    def test_timer_flushes_after_window(self):
+        applied = []
+        done = threading.Event()
+
+        def apply(user_id, deltas):
+            applied.append((user_id, deltas))
+            if len(applied) == 2:
+                done.set()
+
+        coalescer = DeltaCoalescer(apply, window=0.05)
+        threads = threading.active_count()
+
+        coalescer.add(1, {10: 1})
+        coalescer.add(2, {10: 2})
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(sorted(applied), [(1, {10: 1}), (2, {10: 2})])
+        self.assertEqual(coalescer.pending(1), {})
+        # Сроки всех пользователей обрабатывает один поток
+        self.assertEqual(threading.active_count(), threads + 1)
+
+    def test_failed_write_is_retried(self):
+        applied = []
+        done = threading.Event()
+
+        def apply(user_id, deltas):
+            if not applied:
+                applied.append(None)
+                raise OperationalError('database is locked')
+            applied.append((user_id, deltas))
+            done.set()
+
+        coalescer = DeltaCoalescer(apply, window=0.05)
+
+        with self.assertLogs('cart.coalescing', 'ERROR'):
+            coalescer.add(1, {10: 1})
+            self.assertTrue(done.wait(5))
+
+        self.assertEqual(applied[1:], [(1, {10: 1})])
+        self.assertEqual(coalescer.pending(1), {})
@@ -1,3 +1,97 @@
-from django.shortcuts import render
+from collections import Counter
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .coalescing import DeltaCoalescer
+from .operations import (
+    MAX_LINE_QUANTITY, add_quantities, cart_quantities, clear_cart,
+    orderable_product_ids, remove_products, set_quantities,
+)
+from .pricing import cart_totals
+from .serializers import CartLineSerializer, CartRemoveSerializer, CartSerializer, CartSetLineSerializer
 
 # Create your views here.
+
+cart_coalescer = DeltaCoalescer(add_quantities)
+
+
+def projected_quantities(user_id):
+    """Количество товаров в корзине с учетом еще не записанных нажатий"""
+    quantities = cart_quantities(user_id)
+    for product_id, delta in cart_coalescer.pending(user_id).items():
+        quantity = min(max(quantities.get(product_id, 0) + delta, 0), MAX_LINE_QUANTITY)
+        if quantity:
+            quantities[product_id] = quantity
+        else:
+            quantities.pop(product_id, None)
+    return quantities
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    Корзина текущего пользователя.
+    add прибавляет количество (нажатия объединяются на сервере), set задает количество,
+    remove и clear удаляют строки. Все изменяющие действия принимают одну строку
+    {"product": 1, "quantity": 2} или пакет {"items": [...]}.
+    add возвращает только количества с учетом незаписанных нажатий,
+    остальные действия — корзину с ценами и итогом.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_lines(self, line_serializer_class):
+        if 'items' in self.request.data:
+            serializer = line_serializer_class(data=self.request.data['items'], many=True, allow_empty=False)
+            serializer.is_valid(raise_exception=True)
+            return serializer.validated_data
+        serializer = line_serializer_class(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return [serializer.validated_data]
+
+    def check_products(self, product_ids):
+        unavailable = set(product_ids) - orderable_product_ids(product_ids)
+        if unavailable:
+            raise ValidationError({'product': f'Товары недоступны: {", ".join(map(str, sorted(unavailable)))}'})
+
+    def cart_response(self, quantities):
+        return Response({
+            'items': [{'product': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()],
+        })
+
+    def totals_response(self):
+        return Response(CartSerializer(cart_totals(self.request.user.pk)).data)
+
+    def list(self, request):
+        cart_coalescer.flush(request.user.pk)
+        return self.totals_response()
+
+    @action(detail=False, methods=['post'])
+    def add(self, request):
+        deltas = Counter()
+        for line in self.get_lines(CartLineSerializer):
+            deltas[line['product']] += line['quantity']
+        self.check_products([product_id for product_id, delta in deltas.items() if delta > 0])
+        cart_coalescer.add(request.user.pk, deltas)
+        return self.cart_response(projected_quantities(request.user.pk))
+
+    @action(detail=False, methods=['post'], url_path='set', url_name='set')
+    def set_quantity(self, request):
+        quantities = {line['product']: line['quantity'] for line in self.get_lines(CartSetLineSerializer)}
+        self.check_products([product_id for product_id, quantity in quantities.items() if quantity > 0])
+        cart_coalescer.flush(request.user.pk)
+        set_quantities(request.user.pk, quantities)
+        return self.totals_response()
+
+    @action(detail=False, methods=['post'])
+    def remove(self, request):
+        serializer = CartRemoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart_coalescer.flush(request.user.pk)
+        remove_products(request.user.pk, serializer.validated_data['products'])
+        return self.totals_response()
+
+    @action(detail=False, methods=['post'])
+    def clear(self, request):
+        cart_coalescer.flush(request.user.pk)
+        clear_cart(request.user.pk)
+        return self.totals_response()
@@ -1,7 +1,23 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django import forms
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
+from django.urls import path
+from django.utils import timezone
 from django.utils.safestring import mark_safe
+from .admin_tools import AutocompleteFilter, EstimatedCountPaginator, prefix_condition
+from .export import EXPORT_FORMATS, aexport_catalog, export_catalog
 from .models import Category, Section, Product
 from .forms import CategoryForm, SectionForm, ProductForm
+from .image_variants import thumbnail_url
+from .search import product_search_index
+from .stock import set_stock
+
+# Сколько самых релевантных товаров из поискового индекса попадает в поиск админки
+ADMIN_SEARCH_LIMIT = 200
 
 # Register your models here.
 
@@ -16,7 +32,7 @@ class CategoryAdmin(admin.ModelAdmin):
     
     def get_image(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />')
+            return mark_safe(f'<img src="{thumbnail_url("category", obj)}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />')
         return 'Нет изображения'
     
     get_image.short_description = 'Изображение'
@@ -33,7 +49,7 @@ class SectionAdmin(admin.ModelAdmin):
     
     def get_image(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />')
+            return mark_safe(f'<img src="{thumbnail_url("section", obj)}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />')
         return 'Нет изображения'
     
     get_image.short_description = 'Изображение'
@@ -41,16 +57,95 @@ class SectionAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    """
+    Админка товаров, рассчитанная на большие таблицы: раздел загружается JOIN-ом,
+    поиск идет по индексам, вместо полного COUNT(*) используется оценка,
+    а фильтры по разделу и категории не перечисляют все значения.
+    """
     form = ProductForm
-    list_display = ['name', 'section', 'price', 'quantity_value', 'quantity_type', 'available', 'get_image', 'created_at']
-    list_filter = ['available', 'created_at', 'updated_at', 'section', 'section__category']
+    list_display = ['name', 'section', 'price', 'quantity_value', 'quantity_type', 'available', 'stock', 'get_image', 'created_at']
+    list_select_related = ['section']
+    list_filter = [
+        'available', 'created_at', 'updated_at',
+        ('section', AutocompleteFilter), ('section__category', AutocompleteFilter),
+    ]
     list_editable = ['price', 'available']
-    search_fields = ['name', 'description', 'section__name', 'section__category__name']
+    search_fields = ['name']
+    search_help_text = (
+        'Начало названия, slug или id любого товара; слова из названия, описания, раздела '
+        'и категории ищутся только среди товаров, доступных в каталоге'
+    )
     prepopulated_fields = {'slug': ('name',)}
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ['stock_shards', 'sold_out']
+
+    @property
+    def media(self):
+        widget_media = AutocompleteSelect(Product._meta.get_field('section'), self.admin_site).media
+        return super().media + widget_media + forms.Media(js=['js/admin-autocomplete-filter.js'])
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск без LIKE '%...%' по всей таблице: префикс названия (диапазон по индексу),
+        точное совпадение slug или id и товары из полнотекстового индекса в памяти.
+        Индекс содержит только товары, доступные в каталоге (searchable_products), поэтому
+        недоступные товары находятся только по началу названия, slug или id.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q(slug=search_term)
+        for prefix in {search_term, search_term.capitalize()}:
+            condition |= prefix_condition('name', prefix)
+        if search_term.isdigit():
+            condition |= Q(pk=int(search_term))
+        matches = product_search_index.search(search_term, ADMIN_SEARCH_LIMIT)
+        if matches:
+            condition |= Q(pk__in=matches)
+        return queryset.filter(condition), False
     
+    def save_model(self, request, obj, form, change):
+        """
+        Сохраняет только измененные поля: остаток и флаг доступности могут одновременно
+        меняться покупками, и полное сохранение карточки затерло бы эти изменения.
+        Новый остаток записывается через set_stock. Ручное изменение доступности снимает
+        флаг sold_out: скрытый вручную товар не вернется в продажу при пополнении.
+        """
+        if change:
+            fields = [field for field in form.changed_data if field != 'stock']
+            if 'available' in fields:
+                obj.sold_out = False
+                fields.append('sold_out')
+            if fields:
+                obj.save(update_fields=[*fields, 'updated_at'])
+        else:
+            super().save_model(request, obj, form, change)
+        if 'stock' in form.changed_data:
+            set_stock(obj.pk, form.cleaned_data['stock'], shards=obj.stock_shards)
+
     def get_image(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />')
+            return mark_safe(f'<img src="{thumbnail_url("product", obj)}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />')
         return 'Нет изображения'
     
     get_image.short_description = 'Изображение'
+
+    def get_urls(self):
+        export_view = self.admin_site.admin_view(self.export_view)
+        return [
+            path('export.<str:fmt>', export_view, name='catalog_product_export'),
+        ] + super().get_urls()
+
+    def export_view(self, request, fmt):
+        """Потоковая выгрузка каталога для сотрудников с правом просмотра товаров"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if fmt not in EXPORT_FORMATS:
+            raise Http404('Неизвестный формат выгрузки')
+        # Под ASGI нужен асинхронный итератор: синхронный Django прочитал бы в память целиком
+        lines = aexport_catalog(fmt) if isinstance(request, ASGIRequest) else export_catalog(fmt)
+        response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[fmt])
+        filename = f'catalog-{timezone.now():%Y%m%d-%H%M}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -0,0 +1,105 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+# До этого числа строк точный COUNT(*) дешевле, чем обращение к статистике
+EXACT_COUNT_THRESHOLD = 10000
+
+# Для отфильтрованного списка строки считаются не дальше этого предела
+FILTERED_COUNT_LIMIT = 10000
+
+# Наибольший символ Unicode: верхняя граница диапазона строк с заданным префиксом
+MAX_CHAR = '\U0010ffff'
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Приблизительное число строк таблицы по статистике базы данных
+    (sqlite_stat1 после ANALYZE, pg_class.reltuples в PostgreSQL).
+    Без статистики возвращает наибольший первичный ключ — оценку сверху, которую
+    база находит по индексу без просмотра таблицы.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return row[0]
+    except DatabaseError:
+        # Таблицы sqlite_stat1 нет, пока ANALYZE ни разу не выполнялся
+        pass
+    return model._default_manager.using(using).aggregate(max_pk=Max('pk'))['max_pk'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списка в админке без полного COUNT(*) на больших таблицах.
+    Для всей таблицы берется оценка из статистики, для отфильтрованной выборки
+    строки считаются не дальше FILTERED_COUNT_LIMIT.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate > EXACT_COUNT_THRESHOLD:
+                return estimate
+            return super().count
+        return queryset.order_by()[:FILTERED_COUNT_LIMIT].count()
+
+
+def prefix_condition(field, prefix):
+    """Условие «начинается с prefix» в виде диапазона, для которого используется индекс по полю"""
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + MAX_CHAR})
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Фильтр по внешнему ключу с полем автодополнения вместо списка всех значений.
+    Варианты подгружаются стандартным autocomplete-представлением админки,
+    поэтому у админки связанной модели должны быть заданы search_fields.
+    """
+    template = 'admin/catalog/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        super().__init__(field, request, params, model, model_admin, field_path)
+        value = self.used_parameters.get(self.lookup_kwarg)
+        if isinstance(value, list):
+            value = value[-1] if value else None
+        remote_model = field.remote_field.model
+        form_field = forms.ModelChoiceField(
+            queryset=remote_model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+        self.rendered_widget = form_field.widget.render(self.lookup_kwarg, value)
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # Единственный вариант — ссылка без этого фильтра, к ней скрипт добавляет выбранное значение
+        yield {
+            'selected': self.lookup_kwarg in self.used_parameters,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'Все',
+        }
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
@@ -1,9 +1,19 @@
 from django.urls import path
-from . import api_views
+from . import api_views, views
 
 app_name = 'catalog_api'
 
 urlpatterns = [
+    # API для дерева каталога
+    path('tree/', api_views.CatalogTreeAPIView.as_view(), name='catalog_tree'),
+    path('tree/<slug:category_slug>/', api_views.CatalogTreeAPIView.as_view(), name='category_tree'),
+    
+    # Варианты изображений разной ширины и формата
+    path('images/<str:kind>/<int:pk>/<str:token>/<int:width>.<str:fmt>', views.image_variant, name='image_variant'),
+    
+    # API для поиска товаров
+    path('search/', api_views.ProductSearchAPIView.as_view(), name='product_search'),
+    
     # API для категорий
     path('categories/', api_views.CategoryListAPIView.as_view(), name='category_list'),
     path('categories/<slug:slug>/', api_views.CategoryDetailAPIView.as_view(), name='category_detail'),
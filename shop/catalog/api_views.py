@@ -1,84 +1,346 @@
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import Http404
+from .conditional import ConditionalGetMixin, make_etag
+from .facets import filter_queryset, parse_facet_filters, product_facet_index
 from .models import Category, Section, Product
+from .pagination import NameKeysetPagination
+from .response_cache import (
+    CATALOG_TAG, CachedResponseMixin, object_tags, response_cache,
+)
+from .search import product_search_index
+from .tree import find_category_subtree, get_catalog_tree_document
 from .serializers import (
     CategorySerializer, CategoryListSerializer,
     SectionSerializer, SectionListSerializer,
-    ProductSerializer
+    ProductSerializer, category_list_values_serializer,
+    product_values_serializer, section_list_values_serializer,
 )
 
 
-class CategoryListAPIView(generics.ListAPIView):
+class ValuesListMixin:
+    """
+    Быстрый путь для списков: при CATALOG_FAST_SERIALIZERS строки читаются через .values()
+    и сериализуются values_serializer без создания объектов модели.
+    Ответ совпадает с ответом обычного сериализатора.
+    """
+    values_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOG_FAST_SERIALIZERS', False):
+            return super().list(request, *args, **kwargs)
+        rows = self.values_serializer.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(self.values_serializer.serialize(rows, request))
+        return self.get_paginated_response(self.values_serializer.serialize(page, request))
+
+
+class MemoryIndexMixin:
+    """
+    Валидаторы для ответов, построенных по индексам в памяти процесса (memory_indexes).
+    Пока индекс не сверен с базой после последнего сброса кэша ответов, в ETag входит
+    его поколение в этом процессе (см. ProductMemoryIndex.state), а ответ не сохраняется
+    в общий кэш: индекс мог пропустить изменения других процессов, и из кэша их
+    устаревший результат получили бы все воркеры.
+    """
+    memory_indexes = ()
+    index_states = ()
+
+    def get_index_validators(self):
+        self.index_epoch = response_cache.epoch()
+        self.index_states = [index.state(self.index_epoch) for index in self.memory_indexes]
+        return {f'index_{i}': state for i, state in enumerate(self.index_states) if state is not None}
+
+    def is_cacheable(self):
+        return not any(self.index_states)
+
+
+class CategoryListAPIView(CachedResponseMixin, ConditionalGetMixin, ValuesListMixin, generics.ListAPIView):
     """API для получения списка всех категорий"""
     queryset = Category.objects.filter(available=True)
     serializer_class = CategoryListSerializer
+    values_serializer = category_list_values_serializer
     permission_classes = [permissions.AllowAny]
 
+    def get_validator_queryset(self):
+        return Category.objects.all()
 
-class CategoryDetailAPIView(generics.RetrieveAPIView):
+    def get_validator_fields(self):
+        return {'updated_at': Max('updated_at'), 'count': Count('id')}
+
+    def get_cache_tags(self, data):
+        return ['categories']
+
+
+class CategoryDetailAPIView(CachedResponseMixin, ConditionalGetMixin, generics.RetrieveAPIView):
     """API для получения детальной информации о категории"""
-    queryset = Category.objects.filter(available=True)
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'slug'
+    
+    def get_queryset(self):
+        return CategorySerializer.setup_eager_loading(Category.objects.filter(available=True))
+
+    def get_validator_queryset(self):
+        return Category.objects.filter(slug=self.kwargs.get('slug'))
 
+    def get_validator_fields(self):
+        return {
+            'updated_at': Max('updated_at'),
+            'sections_updated_at': Max('sections__updated_at'),
+            'products_updated_at': Max('sections__products__updated_at'),
+            'sections_count': Count('sections', distinct=True),
+            'products_count': Count('sections__products', distinct=True),
+        }
 
-class SectionListAPIView(generics.ListAPIView):
+    def get_cache_tags(self, data):
+        tags = [f'category:{data["id"]}', f'sections:{data["id"]}']
+        for section in data['sections']:
+            tags += [f'section:{section["id"]}', f'products:{section["id"]}']
+            tags += object_tags('product', [product['id'] for product in section['products']])
+        return tags
+
+
+class SectionListAPIView(CachedResponseMixin, ConditionalGetMixin, ValuesListMixin, generics.ListAPIView):
     """API для получения списка разделов категории"""
     serializer_class = SectionListSerializer
+    values_serializer = section_list_values_serializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = NameKeysetPagination
     
     def get_queryset(self):
         category_slug = self.kwargs.get('category_slug')
         return Section.objects.filter(category__slug=category_slug, category__available=True, available=True)
 
+    def get_validator_queryset(self):
+        return Category.objects.filter(slug=self.kwargs.get('category_slug'))
+
+    def get_validator_fields(self):
+        return {
+            'updated_at': Max('updated_at'),
+            'sections_updated_at': Max('sections__updated_at'),
+            'sections_count': Count('sections'),
+        }
+
+    def get_category_id_queryset(self):
+        return Category.objects.filter(slug=self.kwargs.get('category_slug')).values_list('id', flat=True)
 
-class SectionDetailAPIView(generics.RetrieveAPIView):
+    def get_cache_tags(self, data):
+        return self.cache_tags(self.get_category_id_queryset().first(), data)
+
+    @staticmethod
+    def cache_tags(category_id, data):
+        if category_id is None:
+            return [CATALOG_TAG]
+        # Разделы страницы помечаются по id, чтобы перенос раздела в другую категорию сбросил и эту запись
+        tags = [f'category:{category_id}', f'sections:{category_id}']
+        return tags + object_tags('section', [section['id'] for section in data['results']])
+
+
+class SectionDetailAPIView(CachedResponseMixin, ConditionalGetMixin, generics.RetrieveAPIView):
     """API для получения детальной информации о разделе"""
     serializer_class = SectionSerializer
     permission_classes = [permissions.AllowAny]
+    lookup_field = 'slug'
     
-    def get_object(self):
+    def get_queryset(self):
         category_slug = self.kwargs.get('category_slug')
-        section_slug = self.kwargs.get('slug')
-        return get_object_or_404(Section, slug=section_slug, category__slug=category_slug, 
-                                category__available=True, available=True)
+        queryset = Section.objects.filter(category__slug=category_slug, category__available=True, available=True)
+        return SectionSerializer.setup_eager_loading(queryset)
+
+    def get_cache_tags(self, data):
+        tags = [f'category:{self.object.category_id}', f'section:{self.object.pk}', f'products:{self.object.pk}']
+        return tags + object_tags('product', [product['id'] for product in data['products']])
+
+    def get_validator_queryset(self):
+        return Section.objects.filter(slug=self.kwargs.get('slug'), category__slug=self.kwargs.get('category_slug'))
+
+    def get_validator_fields(self):
+        return {
+            'updated_at': Max('updated_at'),
+            'category_updated_at': Max('category__updated_at'),
+            'products_updated_at': Max('products__updated_at'),
+            'products_count': Count('products'),
+        }
 
 
-class ProductListAPIView(generics.ListAPIView):
-    """API для получения списка товаров раздела"""
+class ProductListAPIView(MemoryIndexMixin, CachedResponseMixin, ConditionalGetMixin, ValuesListMixin,
+                         generics.ListAPIView):
+    """
+    API для получения списка товаров раздела.
+    Поддерживает фильтры price_min, price_max, quantity_type и quantity_value
+    и возвращает счетчики фасетов раздела в поле facets.
+    """
     serializer_class = ProductSerializer
+    values_serializer = product_values_serializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = NameKeysetPagination
+    memory_indexes = (product_facet_index,)
     
     def get_queryset(self):
         category_slug = self.kwargs.get('category_slug')
         section_slug = self.kwargs.get('section_slug')
-        return Product.objects.filter(
+        queryset = Product.objects.filter(
             section__slug=section_slug, 
             section__category__slug=category_slug,
             section__available=True,
             section__category__available=True,
             available=True
         )
+        return filter_queryset(queryset, self.get_facet_filters())
+    
+    def get_facet_filters(self):
+        if not hasattr(self, '_facet_filters'):
+            self._facet_filters = parse_facet_filters(self.request.query_params)
+        return self._facet_filters
 
+    def get_validator_queryset(self):
+        return Section.objects.filter(
+            slug=self.kwargs.get('section_slug'), category__slug=self.kwargs.get('category_slug')
+        )
 
-class ProductDetailAPIView(generics.RetrieveAPIView):
+    def get_validator_fields(self):
+        return {
+            'updated_at': Max('updated_at'),
+            'category_updated_at': Max('category__updated_at'),
+            'products_updated_at': Max('products__updated_at'),
+            'products_count': Count('products'),
+        }
+
+    def get_validator_aggregates(self):
+        # Фасеты берутся из индекса в памяти, поэтому в ETag входит и его состояние
+        return {**super().get_validator_aggregates(), **self.get_index_validators()}
+
+    def get_section_queryset(self):
+        return Section.objects.filter(
+            slug=self.kwargs.get('section_slug'),
+            category__slug=self.kwargs.get('category_slug'),
+            category__available=True,
+            available=True,
+        ).values('id', 'category_id')
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        self.section = self.get_section_queryset().first()
+        section_id = self.section['id'] if self.section else None
+        response.data['facets'] = product_facet_index.section_facets(section_id, self.get_facet_filters())
+        return response
+
+    def get_cache_tags(self, data):
+        if self.section is None:
+            return [CATALOG_TAG]
+        section_id = self.section['id']
+        tags = [f'category:{self.section["category_id"]}', f'section:{section_id}', f'products:{section_id}']
+        return tags + object_tags('product', [product['id'] for product in data['results']])
+
+
+class ProductDetailAPIView(CachedResponseMixin, ConditionalGetMixin, generics.RetrieveAPIView):
     """API для получения детальной информации о товаре"""
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
+    lookup_field = 'slug'
     
-    def get_object(self):
+    def get_queryset(self):
         category_slug = self.kwargs.get('category_slug')
         section_slug = self.kwargs.get('section_slug')
-        product_slug = self.kwargs.get('slug')
-        return get_object_or_404(
-            Product, 
-            slug=product_slug, 
+        return Product.objects.filter(
             section__slug=section_slug, 
             section__category__slug=category_slug,
             section__available=True,
             section__category__available=True,
             available=True
-        ) 
\ No newline at end of file
+        )
+
+    def get_validator_queryset(self):
+        return Product.objects.filter(
+            slug=self.kwargs.get('slug'),
+            section__slug=self.kwargs.get('section_slug'),
+            section__category__slug=self.kwargs.get('category_slug'),
+        )
+
+    def get_validator_fields(self):
+        return {
+            'updated_at': Max('updated_at'),
+            'section_updated_at': Max('section__updated_at'),
+            'category_updated_at': Max('section__category__updated_at'),
+        }
+
+    def get_category_id_queryset(self):
+        return Section.objects.values_list('category_id', flat=True).filter(pk=self.object.section_id)
+
+    def get_cache_tags(self, data):
+        return self.cache_tags(self.get_category_id_queryset().get(), self.object)
+
+    @staticmethod
+    def cache_tags(category_id, product):
+        return [f'category:{category_id}', f'section:{product.section_id}', f'product:{product.pk}']
+
+
+class CatalogTreeAPIView(ConditionalGetMixin, APIView):
+    """
+    API для получения всего дерева каталога (категории → разделы → товары)
+    или поддерева одной категории за один запрос.
+    Дерево берется из кэша и перестраивается только при изменении каталога.
+    ETag хранится в кэше вместе с деревом, поэтому ответ 304 не требует запросов к базе.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get_validators(self):
+        self.document = get_catalog_tree_document()
+        return make_etag(self.request.build_absolute_uri(), self.document['etag']), None
+
+    def build_response(self, request, category_slug=None):
+        if category_slug is None:
+            return Response(self.document['tree'])
+        subtree = find_category_subtree(self.document['tree'], category_slug)
+        if subtree is None:
+            raise Http404("Категория не найдена или недоступна")
+        return Response(subtree)
+
+
+class ProductSearchAPIView(MemoryIndexMixin, CachedResponseMixin, ConditionalGetMixin, APIView):
+    """
+    API полнотекстового поиска товаров по названию, описанию, разделу и категории.
+    Поиск выполняется по индексу в памяти, из базы загружается только страница результатов.
+    Поддерживает те же фасетные фильтры, что и список товаров раздела.
+    """
+    permission_classes = [permissions.AllowAny]
+    memory_indexes = (product_search_index, product_facet_index)
+    default_limit = 20
+    max_limit = 100
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get_validator_aggregates(self):
+        # Результаты зависят от всех товаров, разделов и категорий: вместо агрегата по всей
+        # таблице товаров используется метка сброса кэша, которая меняется при любом их изменении
+        index_validators = self.get_index_validators()
+        return {'epoch': self.index_epoch, **index_validators}
+
+    def build_response(self, request):
+        query = request.query_params.get('q', '').strip()
+        filters = parse_facet_filters(request.query_params)
+        matches = product_search_index.match(query)
+        scores = {pk: matches[pk] for pk in product_facet_index.filter_ids(matches, filters)}
+        page_ids = product_search_index.rank(scores, self.get_limit())
+        products = Product.objects.in_bulk(page_ids)
+        serializer = ProductSerializer(
+            [products[pk] for pk in page_ids if pk in products],
+            many=True,
+            context={'request': request},
+        )
+        return Response({
+            'query': query,
+            'count': len(scores),
+            'results': serializer.data,
+            'facets': product_facet_index.facets_for(matches, filters),
+        })
@@ -0,0 +1,20 @@
+from django.urls import path
+from . import api_urls, async_api_views
+
+app_name = 'catalog_api'
+
+# Списки и детальные страницы каталога — асинхронные, остальные адреса те же, что в api_urls
+async_views = {
+    'category_list': async_api_views.AsyncCategoryListAPIView,
+    'category_detail': async_api_views.AsyncCategoryDetailAPIView,
+    'section_list': async_api_views.AsyncSectionListAPIView,
+    'section_detail': async_api_views.AsyncSectionDetailAPIView,
+    'product_list': async_api_views.AsyncProductListAPIView,
+    'product_detail': async_api_views.AsyncProductDetailAPIView,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), async_views[pattern.name].as_view(), name=pattern.name)
+    if pattern.name in async_views else pattern
+    for pattern in api_urls.urlpatterns
+]
@@ -0,0 +1,176 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from shop.routers import read_from_replica
+from .api_views import (
+    CategoryDetailAPIView, CategoryListAPIView, MemoryIndexMixin, ProductDetailAPIView, ProductListAPIView,
+    SectionDetailAPIView, SectionListAPIView,
+)
+from .conditional import apply_validators, validators_from_aggregates
+from .facets import product_facet_index
+from .response_cache import cached_entry_response, response_cache
+
+_renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    """Ответ с тем же JSON, что отдает JSONRenderer в синхронных API"""
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+class AsyncCatalogAPIView(View):
+    """
+    Асинхронная версия API каталога для ASGI: запросы к базе выполняются
+    асинхронным ORM (aaggregate, aget, async for), поэтому ожидающее соединение
+    не занимает поток. Запросы к области ответа, теги кэша и сериализаторы берутся
+    у синхронного представления api_view_class, поэтому ответы, ETag и записи
+    кэша ответов совпадают с синхронными. Сериализуются только уже загруженные
+    объекты или строки .values(), без обращений к базе.
+    Кэш ответов общий для процессов (CACHES), поэтому обращения к нему выполняются
+    асинхронными методами response_cache, а одновременные промахи по одному адресу
+    вычисляются один раз (asingle_flight), как в синхронном CachedResponseMixin.
+    """
+    api_view_class = None
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, **kwargs):
+        request = Request(request)
+        self.request = request
+        self.view = self.api_view_class(request=request, kwargs=kwargs, format_kwarg=None, args=())
+        try:
+            if not response_cache.enabled:
+                return await self.conditional_response(request)
+            key = response_cache.key(request.build_absolute_uri())
+            entry = await response_cache.aget(key)
+            if entry is None:
+                async with response_cache.asingle_flight(key):
+                    entry = await response_cache.aget(key)
+                    if entry is None:
+                        epoch = await response_cache.aepoch()
+                        settled = response_cache.is_settled(epoch)
+                        response = await self.conditional_response(request)
+                        # Ответ из отстающей реплики не сохраняется, как в CachedResponseMixin
+                        if (
+                            response.status_code == 200 and self.view.is_cacheable()
+                            and (settled or not read_from_replica())
+                        ):
+                            entry = {
+                                'data': self.data,
+                                'etag': response.get('ETag'),
+                                'last_modified': response.get('Last-Modified'),
+                            }
+                            tags = await self.get_cache_tags(self.data)
+                            await response_cache.aset(key, entry, tags, epoch)
+                        return response
+            return cached_entry_response(request, entry, json_response)
+        except Http404 as exc:
+            return json_response({'detail': str(exc)}, status=404)
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, status=exc.status_code)
+
+    async def conditional_response(self, request):
+        view = self.view
+        aggregates = await view.get_validator_queryset().aaggregate(**view.get_validator_fields())
+        if isinstance(view, MemoryIndexMixin):
+            # Проверка индекса может перестроить его запросами к базе
+            aggregates.update(await sync_to_async(view.get_index_validators)())
+        etag, last_modified = validators_from_aggregates(request, aggregates)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            self.data = await self.get_data()
+            response = json_response(self.data)
+        return apply_validators(response, etag, last_modified)
+
+    async def get_data(self):
+        raise NotImplementedError
+
+    async def get_cache_tags(self, data):
+        return self.view.get_cache_tags(data)
+
+    async def get_object(self):
+        view = self.view
+        lookup = {view.lookup_field: view.kwargs[view.lookup_url_kwarg or view.lookup_field]}
+        queryset = view.get_queryset()
+        try:
+            view.object = await queryset.aget(**lookup)
+        except ObjectDoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return view.object
+
+    def serialize(self, instance):
+        return self.view.get_serializer(instance).data
+
+    async def list_rows(self):
+        """Строки списка через .values() и async for, со страницей курсорной пагинации"""
+        view = self.view
+        rows = view.values_serializer.rows(view.filter_queryset(view.get_queryset()))
+        paginator = view.paginator
+        if paginator is None:
+            return view.values_serializer.serialize([row async for row in rows], self.request)
+        page = await paginator.apaginate_queryset(rows, self.request, view=view)
+        return paginator.get_paginated_response(view.values_serializer.serialize(page, self.request)).data
+
+
+class AsyncCategoryListAPIView(AsyncCatalogAPIView):
+    """Асинхронный список категорий"""
+    api_view_class = CategoryListAPIView
+
+    async def get_data(self):
+        return await self.list_rows()
+
+
+class AsyncCategoryDetailAPIView(AsyncCatalogAPIView):
+    """Асинхронная категория с разделами и товарами (три запроса, как в синхронном API)"""
+    api_view_class = CategoryDetailAPIView
+
+    async def get_data(self):
+        return self.serialize(await self.get_object())
+
+
+class AsyncSectionListAPIView(AsyncCatalogAPIView):
+    """Асинхронный список разделов категории"""
+    api_view_class = SectionListAPIView
+
+    async def get_data(self):
+        return await self.list_rows()
+
+    async def get_cache_tags(self, data):
+        return self.view.cache_tags(await self.view.get_category_id_queryset().afirst(), data)
+
+
+class AsyncSectionDetailAPIView(AsyncCatalogAPIView):
+    """Асинхронный раздел с товарами"""
+    api_view_class = SectionDetailAPIView
+
+    async def get_data(self):
+        return self.serialize(await self.get_object())
+
+
+class AsyncProductListAPIView(AsyncCatalogAPIView):
+    """Асинхронный список товаров раздела с фасетными фильтрами и счетчиками"""
+    api_view_class = ProductListAPIView
+
+    async def get_data(self):
+        view = self.view
+        data = await self.list_rows()
+        view.section = await view.get_section_queryset().afirst()
+        section_id = view.section['id'] if view.section else None
+        # При первом обращении индекс фасетов строится запросами к базе
+        data['facets'] = await sync_to_async(product_facet_index.section_facets)(section_id, view.get_facet_filters())
+        return data
+
+
+class AsyncProductDetailAPIView(AsyncCatalogAPIView):
+    """Асинхронная карточка товара"""
+    api_view_class = ProductDetailAPIView
+
+    async def get_data(self):
+        return self.serialize(await self.get_object())
+
+    async def get_cache_tags(self, data):
+        return self.view.cache_tags(await self.view.get_category_id_queryset().aget(), self.view.object)
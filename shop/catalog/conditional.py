@@ -0,0 +1,72 @@
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Строит ETag из произвольных значений, описывающих состояние ресурса"""
+    digest = hashlib.md5(repr(parts).encode('utf-8'), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def validators_from_aggregates(request, aggregates):
+    """
+    Пара (etag, last_modified в секундах или None) по результату .aggregate().
+    Если среди агрегатов есть количества строк, Last-Modified не выдается: удаление
+    строки не меняет max(updated_at), и клиент с одним If-Modified-Since получил бы 304
+    с устаревшими данными. Такие ответы проверяются только по ETag, куда входят количества.
+    """
+    timestamps = [value.timestamp() for value in aggregates.values() if hasattr(value, 'timestamp')]
+    has_counts = any(isinstance(value, int) for value in aggregates.values())
+    last_modified = int(max(timestamps)) if timestamps and not has_counts else None
+    # Адрес запроса входит в ETag: от него зависят страница, фильтры и абсолютные ссылки
+    return make_etag(request.build_absolute_uri(), sorted(aggregates.items())), last_modified
+
+
+def apply_validators(response, etag, last_modified):
+    """Добавляет ETag и Last-Modified к ответу 200 или 304"""
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Клиент может хранить ответ, но обязан перепроверять его при каждом запросе
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Условный GET для API каталога.
+    Перед сериализацией вызывается get_validators(), который одним агрегирующим
+    запросом получает max(updated_at) и количество строк в области ответа.
+    Если клиент прислал совпадающие If-None-Match или If-Modified-Since,
+    возвращается 304 без сериализации и тела ответа. Last-Modified выдается
+    только ответам без количеств строк (см. validators_from_aggregates).
+    """
+
+    def get_validator_queryset(self):
+        """Queryset области ответа, по которому считаются get_validator_fields()"""
+        raise NotImplementedError
+
+    def get_validator_fields(self):
+        """Агрегаты (max(updated_at), количество строк) для .aggregate()"""
+        raise NotImplementedError
+
+    def get_validator_aggregates(self):
+        """Возвращает результат .aggregate() по области ответа"""
+        return self.get_validator_queryset().aggregate(**self.get_validator_fields())
+
+    def get_validators(self):
+        """Возвращает пару (etag, last_modified в секундах или None)"""
+        return validators_from_aggregates(self.request, self.get_validator_aggregates())
+
+    def build_response(self, request, *args, **kwargs):
+        """Строит полный ответ; APIView без собственного get переопределяют этот метод"""
+        return super().get(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.build_response(request, *args, **kwargs)
+        return apply_validators(response, etag, last_modified)
@@ -0,0 +1,101 @@
+import csv
+import json
+from asgiref.sync import sync_to_async
+from .models import Product
+
+# Колонки выгрузки совпадают с колонками import_catalog, поэтому файл можно загрузить обратно
+EXPORT_COLUMNS = (
+    'category_slug', 'category_name', 'section_slug', 'section_name', 'slug', 'name', 'description',
+    'price', 'quantity_type', 'quantity_value', 'available', 'image',
+)
+
+EXPORT_FIELDS = (
+    'section__category__slug', 'section__category__name', 'section__slug', 'section__name', 'slug', 'name',
+    'description', 'price', 'quantity_type', 'quantity_value', 'available', 'image',
+)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def export_rows(chunk_size=2000):
+    """
+    Товары с разделом и категорией в виде кортежей значений EXPORT_COLUMNS.
+    Строки читаются из курсора пачками по chunk_size, без кэша queryset.
+    """
+    queryset = Product.objects.order_by('id').values_list(*EXPORT_FIELDS)
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: возвращает записанную строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def _record(row):
+    """Словарь колонок выгрузки с значениями, которые понимает import_catalog"""
+    record = dict(zip(EXPORT_COLUMNS, row))
+    record['price'] = str(record['price'])
+    record['quantity_value'] = str(record['quantity_value'])
+    record['description'] = record['description'] or ''
+    record['image'] = record['image'] or ''
+    return record
+
+
+def ndjson_line(row):
+    return json.dumps(_record(row), ensure_ascii=False) + '\n'
+
+
+def csv_line(row):
+    record = _record(row)
+    record['available'] = int(record['available'])
+    return csv.writer(Echo()).writerow(record.values())
+
+
+EXPORT_LINES = {'ndjson': ndjson_line, 'csv': csv_line}
+
+
+def export_header(fmt):
+    """Первая строка выгрузки: заголовок CSV или пустая строка для ndjson"""
+    return csv.writer(Echo()).writerow(EXPORT_COLUMNS) if fmt == 'csv' else ''
+
+
+def export_catalog(fmt, chunk_size=2000):
+    """Генератор строк выгрузки в формате ndjson или csv"""
+    header = export_header(fmt)
+    if header:
+        # Заголовок уходит клиенту до выполнения запроса
+        yield header
+    line = EXPORT_LINES[fmt]
+    for row in export_rows(chunk_size):
+        yield line(row)
+
+
+def export_batch(after_id, size):
+    """Пачка из size строк выгрузки после товара after_id: пары (id, строка)"""
+    rows = Product.objects.filter(pk__gt=after_id).order_by('id').values_list('id', *EXPORT_FIELDS)[:size]
+    return [(row[0], row[1:]) for row in rows]
+
+
+async def aexport_catalog(fmt, chunk_size=2000):
+    """
+    Асинхронная версия export_catalog для ASGI. Синхронный итератор StreamingHttpResponse
+    Django под ASGI сначала читает целиком в память, а этот отдает выгрузку по мере чтения:
+    пачки по chunk_size товаров читаются по id в потоке через sync_to_async
+    и отправляются клиенту одним блоком на пачку.
+    """
+    header = export_header(fmt)
+    if header:
+        yield header
+    line = EXPORT_LINES[fmt]
+    after_id = 0
+    while True:
+        batch = await sync_to_async(export_batch)(after_id, chunk_size)
+        if not batch:
+            break
+        after_id = batch[-1][0]
+        yield ''.join(line(row) for _, row in batch)
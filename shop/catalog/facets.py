@@ -0,0 +1,200 @@
+from collections import Counter, defaultdict, namedtuple
+from decimal import Decimal, InvalidOperation
+from rest_framework.exceptions import ValidationError
+from .memory_index import ProductMemoryIndex
+
+# Верхние границы ценовых диапазонов фасета; последний диапазон открыт сверху
+PRICE_BUCKETS = (Decimal('100'), Decimal('300'), Decimal('500'), Decimal('1000'), Decimal('3000'))
+
+FACET_NAMES = ('price', 'quantity_type', 'quantity_value')
+
+FacetRow = namedtuple('FacetRow', ['section_id', 'price', 'quantity_type', 'quantity_value', 'price_bucket'])
+
+
+def price_bucket(price):
+    """Возвращает номер ценового диапазона для цены"""
+    for index, upper in enumerate(PRICE_BUCKETS):
+        if price < upper:
+            return index
+    return len(PRICE_BUCKETS)
+
+
+def price_bucket_bounds(index):
+    lower = PRICE_BUCKETS[index - 1] if index > 0 else Decimal('0')
+    upper = PRICE_BUCKETS[index] if index < len(PRICE_BUCKETS) else None
+    return lower, upper
+
+
+def _to_decimal(value, name):
+    # Decimal принимает NaN и Infinity, сравнение с которыми вызывает исключение
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Ожидается число'})
+    if not number.is_finite():
+        raise ValidationError({name: 'Ожидается число'})
+    return number
+
+
+def _parse_decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    return _to_decimal(value, name)
+
+
+def parse_facet_filters(params):
+    """
+    Разбирает параметры фильтрации из строки запроса:
+    price_min (включительно), price_max (не включительно, как границы ценовых диапазонов),
+    quantity_type и quantity_value (можно передать несколько значений).
+    """
+    filters = {}
+    price_min = _parse_decimal(params, 'price_min')
+    price_max = _parse_decimal(params, 'price_max')
+    if price_min is not None or price_max is not None:
+        filters['price'] = (price_min, price_max)
+
+    quantity_types = [value for value in params.getlist('quantity_type') if value]
+    if quantity_types:
+        filters['quantity_type'] = set(quantity_types)
+
+    quantity_values = {_to_decimal(value, 'quantity_value') for value in params.getlist('quantity_value')}
+    if quantity_values:
+        filters['quantity_value'] = quantity_values
+    return filters
+
+
+def filter_queryset(queryset, filters):
+    """Применяет фасетные фильтры к queryset товаров"""
+    if 'price' in filters:
+        price_min, price_max = filters['price']
+        if price_min is not None:
+            queryset = queryset.filter(price__gte=price_min)
+        if price_max is not None:
+            queryset = queryset.filter(price__lt=price_max)
+    if 'quantity_type' in filters:
+        queryset = queryset.filter(quantity_type__in=filters['quantity_type'])
+    if 'quantity_value' in filters:
+        queryset = queryset.filter(quantity_value__in=filters['quantity_value'])
+    return queryset
+
+
+def _row_matches(row, filters, skip=None):
+    for name, condition in filters.items():
+        if name == skip:
+            continue
+        if name == 'price':
+            price_min, price_max = condition
+            if price_min is not None and row.price < price_min:
+                return False
+            if price_max is not None and row.price >= price_max:
+                return False
+        elif getattr(row, name) not in condition:
+            return False
+    return True
+
+
+class ProductFacetIndex(ProductMemoryIndex):
+    """
+    Фасетные атрибуты доступных товаров и готовые счетчики по разделам.
+    Без фильтров счетчики раздела берутся из поддерживаемых Counter,
+    с фильтрами пересчитываются по строкам в памяти, без запросов к базе.
+    """
+    fields = ('section_id', 'price', 'quantity_type', 'quantity_value')
+
+    def _reset(self):
+        self._rows = {}                                   # id товара -> FacetRow
+        self._section_products = defaultdict(set)         # id раздела -> id товаров
+        self._section_counts = defaultdict(lambda: {name: Counter() for name in FACET_NAMES})
+
+    def _add(self, row):
+        facet_row = FacetRow(
+            section_id=row['section_id'],
+            price=row['price'],
+            quantity_type=row['quantity_type'],
+            quantity_value=row['quantity_value'],
+            price_bucket=price_bucket(row['price']),
+        )
+        self._rows[row['id']] = facet_row
+        self._section_products[facet_row.section_id].add(row['id'])
+        self._count(facet_row, 1)
+
+    def _remove(self, product_id):
+        facet_row = self._rows.pop(product_id, None)
+        if facet_row is None:
+            return
+        self._section_products[facet_row.section_id].discard(product_id)
+        self._count(facet_row, -1)
+
+    def _count(self, facet_row, delta):
+        counts = self._section_counts[facet_row.section_id]
+        for name, value in self._facet_values(facet_row):
+            counts[name][value] += delta
+            if counts[name][value] <= 0:
+                del counts[name][value]
+
+    @staticmethod
+    def _facet_values(facet_row):
+        return (
+            ('price', facet_row.price_bucket),
+            ('quantity_type', facet_row.quantity_type),
+            ('quantity_value', facet_row.quantity_value),
+        )
+
+    def filter_ids(self, product_ids, filters):
+        """Оставляет из product_ids только товары, проходящие фильтры"""
+        if not filters:
+            return product_ids
+        self.ensure_built()
+        with self._lock:
+            return [pk for pk in product_ids if pk in self._rows and _row_matches(self._rows[pk], filters)]
+
+    def section_facets(self, section_id, filters=None):
+        """Счетчики фасетов для товаров раздела"""
+        self.ensure_built()
+        with self._lock:
+            if not filters:
+                return self._format(self._section_counts.get(section_id) or {})
+            return self._compute(self._section_products.get(section_id, ()), filters)
+
+    def facets_for(self, product_ids, filters=None):
+        """Счетчики фасетов для произвольного набора товаров (например, результатов поиска)"""
+        self.ensure_built()
+        with self._lock:
+            return self._compute(product_ids, filters or {})
+
+    def _compute(self, product_ids, filters):
+        # Каждый фасет считается без учета собственного фильтра, чтобы были видны альтернативы
+        counts = {name: Counter() for name in FACET_NAMES}
+        for pk in product_ids:
+            facet_row = self._rows.get(pk)
+            if facet_row is None:
+                continue
+            for name, value in self._facet_values(facet_row):
+                if _row_matches(facet_row, filters, skip=name):
+                    counts[name][value] += 1
+        return self._format(counts)
+
+    @staticmethod
+    def _format(counts):
+        result = {}
+        price_counts = counts.get('price', {})
+        result['price'] = []
+        for index in sorted(price_counts):
+            lower, upper = price_bucket_bounds(index)
+            result['price'].append({
+                'min': str(lower),
+                'max': str(upper) if upper is not None else None,
+                'count': price_counts[index],
+            })
+        for name in ('quantity_type', 'quantity_value'):
+            values = counts.get(name, {})
+            result[name] = [
+                {'value': str(value), 'count': values[value]}
+                for value in sorted(values)
+            ]
+        return result
+
+
+product_facet_index = ProductFacetIndex()
@@ -41,4 +41,4 @@ class ProductForm(forms.ModelForm, ImageValidationMixin):
     class Meta:
         model = Product
         fields = ['section', 'name', 'slug', 'image', 'description', 
-                 'price', 'quantity_type', 'quantity_value', 'available'] 
\ No newline at end of file
+                 'price', 'quantity_type', 'quantity_value', 'available', 'stock'] 
\ No newline at end of file
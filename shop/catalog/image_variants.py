@@ -0,0 +1,209 @@
+import io
+import os
+import tempfile
+import threading
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image
+
+# Допустимые ширины вариантов: ограничивают число файлов в кэше на одно изображение
+VARIANT_WIDTHS = (50, 100, 200, 300, 500)
+
+# Ширины, которые попадают в srcset для каждого типа объекта
+SRCSET_WIDTHS = {
+    'category': (100, 200, 300),
+    'section': (100, 200, 300),
+    'product': (100, 200, 300, 500),
+}
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+VARIANT_QUALITY = 80
+
+# Длина префикса хеша содержимого в URL варианта
+HASH_LENGTH = 16
+
+# Доля max_bytes, после записи которой размер кэша заново считается по каталогу
+RESCAN_FRACTION = 0.1
+
+
+def image_token(obj):
+    """
+    Возвращает часть URL, зависящую от содержимого изображения.
+    Пока изображение не обработано фоновой задачей, хеша нет и варианты не выдаются.
+    """
+    if not obj.image or not obj.image_hash:
+        return None
+    return obj.image_hash[:HASH_LENGTH]
+
+
+# Значения для reverse(), по которым отделяется общая часть ссылок на варианты
+PREFIX_PROBE = {'kind': 'k', 'pk': 0, 'token': 't', 'width': 0, 'fmt': 'f'}
+PREFIX_PROBE_SUFFIX = 'k/0/t/0.f'
+
+
+def variant_url_prefix(request=None):
+    """
+    Общее начало ссылок на варианты изображений (абсолютное, если передан request).
+    Вычисляется один раз на список ссылок вместо reverse() для каждой из них.
+    """
+    url = reverse('catalog_api:image_variant', kwargs=PREFIX_PROBE)
+    prefix = url[:-len(PREFIX_PROBE_SUFFIX)]
+    return request.build_absolute_uri(prefix) if request is not None else prefix
+
+
+def variant_url(kind, obj, width, fmt, request=None, prefix=None):
+    if prefix is None:
+        prefix = variant_url_prefix(request)
+    return f'{prefix}{kind}/{obj.pk}/{image_token(obj)}/{width}.{fmt}'
+
+
+def thumbnail_url(kind, obj, width=100):
+    """Ссылка на уменьшенное изображение для миниатюр; до обработки — на исходный файл"""
+    if image_token(obj) is None:
+        return obj.image.url
+    return variant_url(kind, obj, width, 'webp')
+
+
+def image_srcset(kind, obj, request=None, prefix=None):
+    """
+    Возвращает srcset для каждого формата или None, если вариантов нет.
+    prefix — результат variant_url_prefix(request), если он уже вычислен для списка объектов.
+    """
+    if image_token(obj) is None:
+        return None
+    if prefix is None:
+        prefix = variant_url_prefix(request)
+    return {
+        fmt: ', '.join(f'{variant_url(kind, obj, width, fmt, prefix=prefix)} {width}w' for width in SRCSET_WIDTHS[kind])
+        for fmt in VARIANT_FORMATS
+    }
+
+
+def render_variant(source_path, width, fmt):
+    """Уменьшает изображение до ширины width (без увеличения) и кодирует в нужный формат"""
+    pil_format, _ = VARIANT_FORMATS[fmt]
+    with Image.open(source_path) as img:
+        if img.width > width:
+            img.thumbnail((width, round(img.height * width / img.width) or 1))
+        if pil_format == 'JPEG' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        buffer = io.BytesIO()
+        img.save(buffer, format=pil_format, quality=VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+class VariantCache:
+    """
+    Дисковый кэш вариантов изображений с ограничением по размеру.
+    Время изменения файла обновляется при каждом попадании и служит меткой
+    последнего использования: при переполнении удаляются самые давние файлы (LRU).
+    Каталог общий для всех процессов, поэтому размер кэша заново считается по нему
+    после каждых RESCAN_FRACTION * max_bytes записанных процессом байт и при вытеснении.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self._written = 0               # байт записано процессом после последнего подсчета
+
+    @property
+    def directory(self):
+        return self._directory or getattr(
+            settings, 'IMAGE_VARIANT_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'variants')
+        )
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes or getattr(settings, 'IMAGE_VARIANT_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Возвращает путь к файлу варианта или None, если его нет в кэше"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """Атомарно записывает вариант в кэш и при необходимости вытесняет старые"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._written += len(data)
+            if self._size is None or self._written >= self.max_bytes * RESCAN_FRACTION:
+                # Учитываем и файлы, записанные другими процессами
+                self._size = self._scan_size()
+                self._written = 0
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                self._unlink(entry.path)
+            self._size = 0
+            self._written = 0
+
+    def _entries(self):
+        try:
+            return [
+                entry for entry in os.scandir(self.directory)
+                if entry.is_file() and not entry.name.endswith('.tmp')
+            ]
+        except FileNotFoundError:
+            return []
+
+    def _scan_size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        # Освобождаем место с запасом, чтобы не вытеснять по одному файлу на каждой записи
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if size <= target:
+                break
+            size -= entry.stat().st_size
+            self._unlink(entry.path)
+        self._size = size
+        self._written = 0
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+variant_cache = VariantCache()
+
+
+def get_variant_path(kind, obj, width, fmt):
+    """Возвращает путь к файлу варианта изображения, создавая его при первом запросе"""
+    key = f'{kind}-{obj.pk}-{image_token(obj)}-{width}.{fmt}'
+    path = variant_cache.get(key)
+    if path is None:
+        path = variant_cache.put(key, render_variant(obj.image.path, width, fmt))
+    return path
@@ -0,0 +1,60 @@
+import hashlib
+from django.apps import apps
+from PIL import Image
+
+
+def file_hash(path):
+    """Возвращает SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def crop_to_square(path, size):
+    """Обрезает изображение до квадрата по центру и уменьшает до size×size"""
+    img = Image.open(path)
+
+    # Определяем размер для обрезки (берем минимальную сторону)
+    width, height = img.size
+    side = min(width, height)
+
+    # Вычисляем координаты для обрезки из центра
+    left = (width - side) / 2
+    top = (height - side) / 2
+    right = (width + side) / 2
+    bottom = (height + side) / 2
+
+    img = img.crop((left, top, right, bottom))
+    img.thumbnail((size, size))
+    img.save(path)
+
+
+def fit_within(path, size):
+    """Уменьшает изображение, если оно больше size по любой из сторон"""
+    img = Image.open(path)
+    if img.height > size or img.width > size:
+        img.thumbnail((size, size))
+        img.save(path)
+
+
+def process_catalog_image(model, pk):
+    """
+    Фоновая задача обработки изображения объекта каталога.
+    Если содержимое файла совпадает с уже обработанным (по хешу), ничего не делает.
+    """
+    model_class = apps.get_model(model)
+    obj = model_class.objects.filter(pk=pk).first()
+    if obj is None or not obj.image:
+        return
+
+    path = obj.image.path
+    if file_hash(path) == obj.image_hash:
+        return
+
+    obj.process_image(path)
+    # Файл изображения не меняется, поэтому save() не поставит обработку в очередь повторно,
+    # а сигналы обновят кэши каталога, зависящие от хеша изображения
+    obj.image_hash = file_hash(path)
+    obj.save(update_fields=['image_hash', 'updated_at'])
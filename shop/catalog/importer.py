@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+from functools import partial
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import reset_queries, transaction
+from django.utils import timezone
+from tasks.queue import enqueue_many
+from .images import process_catalog_image
+from .models import Category, Section, Product
+from .response_cache import invalidation_tags, response_cache
+from .signals import MEMORY_INDEXES
+
+# Поля товара, которые берутся из файла импорта
+PRODUCT_FIELDS = ('name', 'description', 'price', 'quantity_type', 'quantity_value', 'available')
+
+REQUIRED_COLUMNS = ('category_slug', 'section_slug', 'slug', 'name', 'price', 'quantity_type', 'quantity_value')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да', '+'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет', '-'}
+
+
+class ImportRowError(Exception):
+    """Ошибка в строке файла импорта"""
+
+    def __init__(self, line, message):
+        super().__init__(f'Строка {line}: {message}')
+        self.line = line
+
+
+def read_rows(f, fmt):
+    """
+    Построчно читает файл импорта, не загружая его в память целиком.
+    Возвращает пары (номер строки, словарь значений).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as exc:
+                raise ImportRowError(line_number, f'неверный JSON ({exc})')
+    else:
+        raise ValueError(f'Неизвестный формат {fmt}')
+
+
+def parse_bool(value, line):
+    if isinstance(value, bool):
+        return value
+    if value in (None, ''):
+        return True
+    normalized = str(value).strip().lower()
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    raise ImportRowError(line, f'неверное значение available: {value}')
+
+
+def parse_row(line, row):
+    """Проверяет строку и приводит значения к типам полей модели"""
+    missing = [column for column in REQUIRED_COLUMNS if row.get(column) in (None, '')]
+    if missing:
+        raise ImportRowError(line, f'не заполнены {", ".join(missing)}')
+    try:
+        product = {
+            'name': str(row['name']).strip(),
+            'description': str(row.get('description') or ''),
+            'price': Product._meta.get_field('price').to_python(row['price']),
+            'quantity_type': str(row['quantity_type']).strip(),
+            'quantity_value': Product._meta.get_field('quantity_value').to_python(row['quantity_value']),
+            'available': parse_bool(row.get('available'), line),
+        }
+    except ValidationError as exc:
+        raise ImportRowError(line, '; '.join(exc.messages))
+    return {
+        'line': line,
+        'slug': str(row['slug']).strip(),
+        'category_slug': str(row['category_slug']).strip(),
+        'category_name': str(row.get('category_name') or row['category_slug']).strip(),
+        'section_slug': str(row['section_slug']).strip(),
+        'section_name': str(row.get('section_name') or row['section_slug']).strip(),
+        'image': str(row.get('image') or '').strip(),
+        'product': product,
+    }
+
+
+class CatalogImporter:
+    """
+    Загружает категории, разделы и товары пачками: на пачку строк выполняется
+    несколько выборок по slug, bulk_create для новых объектов и bulk_update
+    только для изменившихся. Каждая пачка записывается в своей транзакции;
+    изображения, скопированные в откатившейся пачке, удаляются из хранилища.
+    В памяти между пачками хранятся только категории и разделы.
+    """
+
+    def __init__(self, images_dir=None, chunk_size=1000):
+        self.images_dir = images_dir
+        self.chunk_size = chunk_size
+        self.categories = {}                      # slug -> Category
+        self.sections = {}                        # slug -> Section
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'images': 0}
+        self.copied_images = []                   # файлы, скопированные в текущей пачке
+
+    def run(self, rows):
+        """
+        Импортирует строки пачками. Дерево каталога не перестраивается:
+        после загрузки вызовите rebuild_catalog_tree() один раз.
+        """
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk([parse_row(line, row) for line, row in chunk])
+        return self.stats
+
+    def import_chunk(self, rows):
+        # Повторный slug внутри пачки: побеждает последняя строка, как при построчном импорте
+        rows = list({row['slug']: row for row in rows}.values())
+        self.copied_images = []
+        try:
+            with transaction.atomic():
+                changed = self.upsert_categories(rows)
+                changed += self.upsert_sections(rows)
+                changed += self.upsert_products(rows)
+                product_ids = [obj.pk for obj in changed if isinstance(obj, Product)]
+                tags = set()
+                for obj in changed:
+                    tags.update(invalidation_tags(obj))
+                transaction.on_commit(partial(response_cache.invalidate, tags))
+                for index in MEMORY_INDEXES:
+                    transaction.on_commit(partial(index.update, product_ids))
+        except BaseException:
+            # Пачка откатилась, и на скопированные в ней файлы никто не ссылается
+            storage = Product._meta.get_field('image').storage
+            for name in self.copied_images:
+                storage.delete(name)
+            raise
+        self.stats['rows'] += len(rows)
+        # При DEBUG журнал запросов с многострочными INSERT иначе растет вместе с файлом
+        reset_queries()
+
+    def upsert_categories(self, rows):
+        names = {row['category_slug']: row['category_name'] for row in rows}
+        return self._upsert_parents(Category, self.categories, names, {})
+
+    def upsert_sections(self, rows):
+        names = {row['section_slug']: row['section_name'] for row in rows}
+        categories = {row['section_slug']: self.categories[row['category_slug']].pk for row in rows}
+        return self._upsert_parents(Section, self.sections, names, {'category_id': categories})
+
+    def _upsert_parents(self, model, known, names, relations):
+        """Создает недостающие категории или разделы и обновляет изменившиеся"""
+        unknown = [slug for slug in names if slug not in known]
+        if unknown:
+            known.update(model.objects.in_bulk(unknown, field_name='slug'))
+
+        now = timezone.now()
+        created, updated = [], []
+        for slug, name in names.items():
+            values = {'name': name, **{field: mapping[slug] for field, mapping in relations.items()}}
+            obj = known.get(slug)
+            if obj is None:
+                obj = known[slug] = model(slug=slug, **values)
+                created.append(obj)
+            elif any(getattr(obj, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(obj, field, value)
+                obj.updated_at = now
+                updated.append(obj)
+        model.objects.bulk_create(created)
+        if updated:
+            model.objects.bulk_update(updated, ['name', *relations, 'updated_at'])
+        return created + updated
+
+    def upsert_products(self, rows):
+        existing = Product.objects.only('id', 'slug', 'section_id', 'image', 'image_hash', *PRODUCT_FIELDS).in_bulk(
+            [row['slug'] for row in rows], field_name='slug'
+        )
+        now = timezone.now()
+        created, updated, with_new_images = [], [], []
+        for row in rows:
+            values = dict(row['product'], section_id=self.sections[row['section_slug']].pk)
+            product = existing.get(row['slug'])
+            if product is None:
+                product = Product(slug=row['slug'], **values)
+                created.append(product)
+            elif any(getattr(product, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                updated.append(product)
+            else:
+                self.stats['unchanged'] += 1
+
+            if row['image'] and self.attach_image(product, row):
+                # Как в ProcessedImageModel.save: токен прежнего файла не должен вести к новому
+                product.image_hash = ''
+                with_new_images.append(product)
+                if product.pk is not None and product not in updated:
+                    product.updated_at = now
+                    updated.append(product)
+                    self.stats['unchanged'] -= 1
+
+        Product.objects.bulk_create(created)
+        if updated:
+            Product.objects.bulk_update(updated, [*PRODUCT_FIELDS, 'section', 'image', 'image_hash', 'updated_at'])
+        # Изображения обрабатываются фоновыми задачами, как и при сохранении через админку
+        enqueue_many(process_catalog_image, [
+            {'model': Product._meta.label_lower, 'pk': product.pk} for product in with_new_images
+        ])
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(updated)
+        self.stats['images'] += len(with_new_images)
+        return created + updated
+
+    def attach_image(self, product, row):
+        """
+        Копирует изображение товара из каталога images_dir в хранилище.
+        Файл сравнивается по имени: если у товара уже это изображение, копирования нет.
+        Возвращает True, если изображение товара изменилось.
+        """
+        if self.images_dir is None:
+            raise ImportRowError(row['line'], 'указано изображение, но не задан каталог изображений')
+        field = Product._meta.get_field('image')
+        target = field.generate_filename(product, os.path.basename(row['image']))
+        if product.image and product.image.name == target and field.storage.exists(target):
+            return False
+        source = os.path.join(self.images_dir, row['image'])
+        if not os.path.isfile(source):
+            raise ImportRowError(row['line'], f'нет файла изображения {row["image"]}')
+        if (
+            field.storage.exists(target)
+            and target not in self.copied_images
+            and not Product.objects.filter(image=target).exists()
+        ):
+            # Файл, на который не ссылается ни один товар (например, от прерванного импорта), заменяется;
+            # файл другого товара остается, а новое изображение получает свободное имя
+            field.storage.delete(target)
+        with open(source, 'rb') as f:
+            product.image.name = field.storage.save(target, File(f))
+        self.copied_images.append(product.image.name)
+        return True
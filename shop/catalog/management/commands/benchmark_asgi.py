@@ -0,0 +1,138 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.urls import include, path
+from catalog.models import Category, Section, Product
+from .benchmark_sqlite import percentile
+
+URL = '/api/catalog/categories/benchmark-asgi/sections/benchmark-asgi/products/?page_size=20'
+
+
+def urlconf(module):
+    """Корневой urlconf только с API каталога из модуля module"""
+    return type('BenchmarkURLConf', (), {
+        'urlpatterns': [path('api/catalog/', include(module, namespace='catalog_api'))],
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность синхронного API каталога под WSGI с пулом потоков '
+        'и асинхронного API под ASGI при большом числе одновременных медленных клиентов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500, help='Число одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=4, help='Запросов от каждого клиента')
+        parser.add_argument('--threads', type=int, default=32,
+                            help='Потоков WSGI-сервера (как --threads у gunicorn)')
+        parser.add_argument('--client-delay', type=float, default=1.0,
+                            help='Сколько медленный клиент принимает ответ, в секундах')
+        parser.add_argument('--cache', action='store_true', help='Не отключать кэш ответов API каталога')
+
+    def handle(self, *args, **options):
+        # Данные фиксируются в базе: ASGI выполняет запросы к ней в отдельном потоке
+        category = Category.objects.create(name='Бенчмарк ASGI', slug='benchmark-asgi')
+        try:
+            section = Section.objects.create(category=category, name='Бенчмарк ASGI', slug='benchmark-asgi')
+            Product.objects.bulk_create([
+                Product(
+                    section=section, name=f'Товар {i}', slug=f'benchmark-asgi-{i}', description='Описание товара',
+                    price=Decimal('199.90'), quantity_type='шт', quantity_value=Decimal('1.00'),
+                )
+                for i in range(200)
+            ])
+            cache_settings = {} if options['cache'] else {'CATALOG_API_CACHE_TIMEOUT': 0}
+            with override_settings(**cache_settings):
+                with override_settings(ROOT_URLCONF=urlconf('catalog.api_urls')):
+                    self.report(f'WSGI, {options["threads"]} потоков', asyncio.run(self.run_wsgi(options)), options)
+                with override_settings(ROOT_URLCONF=urlconf('catalog.async_api_urls')):
+                    self.report('ASGI, один цикл событий', asyncio.run(self.run_asgi(options)), options)
+        finally:
+            category.delete()
+
+    def report(self, title, result, options):
+        elapsed, timings, errors = result
+        self.stdout.write(
+            f'{title}: {len(timings) / elapsed:.0f} запросов/с за {elapsed:.1f} с '
+            f'({options["clients"]} клиентов, p50 {percentile(timings, 50) * 1000:.0f} мс, '
+            f'p99 {percentile(timings, 99) * 1000:.0f} мс, ошибок {errors})'
+        )
+
+    @staticmethod
+    async def clients(request, options):
+        """Запускает клиентов, каждый выполняет запросы последовательно"""
+        timings, statuses = [], []
+
+        async def client():
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                statuses.append(await request())
+                timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['clients'])))
+        elapsed = time.perf_counter() - started
+        return elapsed, timings, sum(status != 200 for status in statuses)
+
+    async def run_wsgi(self, options):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        delay = options['client_delay']
+        loop = asyncio.get_running_loop()
+
+        def serve():
+            status = []
+            environ = factory.get(URL, HTTP_HOST='localhost').environ
+            response = handler(environ, lambda code, headers: status.append(int(code.split()[0])))
+            b''.join(response)
+            response.close()
+            # Поток сервера занят, пока медленный клиент принимает ответ
+            time.sleep(delay)
+            return status[0]
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            return await self.clients(lambda: loop.run_in_executor(executor, serve), options)
+
+    async def run_asgi(self, options):
+        handler = ASGIHandler()
+        delay = options['client_delay']
+        path_info, _, query_string = URL.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path_info, 'raw_path': path_info.encode(), 'root_path': '', 'query_string': query_string.encode(),
+            'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+
+        async def serve():
+            status = []
+            done = asyncio.Event()
+            received = False
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body', False):
+                    # Медленный клиент держит соединение, но не поток
+                    await asyncio.sleep(delay)
+
+            try:
+                await handler(dict(scope), receive, send)
+            finally:
+                done.set()
+            return status[0]
+
+        return await self.clients(serve, options)
@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from catalog.models import Category, Section, Product
+from catalog.serializers import ProductSerializer, product_values_serializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость ProductSerializer и быстрой сериализации из .values() на тестовых товарах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000],
+                            help='Количество товаров в списке')
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов, берется лучшее время')
+
+    def handle(self, *args, **options):
+        # Тестовые данные создаются в транзакции, которая откатывается после замеров
+        try:
+            with transaction.atomic():
+                self.run(options['sizes'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, repeat):
+        category = Category.objects.create(name='Бенчмарк', slug='benchmark-category')
+        section = Section.objects.create(category=category, name='Бенчмарк', slug='benchmark-section')
+        Product.objects.bulk_create([
+            Product(
+                section=section, name=f'Товар {i}', slug=f'benchmark-{i}', description='Описание товара',
+                image=f'products/benchmark-{i}.jpg', image_hash=f'{i:064x}',
+                price=Decimal('199.90'), quantity_type='шт', quantity_value=Decimal('1.00'),
+            )
+            for i in range(max(sizes))
+        ], batch_size=1000)
+        request = RequestFactory().get('/api/catalog/', HTTP_HOST='localhost')
+        renderer = JSONRenderer()
+
+        for size in sizes:
+            queryset = Product.objects.filter(section=section).order_by('name', 'id')[:size]
+
+            def standard():
+                return renderer.render(ProductSerializer(queryset, many=True, context={'request': request}).data)
+
+            def fast():
+                rows = product_values_serializer.rows(queryset)
+                return renderer.render(product_values_serializer.serialize(rows, request))
+
+            standard_time, standard_body = self.measure(standard, repeat)
+            fast_time, fast_body = self.measure(fast, repeat)
+            identical = 'да' if standard_body == fast_body else 'НЕТ'
+            self.stdout.write(
+                f'{size} товаров: ModelSerializer {standard_time * 1000:.0f} мс '
+                f'({size / standard_time:.0f} строк/с), .values() {fast_time * 1000:.0f} мс '
+                f'({size / fast_time:.0f} строк/с), ускорение ×{standard_time / fast_time:.1f}, '
+                f'ответы совпадают: {identical}'
+            )
+
+    @staticmethod
+    def measure(func, repeat):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
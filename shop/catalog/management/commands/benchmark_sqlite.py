@@ -0,0 +1,137 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Настройки SQLite по умолчанию, как у Django без OPTIONS: журнал отката, BEGIN DEFERRED, timeout 5 с
+DEFAULT_OPTIONS = {'init_command': '', 'transaction_mode': None, 'timeout': 5}
+
+SECTIONS = 50
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения SQLite во время непрерывной записи '
+        'с настройками по умолчанию и с профилем SQLITE_PRODUCTION_OPTIONS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Число читающих потоков')
+        parser.add_argument('--writers', type=int, default=4, help='Число пишущих потоков')
+        parser.add_argument('--duration', type=float, default=5, help='Длительность замера, в секундах')
+        parser.add_argument('--products', type=int, default=20000, help='Количество товаров в тестовой базе')
+
+    def handle(self, *args, **options):
+        profiles = [('По умолчанию', DEFAULT_OPTIONS), ('SQLITE_PRODUCTION', settings.SQLITE_PRODUCTION_OPTIONS)]
+        for title, sqlite_options in profiles:
+            # Каждый профиль — в своей временной базе, рабочая база не затрагивается
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                self.seed(path, options['products'])
+                result = self.run(path, sqlite_options, options)
+            self.stdout.write(
+                f'{title}: чтение {result["reads"] / options["duration"]:.0f}/с '
+                f'(p50 {percentile(result["read_times"], 50) * 1000:.2f} мс, '
+                f'p99 {percentile(result["read_times"], 99) * 1000:.2f} мс, ошибок {result["read_errors"]}), '
+                f'запись {result["writes"] / options["duration"]:.0f}/с '
+                f'(p99 {percentile(result["write_times"], 99) * 1000:.2f} мс, «database is locked» {result["write_errors"]})'
+            )
+
+    @staticmethod
+    def connect(path, sqlite_options):
+        connection = sqlite3.connect(
+            path, timeout=sqlite_options.get('timeout', 5), isolation_level=None, check_same_thread=False
+        )
+        for command in sqlite_options.get('init_command', '').split(';'):
+            if command.strip():
+                connection.execute(command)
+        return connection
+
+    def seed(self, path, products):
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.executescript('''
+            CREATE TABLE product (id INTEGER PRIMARY KEY, section_id INTEGER, name TEXT, price REAL, stock INTEGER);
+            CREATE INDEX product_section_name ON product (section_id, name);
+            CREATE TABLE purchase (id INTEGER PRIMARY KEY, product_id INTEGER, quantity INTEGER, created_at REAL);
+        ''')
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO product (section_id, name, price, stock) VALUES (?, ?, ?, ?)',
+            ((i % SECTIONS, f'Товар {i}', 199.9, 1_000_000) for i in range(products)),
+        )
+        connection.execute('COMMIT')
+        connection.close()
+
+    def run(self, path, sqlite_options, options):
+        begin = f'BEGIN {sqlite_options.get("transaction_mode") or ""}'.strip()
+        stop = threading.Event()
+        result = {'reads': 0, 'read_errors': 0, 'read_times': [], 'writes': 0, 'write_errors': 0, 'write_times': []}
+        lock = threading.Lock()
+
+        def reader():
+            connection = self.connect(path, sqlite_options)
+            reads, errors, timings = 0, 0, []
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    # Запрос списка товаров раздела, как в API каталога
+                    connection.execute(
+                        'SELECT id, name, price, stock FROM product WHERE section_id = ? ORDER BY name LIMIT 50',
+                        [random.randrange(SECTIONS)],
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    errors += 1
+                    continue
+                timings.append(time.perf_counter() - started)
+                reads += 1
+            connection.close()
+            with lock:
+                result['reads'] += reads
+                result['read_errors'] += errors
+                result['read_times'] += timings
+
+        def writer():
+            connection = self.connect(path, sqlite_options)
+            writes, errors, timings = 0, 0, []
+            while not stop.is_set():
+                product_id = random.randrange(1, options['products'] + 1)
+                started = time.perf_counter()
+                try:
+                    # Покупка: списание остатка и запись о покупке в одной транзакции
+                    connection.execute(begin)
+                    connection.execute('UPDATE product SET stock = stock - 1 WHERE id = ? AND stock > 0', [product_id])
+                    connection.execute(
+                        'INSERT INTO purchase (product_id, quantity, created_at) VALUES (?, 1, ?)', [product_id, time.time()]
+                    )
+                    connection.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    errors += 1
+                    continue
+                timings.append(time.perf_counter() - started)
+                writes += 1
+            connection.close()
+            with lock:
+                result['writes'] += writes
+                result['write_errors'] += errors
+                result['write_times'] += timings
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return result
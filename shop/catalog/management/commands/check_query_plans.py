@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.query_plans import check_catalog_query_plans
+
+
+class Command(BaseCommand):
+    help = 'Проверяет планы запросов API каталога и завершается ошибкой при полном просмотре таблиц'
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, (plan, full_scans) in check_catalog_query_plans().items():
+            if full_scans:
+                failures.append(f"{name}: {', '.join(full_scans)}")
+                self.stdout.write(self.style.ERROR(f'{name}: полный просмотр {", ".join(full_scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError('Запросы каталога без индекса: ' + '; '.join(failures))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from catalog.export import EXPORT_FORMATS, export_catalog
+
+
+class Command(BaseCommand):
+    help = 'Выгружает товары с разделами и категориями в NDJSON или CSV потоком, без загрузки каталога в память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson', help='Формат выгрузки')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию стандартный вывод)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк в одной выборке из курсора')
+
+    def handle(self, *args, **options):
+        lines = export_catalog(options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from catalog.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Возвращает на склад товар из просроченных резервов (запускается по расписанию)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Возвращено резервов: {release_expired()}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.models import Product
+from catalog.stock import set_stock
+
+
+class Command(BaseCommand):
+    help = 'Устанавливает остаток товара; --shards распределяет его по шардам для товаров с высоким спросом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help='slug товара')
+        parser.add_argument('quantity', help='Остаток или none, чтобы отключить учет остатка')
+        parser.add_argument('--shards', type=int, default=0, help='Число шардов остатка (0 — без шардов)')
+
+    def handle(self, *args, **options):
+        product_id = Product.objects.filter(slug=options['slug']).values_list('pk', flat=True).first()
+        if product_id is None:
+            raise CommandError(f'Товар {options["slug"]} не найден')
+        if options['quantity'].lower() == 'none':
+            quantity = None
+        elif options['quantity'].isdigit():
+            quantity = int(options['quantity'])
+        else:
+            raise CommandError('Остаток должен быть неотрицательным целым числом или none')
+        if options['shards'] < 0:
+            raise CommandError('Число шардов не может быть отрицательным')
+        set_stock(product_id, quantity, shards=options['shards'])
+        self.stdout.write(f'Остаток товара {options["slug"]}: {quantity}, шардов: {options["shards"] if quantity is not None else 0}')
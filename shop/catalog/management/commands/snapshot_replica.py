@@ -0,0 +1,26 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from shop.db import snapshot_database
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик (DB_REPLICA_PATHS), однократно или периодически'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Файлы реплик; по умолчанию DB_REPLICA_PATHS')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять копирование каждые N секунд; 0 — скопировать один раз')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or settings.DB_REPLICA_PATHS
+        if not paths:
+            raise CommandError('Не заданы файлы реплик: укажите их аргументами или в DB_REPLICA_PATHS')
+        while True:
+            started = time.perf_counter()
+            for path in paths:
+                snapshot_database(path)
+            self.stdout.write(f'Снимок базы записан в {", ".join(paths)} за {(time.perf_counter() - started) * 1000:.0f} мс')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,127 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Файловый объект, который читает только заданный диапазон байтов"""
+
+    def __init__(self, f, start, length):
+        self._file = f
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном.
+    Возвращает (start, end) включительно, None для игнорируемого заголовка
+    или False, если диапазон невыполним.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Суффиксный диапазон: последние N байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def _offload_response(path):
+    """Ответ, передающий отдачу файла веб-серверу, или None, если разгрузка не настроена"""
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', None)
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    if accel_prefix and path.startswith(media_root + os.sep):
+        response = HttpResponse()
+        relative = os.path.relpath(path, media_root).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative)
+        return response
+    if getattr(settings, 'MEDIA_X_SENDFILE', False):
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def serve_file(request, path, content_type=None, cache_control=None):
+    """
+    Отдает файл с поддержкой ETag/Last-Modified (ответ 304), диапазонов (Range, 206)
+    и разгрузки через X-Accel-Redirect или X-Sendfile. Без разгрузки файл отдается
+    FileResponse, который использует wsgi.file_wrapper (sendfile) при его наличии.
+    """
+    path = os.path.realpath(path)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("Файл не найден")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("Файл не найден")
+
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    last_modified = http_date(st.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        response = _offload_response(path)
+    if response is None:
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, st.st_mtime):
+            byte_range = parse_range(request.META['HTTP_RANGE'], st.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+        elif byte_range is not None:
+            start, end = byte_range
+            response = FileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+        else:
+            response = FileResponse(open(path, 'rb'))
+
+    if response.status_code != 304:
+        response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Accept-Ranges'] = 'bytes'
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
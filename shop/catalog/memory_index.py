@@ -0,0 +1,158 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db.models import Count, Max
+from shop.routers import primary_reads
+from .models import Category, Section, Product
+from .response_cache import response_cache
+
+# Индекс еще не сверялся с базой
+_UNCHECKED = object()
+
+
+def searchable_products():
+    """Товары, которые показываются в каталоге и участвуют в поиске и фасетах"""
+    return Product.objects.filter(
+        available=True,
+        section__available=True,
+        section__category__available=True,
+    )
+
+
+def catalog_stamp():
+    """
+    Отметка состояния каталога: число строк и последнее updated_at товаров, разделов
+    и категорий. Меняется при любом добавлении, изменении и удалении, в том числе
+    сделанном в другом процессе или массовыми запросами без сигналов.
+    """
+    return tuple(
+        tuple(model.objects.aggregate(count=Count('id'), updated=Max('updated_at')).values())
+        for model in (Category, Section, Product)
+    )
+
+
+class ProductMemoryIndex:
+    """
+    Базовый класс для структур в памяти процесса, построенных по доступным товарам.
+    Индекс строится один раз при первом обращении и дальше обновляется точечно
+    при изменении товаров, разделов и категорий в этом процессе. Изменения из других
+    процессов (воркеры, админка, import_catalog) обнаруживаются сравнением catalog_stamp()
+    со значением при построении не чаще раза в CATALOG_INDEX_CHECK_INTERVAL секунд;
+    если отметка изменилась, индекс перестраивается.
+    Каждая сверка запоминает метку сброса кэша ответов (response_cache.epoch()): пока она
+    не изменилась, индекс совпадает с базой и с индексами других процессов (см. state()).
+    Подклассы задают fields и реализуют _reset, _add и _remove.
+    """
+    fields = ()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._stamp = None
+        self._checked_at = 0
+        self._checked_epoch = _UNCHECKED
+        self._generation = None
+        self._reset()
+
+    @property
+    def built(self):
+        return self._built
+
+    def build(self):
+        """Полностью перестраивает индекс по базе данных"""
+        with self._lock:
+            self._built = False
+            self._reset()
+            # Отметка берется до чтения товаров: изменения во время построения заметит следующая проверка.
+            # Метка сброса — еще раньше: сброс после нее означает изменения, которых индекс мог не увидеть
+            self._checked_epoch = response_cache.epoch()
+            # Индекс живет до следующей сверки, поэтому строится по основной базе, а не по реплике
+            with primary_reads():
+                self._stamp = catalog_stamp()
+                self._checked_at = time.monotonic()
+                rows = searchable_products().values('id', *self.fields).iterator(chunk_size=2000)
+                for row in rows:
+                    self._add(row)
+            self._finish_build()
+            self._generation = uuid.uuid4().hex
+            self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.build()
+        elif self._check_due():
+            epoch = response_cache.epoch()
+            with primary_reads():
+                stamp = catalog_stamp()
+            if stamp != self._stamp:
+                self.build()
+            else:
+                self._checked_epoch = epoch
+
+    def state(self, epoch):
+        """
+        Состояние индекса для валидаторов ответа; epoch — текущий response_cache.epoch().
+        None, если после сверки индекса с базой кэш не сбрасывался: тогда ответы по индексу
+        зависят только от данных в базе и одинаковы во всех процессах. Иначе индекс мог
+        пропустить изменения других процессов, и возвращается его поколение в этом процессе,
+        которое меняется при каждом изменении индекса.
+        """
+        self.ensure_built()
+        with self._lock:
+            if self._checked_epoch == epoch:
+                return None
+            return self._generation
+
+    def _check_due(self):
+        interval = getattr(settings, 'CATALOG_INDEX_CHECK_INTERVAL', 30)
+        with self._lock:
+            if not interval or time.monotonic() - self._checked_at < interval:
+                return False
+            # Проверку выполняет один поток, остальные до следующего интервала ее пропускают
+            self._checked_at = time.monotonic()
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._built = False
+            self._reset()
+
+    def update(self, product_ids):
+        """Переиндексирует указанные товары, удаляя недоступные из индекса"""
+        product_ids = set(product_ids)
+        if not self._built or not product_ids:
+            return
+        rows = list(searchable_products().filter(pk__in=product_ids).values('id', *self.fields))
+        with self._lock:
+            for product_id in product_ids:
+                self._remove(product_id)
+            for row in rows:
+                self._add(row)
+            self._generation = uuid.uuid4().hex
+
+    def update_where(self, **filters):
+        """Переиндексирует все товары, подходящие под фильтр (например, товары раздела)"""
+        if not self._built:
+            return
+        self.update(Product.objects.filter(**filters).values_list('pk', flat=True))
+
+    def remove(self, product_ids):
+        if not self._built:
+            return
+        with self._lock:
+            for product_id in product_ids:
+                self._remove(product_id)
+            self._generation = uuid.uuid4().hex
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _finish_build(self):
+        pass
+
+    def _add(self, row):
+        raise NotImplementedError
+
+    def _remove(self, product_id):
+        raise NotImplementedError
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_alter_category_available'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('available', True)), fields=['name'], name='category_available_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['section', 'name'], name='product_sec_avail_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='section',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'name'], name='section_cat_avail_name_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:13
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q
+
+
+def mark_sold_out_products(apps, schema_editor):
+    # Скрытые товары с нулевым остатком были сняты с продажи учетом остатка
+    Product = apps.get_model('catalog', 'Product')
+    StockShard = apps.get_model('catalog', 'StockShard')
+    stocked_shard = StockShard.objects.filter(product=OuterRef('pk'), quantity__gt=0)
+    Product.objects.filter(available=False).filter(
+        Q(stock_shards=0, stock=0) | Q(stock_shards__gt=0) & ~Exists(stocked_shard)
+    ).update(sold_out=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sold_out',
+            field=models.BooleanField(default=False, editable=False, help_text='Снят с продажи из-за нулевого остатка и вернется при пополнении', verbose_name='Закончился'),
+        ),
+        migrations.RunPython(mark_sold_out_products, migrations.RunPython.noop),
+    ]
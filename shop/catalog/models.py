@@ -1,11 +1,53 @@
 from django.db import models
 from django.urls import reverse
-from PIL import Image
-import os
+from tasks.queue import enqueue
+from .images import crop_to_square, fit_within, process_catalog_image
 
 # Create your models here.
 
-class Category(models.Model):
+class ProcessedImageModel(models.Model):
+    """
+    Базовая модель с изображением, которое обрабатывается фоновой задачей.
+    Задача ставится в очередь только при смене файла изображения, поэтому
+    сохранение цены или флага доступности не обращается к диску.
+    """
+    image_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Хеш изображения')
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._loaded_image_name = instance.image.name
+        return instance
+
+    def image_changed(self):
+        if not self.image:
+            return False
+        return not self.image._committed or self.image.name != getattr(self, '_loaded_image_name', None)
+
+    def save(self, *args, **kwargs):
+        """Ставит обработку изображения в очередь, если файл изображения изменился"""
+        image_changed = self.image_changed()
+        if image_changed:
+            # Хеш прежнего файла убирается сразу: иначе до обработки ссылки на варианты
+            # с его токеном (кэшируемые навсегда) вели бы к новому изображению
+            self.image_hash = ''
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'image_hash'}
+        super().save(*args, **kwargs)
+        if image_changed:
+            enqueue(process_catalog_image, model=self._meta.label_lower, pk=self.pk)
+        self._loaded_image_name = self.image.name
+
+    def process_image(self, path):
+        raise NotImplementedError
+
+
+class Category(ProcessedImageModel):
     """Модель для категорий товаров"""
     name = models.CharField(max_length=100, verbose_name='Название категории')
     slug = models.SlugField(max_length=100, unique=True, verbose_name='URL')
@@ -18,6 +60,9 @@ class Category(models.Model):
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], condition=models.Q(available=True), name='category_available_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -25,37 +70,12 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('category_detail', kwargs={'slug': self.slug})
     
-    def save(self, *args, **kwargs):
-        """Изменение размера изображения при сохранении и обрезка до квадрата"""
-        super().save(*args, **kwargs)
-        
-        if self.image:
-            img = Image.open(self.image.path)
-            
-            # Обрезаем изображение до квадрата
-            width, height = img.size
-            
-            # Определяем размер для обрезки (берем минимальную сторону)
-            size = min(width, height)
-            
-            # Вычисляем координаты для обрезки из центра
-            left = (width - size) / 2
-            top = (height - size) / 2
-            right = (width + size) / 2
-            bottom = (height + size) / 2
-            
-            # Обрезаем изображение
-            img = img.crop((left, top, right, bottom))
-            
-            # Масштабируем до нужного размера
-            output_size = (300, 300)
-            img.thumbnail(output_size)
-            
-            # Сохраняем изображение
-            img.save(self.image.path)
-
-
-class Section(models.Model):
+    def process_image(self, path):
+        """Обрезка изображения до квадрата и изменение размера до 300×300"""
+        crop_to_square(path, 300)
+
+
+class Section(ProcessedImageModel):
     """Модель для разделов категорий"""
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='sections', verbose_name='Категория')
     name = models.CharField(max_length=100, verbose_name='Название раздела')
@@ -69,6 +89,10 @@ class Section(models.Model):
         verbose_name = 'Раздел'
         verbose_name_plural = 'Разделы'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['category', 'name'], condition=models.Q(available=True),
+                         name='section_cat_avail_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -76,37 +100,12 @@ class Section(models.Model):
     def get_absolute_url(self):
         return reverse('section_detail', kwargs={'category_slug': self.category.slug, 'slug': self.slug})
     
-    def save(self, *args, **kwargs):
-        """Изменение размера изображения при сохранении и обрезка до квадрата"""
-        super().save(*args, **kwargs)
-        
-        if self.image:
-            img = Image.open(self.image.path)
-            
-            # Обрезаем изображение до квадрата
-            width, height = img.size
-            
-            # Определяем размер для обрезки (берем минимальную сторону)
-            size = min(width, height)
-            
-            # Вычисляем координаты для обрезки из центра
-            left = (width - size) / 2
-            top = (height - size) / 2
-            right = (width + size) / 2
-            bottom = (height + size) / 2
-            
-            # Обрезаем изображение
-            img = img.crop((left, top, right, bottom))
-            
-            # Масштабируем до нужного размера
-            output_size = (300, 300)
-            img.thumbnail(output_size)
-            
-            # Сохраняем изображение
-            img.save(self.image.path)
-
-
-class Product(models.Model):
+    def process_image(self, path):
+        """Обрезка изображения до квадрата и изменение размера до 300×300"""
+        crop_to_square(path, 300)
+
+
+class Product(ProcessedImageModel):
     """Модель для товаров"""
     section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='products', verbose_name='Раздел')
     name = models.CharField(max_length=200, verbose_name='Название товара')
@@ -118,6 +117,13 @@ class Product(models.Model):
                                    help_text='Например: кг, гр, л, мл и т.д.')
     quantity_value = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Значение количества')
     available = models.BooleanField(default=True, verbose_name='Доступен')
+    stock = models.PositiveIntegerField(null=True, blank=True, verbose_name='Остаток',
+                                        help_text='Пусто — остаток не учитывается. '
+                                                  'Для товара с шардами значение распределяется между ними')
+    stock_shards = models.PositiveSmallIntegerField(default=0, verbose_name='Шарды остатка',
+                                                    help_text='0 — остаток хранится в строке товара')
+    sold_out = models.BooleanField(default=False, editable=False, verbose_name='Закончился',
+                                   help_text='Снят с продажи из-за нулевого остатка и вернется при пополнении')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
@@ -125,6 +131,12 @@ class Product(models.Model):
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['section', 'name'], condition=models.Q(available=True),
+                         name='product_sec_avail_name_idx'),
+            # Сортировка и поиск по началу названия в админке для всех товаров
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -134,13 +146,42 @@ class Product(models.Model):
                                                'section_slug': self.section.slug, 
                                                'slug': self.slug})
     
-    def save(self, *args, **kwargs):
-        """Изменение размера изображения при сохранении"""
-        super().save(*args, **kwargs)
-        
-        if self.image:
-            img = Image.open(self.image.path)
-            if img.height > 500 or img.width > 500:
-                output_size = (500, 500)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
+    def process_image(self, path):
+        """Изменение размера изображения до 500×500"""
+        fit_within(path, 500)
+
+
+class StockShard(models.Model):
+    """
+    Часть остатка товара с высоким спросом. Покупатели списывают товар из разных
+    шардов, поэтому не ждут друг друга на блокировке одной строки товара.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_set', verbose_name='Товар')
+    index = models.PositiveSmallIntegerField(verbose_name='Номер')
+    quantity = models.PositiveIntegerField(default=0, verbose_name='Остаток')
+
+    class Meta:
+        verbose_name = 'Шард остатка'
+        verbose_name_plural = 'Шарды остатка'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'index'], name='stock_shard_product_index_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}#{self.index}: {self.quantity}'
+
+
+class StockReservation(models.Model):
+    """Списанный с остатка товар, который вернется на склад, если резерв не подтвердят до expires_at"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations', verbose_name='Товар')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Действует до')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        ordering = ['expires_at']
+
+    def __str__(self):
+        return f'{self.product_id} × {self.quantity} до {self.expires_at:%d.%m.%Y %H:%M}'
@@ -0,0 +1,133 @@
+import base64
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class NameKeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по полю name с id в качестве второго ключа.
+    Курсор хранит последнюю выданную пару (name, id), поэтому страница
+    выбирается условием WHERE, а не OFFSET, и время ответа не зависит
+    от глубины страницы.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset для асинхронных представлений: страница читается через async for"""
+        queryset = self.page_queryset(queryset, request)
+        return self.set_page([item async for item in queryset])
+
+    def page_queryset(self, queryset, request):
+        """Запрос страницы: условие по курсору и на одну строку больше размера страницы"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            name, pk, reverse = None, None, False
+        else:
+            name, pk, reverse = cursor
+
+        if reverse:
+            queryset = queryset.order_by('-name', '-id')
+            if name is not None:
+                queryset = queryset.filter(Q(name__lt=name) | Q(name=name, id__lt=pk))
+        else:
+            queryset = queryset.order_by('name', 'id')
+            if name is not None:
+                queryset = queryset.filter(Q(name__gt=name) | Q(name=name, id__gt=pk))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        cursor = self.cursor
+        reverse = cursor is not None and cursor[2]
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link((*self.cursor_position(self.page[-1]), False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.build_link((*self.cursor_position(self.page[0]), True))
+
+    @staticmethod
+    def cursor_position(item):
+        """Пара (name, id) объекта модели или строки .values()"""
+        if isinstance(item, dict):
+            return item['name'], item['id']
+        return item.name, item.pk
+
+    def build_link(self, cursor):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(cursor))
+
+    def encode_cursor(self, cursor):
+        name, pk, reverse = cursor
+        payload = json.dumps({'n': name, 'i': pk, 'r': int(reverse)}, ensure_ascii=False)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            return str(payload['n']), int(payload['i']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,63 @@
+import re
+from django.db.models import Q
+from django.test import RequestFactory
+from rest_framework.request import Request
+from . import api_views
+from .models import Section, Product
+
+# Признаки полного просмотра таблицы в планах SQLite и PostgreSQL
+FULL_SCAN_PATTERNS = [
+    re.compile(r'\bSCAN (?!CONSTANT\b)(\w+)(?! USING)(?:\s|$)'),
+    re.compile(r'\bSeq Scan on (\w+)'),
+]
+
+# Значения-заглушки для параметров URL: план запроса не зависит от конкретных slug
+SAMPLE_KWARGS = {'category_slug': 'category', 'section_slug': 'section', 'slug': 'item'}
+
+
+def _view_queryset(view_class, query_params=None):
+    request = Request(RequestFactory().get('/', query_params or {}))
+    return view_class(kwargs=SAMPLE_KWARGS, request=request).get_queryset()
+
+
+def catalog_api_querysets():
+    """Возвращает запросы, которые выполняют API каталога, с их названиями"""
+    return {
+        'category_list': _view_queryset(api_views.CategoryListAPIView),
+        'category_detail': _view_queryset(api_views.CategoryDetailAPIView).filter(slug='item'),
+        'category_detail.sections': Section.objects.filter(available=True, category_id__in=[1]),
+        'section_list': _view_queryset(api_views.SectionListAPIView).order_by('name', 'id'),
+        'section_list.next_page': _view_queryset(api_views.SectionListAPIView).order_by('name', 'id').filter(
+            Q(name__gt='item') | Q(name='item', id__gt=1)
+        ),
+        'section_detail': _view_queryset(api_views.SectionDetailAPIView).filter(slug='item'),
+        'section_detail.products': Product.objects.filter(available=True, section_id__in=[1]),
+        'product_list': _view_queryset(api_views.ProductListAPIView).order_by('name', 'id'),
+        'product_list.next_page': _view_queryset(api_views.ProductListAPIView).order_by('name', 'id').filter(
+            Q(name__gt='item') | Q(name='item', id__gt=1)
+        ),
+        'product_list.filtered': _view_queryset(
+            api_views.ProductListAPIView, {'price_min': '100', 'price_max': '500', 'quantity_type': 'кг'}
+        ).order_by('name', 'id'),
+        'product_detail': _view_queryset(api_views.ProductDetailAPIView).filter(slug='item'),
+    }
+
+
+def find_full_scans(plan):
+    """Возвращает имена таблиц, которые план читает полным просмотром"""
+    tables = []
+    for pattern in FULL_SCAN_PATTERNS:
+        tables.extend(pattern.findall(plan))
+    return tables
+
+
+def check_catalog_query_plans():
+    """
+    Выполняет EXPLAIN для каждого запроса API каталога.
+    Возвращает словарь {название запроса: (план, таблицы с полным просмотром)}.
+    """
+    report = {}
+    for name, queryset in catalog_api_querysets().items():
+        plan = queryset.explain()
+        report[name] = (plan, find_full_scans(plan))
+    return report
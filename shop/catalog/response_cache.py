@@ -0,0 +1,291 @@
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+from shop.routers import read_from_replica
+
+# Тег, который сбрасывается при любом изменении каталога
+CATALOG_TAG = 'catalog'
+
+
+def object_tags(kind, pks):
+    """Теги отдельных объектов: сбрасываются при изменении или удалении объекта"""
+    return [f'{kind}:{pk}' for pk in pks]
+
+
+def invalidation_tags(instance):
+    """
+    Теги, которые сбрасывает изменение объекта каталога: сам объект, набор объектов
+    его родителя (categories, sections:<id категории>, products:<id раздела>) и CATALOG_TAG.
+    """
+    kind = instance._meta.model_name
+    if kind == 'category':
+        collection = 'categories'
+    elif kind == 'section':
+        collection = f'sections:{instance.category_id}'
+    else:
+        collection = f'products:{instance.section_id}'
+    return [f'{kind}:{instance.pk}', collection, CATALOG_TAG]
+
+
+class TaggedResponseCache:
+    """
+    Кэш ответов API с инвалидацией по тегам.
+    Для каждого тега в кэше хранится случайная версия; запись кэша запоминает версии
+    своих тегов и считается устаревшей, если хотя бы одна из них изменилась.
+    Сброс тега — удаление его версии, поэтому схема не требует атомарных операций
+    и работает и с файловым кэшем. Кэш должен быть общим для всех процессов (CACHES):
+    с locmem сброс тегов не дошел бы до других воркеров.
+    """
+
+    def __init__(self, prefix='catalog_api', alias=None, timeout=None, lock_timeout=10, poll_interval=0.05):
+        self.prefix = prefix
+        self._alias = alias
+        self._timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._locks = {}                # ключ -> [блокировка, число ожидающих]
+        self._async_locks = {}          # ключ -> [asyncio.Lock, число ожидающих]
+        self._locks_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self._alias or getattr(settings, 'CATALOG_API_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'CATALOG_API_CACHE_TIMEOUT', 300)
+
+    @property
+    def enabled(self):
+        return self.timeout != 0
+
+    def key(self, name):
+        return f'{self.prefix}:response:{name}'
+
+    def _tag_key(self, tag):
+        return f'{self.prefix}:tag:{tag}'
+
+    def _epoch_key(self):
+        return f'{self.prefix}:epoch'
+
+    def tag_versions(self, tags):
+        """Возвращает текущие версии тегов, создавая недостающие"""
+        keys = {self._tag_key(tag): tag for tag in tags}
+        versions = self.cache.get_many(keys)
+        missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+        for key, version in missing.items():
+            # add() не перезапишет версию, созданную параллельно другим процессом
+            if not self.cache.add(key, version, timeout=None):
+                version = self.cache.get(key, version)
+            versions[key] = version
+        return {keys[key]: version for key, version in versions.items()}
+
+    def epoch(self):
+        """Метка, которая меняется при каждой инвалидации"""
+        return self.cache.get(self._epoch_key())
+
+    def is_settled(self, epoch):
+        """
+        Прошло ли REPLICA_PIN_SECONDS с инвалидации, давшей метку epoch. За это время
+        реплики догоняют основную базу (см. PrimaryPinMiddleware), и прочитанные из них
+        данные можно сохранять в кэш.
+        """
+        if epoch is None:
+            return True
+        try:
+            invalidated_at = float(epoch.partition(':')[0])
+        except ValueError:
+            return True
+        return time.time() - invalidated_at >= getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def get(self, key):
+        """Возвращает значение, если ни один из его тегов не был сброшен после записи"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        versions = self.cache.get_many([self._tag_key(tag) for tag in entry['tags']])
+        for tag, version in entry['tags'].items():
+            if versions.get(self._tag_key(tag)) != version:
+                return None
+        return entry['value']
+
+    def set(self, key, value, tags, epoch):
+        """
+        Сохраняет значение с тегами. epoch — результат epoch(), полученный до чтения данных:
+        если с тех пор была инвалидация, данные могли устареть и не сохраняются.
+        """
+        versions = self.tag_versions(set(tags))
+        # invalidate() сначала меняет метку, затем сбрасывает теги, поэтому проверка
+        # после чтения версий гарантирует, что прочитаны версии до любого сброса
+        if self.epoch() != epoch:
+            return False
+        self.cache.set(key, {'value': value, 'tags': versions}, timeout=self.timeout)
+        return True
+
+    # Асинхронные версии для представлений под ASGI: каждая выполняет все обращения
+    # синхронного метода к кэшу за один переход в поток, не блокируя цикл событий
+    async def aget(self, key):
+        return await sync_to_async(self.get)(key)
+
+    async def aepoch(self):
+        return await sync_to_async(self.epoch)()
+
+    async def aset(self, key, value, tags, epoch):
+        return await sync_to_async(self.set)(key, value, tags, epoch)
+
+    def invalidate(self, tags):
+        # Метка начинается со времени сброса для is_settled()
+        self.cache.set(self._epoch_key(), f'{time.time():.6f}:{uuid.uuid4().hex}', timeout=None)
+        self.cache.delete_many([self._tag_key(tag) for tag in tags])
+
+    @contextmanager
+    def _local_lock(self, key):
+        # Блокировка удаляется, когда ее никто не ждет, чтобы словарь не рос с числом адресов
+        with self._locks_lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    @contextmanager
+    def single_flight(self, key):
+        """
+        Пропускает к вычислению значения по ключу только одного исполнителя.
+        Потоки процесса ждут на локальной блокировке, другие процессы — пока
+        не исчезнет блокировка в кэше. По истечении lock_timeout ожидающий
+        вычисляет значение сам, чтобы зависший исполнитель не блокировал ответы.
+        """
+        lock_key = f'{key}:lock'
+        with self._local_lock(key):
+            owner = self.cache.add(lock_key, 1, timeout=self.lock_timeout)
+            if not owner:
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline and self.cache.get(lock_key) is not None:
+                    if self.get(key) is not None:
+                        break
+                    time.sleep(self.poll_interval)
+            try:
+                yield
+            finally:
+                if owner:
+                    self.cache.delete(lock_key)
+
+
+    @asynccontextmanager
+    async def _async_local_lock(self, key):
+        with self._locks_lock:
+            entry = self._async_locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._async_locks[key]
+
+    @asynccontextmanager
+    async def asingle_flight(self, key):
+        """
+        single_flight() для цикла событий: задачи процесса ждут на asyncio.Lock,
+        другие процессы и синхронные потоки — на той же блокировке в кэше.
+        """
+        lock_key = f'{key}:lock'
+        async with self._async_local_lock(key):
+            owner = await self.cache.aadd(lock_key, 1, timeout=self.lock_timeout)
+            if not owner:
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline and await self.cache.aget(lock_key) is not None:
+                    if await self.aget(key) is not None:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+            try:
+                yield
+            finally:
+                if owner:
+                    await self.cache.adelete(lock_key)
+
+
+response_cache = TaggedResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Кэширует данные успешных ответов API каталога вместе с ETag и Last-Modified.
+    При попадании в кэш не выполняются ни запросы к базе, ни сериализация.
+    Теги записи возвращает get_cache_tags(data) после построения ответа.
+    """
+
+    def get_cache_tags(self, data):
+        return [CATALOG_TAG]
+
+    def is_cacheable(self):
+        """Можно ли сохранить построенный ответ в общий кэш"""
+        return True
+
+    def get_object(self):
+        # Детальные API используют загруженный объект для вычисления тегов
+        self.object = super().get_object()
+        return self.object
+
+    def get(self, request, *args, **kwargs):
+        if not response_cache.enabled:
+            return super().get(request, *args, **kwargs)
+
+        key = response_cache.key(request.build_absolute_uri())
+        entry = response_cache.get(key)
+        if entry is None:
+            with response_cache.single_flight(key):
+                entry = response_cache.get(key)
+                if entry is None:
+                    epoch = response_cache.epoch()
+                    settled = response_cache.is_settled(epoch)
+                    response = super().get(request, *args, **kwargs)
+                    # Ответ из реплики сразу после инвалидации мог не увидеть изменений
+                    # и не сохраняется: из кэша его получили бы все клиенты
+                    if (
+                        response.status_code == 200 and self.is_cacheable()
+                        and (settled or not read_from_replica())
+                    ):
+                        entry = {
+                            'data': response.data,
+                            'etag': response.get('ETag'),
+                            'last_modified': response.get('Last-Modified'),
+                        }
+                        response_cache.set(key, entry, self.get_cache_tags(response.data), epoch)
+                    return response
+        return self.cached_response(request, entry)
+
+    def cached_response(self, request, entry):
+        return cached_entry_response(request, entry, Response)
+
+
+def cached_entry_response(request, entry, response_class):
+    """Ответ из записи кэша: 304 по ETag и Last-Modified записи или response_class(данные)"""
+    last_modified = parse_http_date_safe(entry['last_modified']) if entry['last_modified'] else None
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=last_modified)
+    if response is None:
+        response = response_class(entry['data'])
+    if entry['etag']:
+        response['ETag'] = entry['etag']
+    if entry['last_modified']:
+        response['Last-Modified'] = entry['last_modified']
+    patch_cache_control(response, no_cache=True)
+    return response
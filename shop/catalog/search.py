@@ -0,0 +1,142 @@
+import bisect
+import heapq
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from .memory_index import ProductMemoryIndex
+from .stemmer import stem
+
+# Вес совпадения в зависимости от поля товара
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'section__name': 1.5,
+    'section__category__name': 1.0,
+    'description': 0.5,
+}
+
+TOKEN_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-яё]')
+
+
+@lru_cache(maxsize=100000)
+def normalize(token):
+    """Приводит слово к основе; словарь каталога небольшой, поэтому основы кэшируются"""
+    return stem(token) if CYRILLIC_RE.search(token) else token
+
+
+def tokenize(text):
+    """Разбивает текст на нормализованные термины"""
+    return [normalize(token) for token in TOKEN_RE.findall((text or '').lower())]
+
+
+class ProductSearchIndex(ProductMemoryIndex):
+    """
+    Инвертированный индекс товаров в памяти процесса.
+    Поиск выполняется только по индексу и не обращается к таблице товаров.
+    """
+    fields = tuple(FIELD_WEIGHTS)
+
+    def _reset(self):
+        self._postings = defaultdict(dict)   # термин -> {id товара: вес}
+        self._documents = {}                 # id товара -> {термин: вес}
+        self._terms = []                     # отсортированный список терминов для поиска по префиксу
+
+    def _finish_build(self):
+        self._terms = sorted(self._postings)
+
+    def match(self, query):
+        """
+        Возвращает словарь {id товара: релевантность} для товаров, содержащих все слова запроса.
+        Последнее слово запроса ищется по префиксу, чтобы поиск работал при наборе.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        self.ensure_built()
+
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = None
+            for position, term in enumerate(terms):
+                is_last = position == len(terms) - 1
+                matches = self._prefix_matches(term) if is_last else self._exact_matches(term)
+                term_scores = self._score_terms(matches, total)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # Пересечение выполняется по меньшему из двух множеств
+                    if len(term_scores) < len(scores):
+                        scores, term_scores = term_scores, scores
+                    scores = {pid: score + term_scores[pid] for pid, score in scores.items() if pid in term_scores}
+                if not scores:
+                    return {}
+        return scores
+
+    def search(self, query, limit=None):
+        """Возвращает id найденных товаров в порядке релевантности"""
+        return self.rank(self.match(query), limit)
+
+    @staticmethod
+    def rank(scores, limit=None):
+        """Упорядочивает результаты match() по релевантности, при равенстве — по id"""
+        if limit is None:
+            return sorted(scores, key=lambda pid: (-scores[pid], pid))
+        return heapq.nsmallest(limit, scores, key=lambda pid: (-scores[pid], pid))
+
+    def _score_terms(self, terms, total):
+        if len(terms) == 1:
+            postings = self._postings[terms[0]]
+            idf = math.log(1 + total / len(postings))
+            return {pid: weight * idf for pid, weight in postings.items()}
+        term_scores = {}
+        for term in terms:
+            postings = self._postings[term]
+            idf = math.log(1 + total / len(postings))
+            for product_id, weight in postings.items():
+                score = weight * idf
+                if score > term_scores.get(product_id, 0):
+                    term_scores[product_id] = score
+        return term_scores
+
+    def _exact_matches(self, term):
+        return [term] if term in self._postings else []
+
+    def _prefix_matches(self, term):
+        index = bisect.bisect_left(self._terms, term)
+        matches = []
+        while index < len(self._terms) and self._terms[index].startswith(term):
+            matches.append(self._terms[index])
+            index += 1
+        return matches
+
+    def _add(self, row):
+        weights = defaultdict(float)
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term in tokenize(row[field]):
+                weights[term] += field_weight
+        self._documents[row['id']] = dict(weights)
+        for term, weight in weights.items():
+            postings = self._postings[term]
+            # Во время полной перестройки список терминов сортируется один раз в конце
+            if self._built and not postings:
+                bisect.insort(self._terms, term)
+            postings[row['id']] = weight
+
+    def _remove(self, product_id):
+        terms = self._documents.pop(product_id, None)
+        if not terms:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._terms, term)
+                if index < len(self._terms) and self._terms[index] == term:
+                    del self._terms[index]
+
+
+product_search_index = ProductSearchIndex()
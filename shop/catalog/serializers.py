@@ -1,45 +1,167 @@
-from rest_framework import serializers
+from types import SimpleNamespace
+from django.db.models import Prefetch
+from rest_framework import relations, serializers
+from .image_variants import image_srcset, image_token, variant_url_prefix
 from .models import Category, Section, Product
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ImageSrcsetMixin(serializers.Serializer):
+    """Добавляет поле image_srcset со ссылками на варианты изображения разной ширины"""
+    image_kind = None
+    image_srcset = serializers.SerializerMethodField()
+    
+    def get_image_srcset(self, obj):
+        # Контекст общий для всех вложенных сериализаторов, поэтому начало ссылок
+        # вычисляется через reverse() один раз на весь ответ, а не для каждого объекта
+        if image_token(obj) is None:
+            return None
+        context = self.context
+        if 'variant_url_prefix' not in context:
+            context['variant_url_prefix'] = variant_url_prefix(context.get('request'))
+        return image_srcset(self.image_kind, obj, prefix=context['variant_url_prefix'])
+
+
+class ProductSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
     """Сериализатор для товаров"""
+    image_kind = 'product'
+    
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'slug', 'image', 'description', 
+            'id', 'name', 'slug', 'image', 'image_srcset', 'description', 
             'price', 'quantity_type', 'quantity_value', 
             'available', 'created_at', 'updated_at'
         ]
 
 
-class SectionSerializer(serializers.ModelSerializer):
+class SectionSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
     """Сериализатор для разделов"""
+    image_kind = 'section'
     products = ProductSerializer(many=True, read_only=True)
     
     class Meta:
         model = Section
-        fields = ['id', 'name', 'slug', 'image', 'created_at', 'updated_at', 'products']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'created_at', 'updated_at', 'products']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Подгружает доступные товары раздела одним дополнительным запросом"""
+        return queryset.prefetch_related(
+            Prefetch('products', queryset=Product.objects.filter(available=True))
+        )
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(ImageSrcsetMixin, serializers.ModelSerializer):
     """Сериализатор для категорий"""
+    image_kind = 'category'
     sections = SectionSerializer(many=True, read_only=True)
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'image', 'created_at', 'updated_at', 'sections']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'created_at', 'updated_at', 'sections']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Подгружает доступные разделы и их товары двумя дополнительными запросами"""
+        sections = SectionSerializer.setup_eager_loading(Section.objects.filter(available=True))
+        return queryset.prefetch_related(Prefetch('sections', queryset=sections))
 
 
-class CategoryListSerializer(serializers.ModelSerializer):
+class CategoryListSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
     """Сериализатор для списка категорий (без вложенных разделов)"""
+    image_kind = 'category'
+    
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'image']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset']
 
 
-class SectionListSerializer(serializers.ModelSerializer):
+class SectionListSerializer(ImageSrcsetMixin, serializers.ModelSerializer):
     """Сериализатор для списка разделов (без вложенных товаров)"""
+    image_kind = 'section'
+    
     class Meta:
         model = Section
-        fields = ['id', 'name', 'slug', 'image', 'category'] 
\ No newline at end of file
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'category'] 
+
+
+class ValuesSerializer:
+    """
+    Быстрая сериализация строк queryset.values() для плоских сериализаторов каталога.
+    Для каждого поля сериализатора один раз выбирается функция преобразования,
+    поэтому на строку не создаются объекты модели и не выполняется обход полей DRF.
+    Результат совпадает с serializer_class(many=True).data.
+    """
+    # Поля, значения которых из базы уже имеют нужный для JSON тип
+    identity_fields = (
+        serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+        relations.PrimaryKeyRelatedField,
+    )
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.image_kind = getattr(serializer_class, 'image_kind', None)
+        fields = serializer_class().fields
+        self.converters = []
+        value_fields = []
+        for name, field in fields.items():
+            if name == 'image_srcset':
+                converter = self._image_srcset
+                value_fields += ['id', 'image', 'image_hash']
+            elif isinstance(field, serializers.FileField):
+                converter = self._file_url(self.model._meta.get_field(field.source).storage)
+                value_fields.append(field.source)
+            elif isinstance(field, self.identity_fields):
+                converter = None
+                value_fields.append(field.source)
+            else:
+                converter = self._field_converter(field)
+                value_fields.append(field.source)
+            self.converters.append((name, field.source, converter))
+        self.value_fields = list(dict.fromkeys(value_fields))
+
+    def rows(self, queryset):
+        return queryset.values(*self.value_fields)
+
+    def serialize(self, rows, request=None):
+        converters = self.converters
+        context = {'request': request, 'prefix': variant_url_prefix(request)}
+        result = []
+        for row in rows:
+            item = {}
+            for name, source, converter in converters:
+                if converter is None:
+                    item[name] = row[source]
+                else:
+                    item[name] = converter(row, source, context)
+            result.append(item)
+        return result
+
+    @staticmethod
+    def _field_converter(field):
+        to_representation = field.to_representation
+
+        def convert(row, source, context):
+            value = row[source]
+            return None if value is None else to_representation(value)
+        return convert
+
+    @staticmethod
+    def _file_url(storage):
+        def convert(row, source, context):
+            name = row[source]
+            if not name:
+                return None
+            url = storage.url(name)
+            return context['request'].build_absolute_uri(url) if context['request'] is not None else url
+        return convert
+
+    def _image_srcset(self, row, source, context):
+        obj = SimpleNamespace(pk=row['id'], image=row['image'], image_hash=row['image_hash'])
+        return image_srcset(self.image_kind, obj, prefix=context['prefix'])
+
+
+product_values_serializer = ValuesSerializer(ProductSerializer)
+section_list_values_serializer = ValuesSerializer(SectionListSerializer)
+category_list_values_serializer = ValuesSerializer(CategoryListSerializer)
@@ -0,0 +1,58 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .facets import product_facet_index
+from .models import Category, Section, Product
+from .response_cache import invalidation_tags, response_cache
+from .search import product_search_index
+from .tree import schedule_catalog_tree_rebuild
+
+# Индексы в памяти процесса, которые обновляются при изменении каталога
+MEMORY_INDEXES = (product_search_index, product_facet_index)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Section)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Section)
+@receiver(post_delete, sender=Product)
+def rebuild_catalog_tree_on_change(sender, instance, **kwargs):
+    # Любое изменение каталога приводит к перестройке предрассчитанного дерева
+    schedule_catalog_tree_rebuild()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Section)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Section)
+@receiver(post_delete, sender=Product)
+def invalidate_response_cache_on_change(sender, instance, **kwargs):
+    transaction.on_commit(partial(response_cache.invalidate, invalidation_tags(instance)))
+
+
+@receiver(post_save, sender=Product)
+def update_memory_indexes_on_product_save(sender, instance, **kwargs):
+    for index in MEMORY_INDEXES:
+        transaction.on_commit(partial(index.update, [instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def update_memory_indexes_on_product_delete(sender, instance, **kwargs):
+    for index in MEMORY_INDEXES:
+        transaction.on_commit(partial(index.remove, [instance.pk]))
+
+
+@receiver(post_save, sender=Section)
+def update_memory_indexes_on_section_save(sender, instance, **kwargs):
+    # Название и доступность раздела влияют на все его товары
+    for index in MEMORY_INDEXES:
+        transaction.on_commit(partial(index.update_where, section_id=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def update_memory_indexes_on_category_save(sender, instance, **kwargs):
+    for index in MEMORY_INDEXES:
+        transaction.on_commit(partial(index.update_where, section__category_id=instance.pk))
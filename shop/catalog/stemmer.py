@@ -0,0 +1,151 @@
+"""
+Стеммер русского языка по алгоритму Snowball (Porter).
+https://snowballstem.org/algorithms/russian/stemmer.html
+"""
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+
+REFLEXIVE = ('ся', 'сь')
+
+VERB_1 = (
+    'ете', 'йте', 'ешь', 'нно',
+    'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н',
+)
+VERB_2 = (
+    'ейте', 'уйте',
+    'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь',
+    'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях',
+    'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью',
+    'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)
+
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+# Окончания проверяются от самых длинных к коротким
+(PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2, ADJECTIVE, PARTICIPLE_1, PARTICIPLE_2, REFLEXIVE,
+ VERB_1, VERB_2, NOUN, SUPERLATIVE, DERIVATIONAL) = (
+    tuple(sorted(group, key=len, reverse=True)) for group in (
+        PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2, ADJECTIVE, PARTICIPLE_1, PARTICIPLE_2, REFLEXIVE,
+        VERB_1, VERB_2, NOUN, SUPERLATIVE, DERIVATIONAL,
+    )
+)
+
+
+def _regions(word):
+    """Возвращает начала областей RV и R2"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    r2 = next_region(r1)
+    return rv, r2
+
+
+def _longest(word, start, endings):
+    """Возвращает самое длинное окончание из endings, целиком лежащее после start"""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return ending
+    return None
+
+
+def _remove_group(word, start, group_1, group_2):
+    """
+    Удаляет окончание группы 1 (только после «а» или «я») или группы 2.
+    Возвращает новое слово или None, если окончание не найдено.
+    """
+    candidates = []
+    ending = _longest(word, start + 1, group_1)
+    if ending and word[-len(ending) - 1] in 'ая':
+        candidates.append(ending)
+    ending = _longest(word, start, group_2)
+    if ending:
+        candidates.append(ending)
+    if not candidates:
+        return None
+    return word[:-len(max(candidates, key=len))]
+
+
+def _remove_adjectival(word, rv):
+    ending = _longest(word, rv, ADJECTIVE)
+    if ending is None:
+        return None
+    word = word[:-len(ending)]
+    # Причастие перед окончанием прилагательного удаляется вместе с ним
+    without_participle = _remove_group(word, rv, PARTICIPLE_1, PARTICIPLE_2)
+    return without_participle if without_participle is not None else word
+
+
+def stem(word):
+    """Возвращает основу русского слова"""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1
+    result = _remove_group(word, rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if result is not None:
+        word = result
+    else:
+        ending = _longest(word, rv, REFLEXIVE)
+        if ending:
+            word = word[:-len(ending)]
+        for remove in (
+            lambda w: _remove_adjectival(w, rv),
+            lambda w: _remove_group(w, rv, VERB_1, VERB_2),
+        ):
+            result = remove(word)
+            if result is not None:
+                word = result
+                break
+        else:
+            ending = _longest(word, rv, NOUN)
+            if ending:
+                word = word[:-len(ending)]
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    ending = _longest(word, r2, DERIVATIONAL)
+    if ending:
+        word = word[:-len(ending)]
+
+    # Шаг 4
+    superlative = _longest(word, rv, SUPERLATIVE)
+    if superlative:
+        word = word[:-len(superlative)]
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif not superlative and word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    return word
@@ -0,0 +1,200 @@
+import random
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.utils import timezone
+from .models import Product, StockReservation, StockShard
+from .response_cache import invalidation_tags, response_cache
+from .signals import MEMORY_INDEXES
+from .tree import schedule_catalog_tree_rebuild
+
+
+class OutOfStock(Exception):
+    """На складе недостаточно товара"""
+
+    def __init__(self, product_id, quantity):
+        super().__init__(f'Недостаточно товара {product_id} для резерва {quantity} шт.')
+        self.product_id = product_id
+        self.quantity = quantity
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def stock_total():
+    """
+    Выражение остатка товара: значение в строке товара или сумма по шардам.
+    Для товара без учета остатка равно NULL.
+    """
+    shards_total = StockShard.objects.filter(product=OuterRef('pk')).values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    return Case(When(stock_shards=0, then=F('stock')), default=Subquery(shards_total))
+
+
+def _availability_changed(product_id):
+    # Флаг меняется UPDATE-ом без сигналов, поэтому кэши и индексы обновляются так же, как в signals.py
+    product = Product.objects.only('id', 'section_id').get(pk=product_id)
+    transaction.on_commit(partial(response_cache.invalidate, invalidation_tags(product)))
+    for index in MEMORY_INDEXES:
+        transaction.on_commit(partial(index.update, [product_id]))
+    schedule_catalog_tree_rebuild()
+
+
+def mark_sold_out(product_id):
+    """Снимает товар с продажи, если его остаток закончился, и отмечает это флагом sold_out"""
+    if Product.objects.alias(total=stock_total()).filter(pk=product_id, available=True, total=0).update(
+        available=False, sold_out=True, updated_at=timezone.now()
+    ):
+        _availability_changed(product_id)
+
+
+def mark_restocked(product_id, quantity):
+    """
+    Возвращает товар в продажу, если остаток стал равен quantity, то есть до пополнения
+    на quantity был нулевым. Вызывается в транзакции пополнения.
+    Товар, снятый с продажи вручную (без флага sold_out), остается скрытым.
+    """
+    if Product.objects.alias(total=stock_total()).filter(pk=product_id, sold_out=True, total=quantity).update(
+        available=True, sold_out=False, updated_at=timezone.now()
+    ):
+        _availability_changed(product_id)
+
+
+def take_stock(product_id, quantity):
+    """
+    Списывает quantity единиц товара условным UPDATE ... WHERE stock >= quantity без
+    блокировки строки на время транзакции покупателя. Товар без учета остатка не списывается.
+    Вызывает OutOfStock, если товара не хватает.
+    """
+    if Product.objects.filter(pk=product_id, stock_shards=0, stock__gte=quantity).update(
+        stock=F('stock') - quantity
+    ):
+        mark_sold_out(product_id)
+        return
+    stock, shards = Product.objects.values_list('stock', 'stock_shards').get(pk=product_id)
+    if shards:
+        try:
+            _take_from_shards(product_id, quantity)
+        finally:
+            # Проверка и после неудачи: одновременные списания последних единиц
+            # из разных шардов могли не увидеть нулевой остаток друг друга
+            mark_sold_out(product_id)
+    elif stock is not None:
+        raise OutOfStock(product_id, quantity)
+
+
+def _take_from_shards(product_id, quantity):
+    shards = list(StockShard.objects.filter(product_id=product_id, quantity__gt=0).values_list('index', 'quantity'))
+    # Случайный порядок разводит одновременных покупателей по разным шардам
+    random.shuffle(shards)
+    for index, available in shards:
+        if available >= quantity and StockShard.objects.filter(
+            product_id=product_id, index=index, quantity__gte=quantity
+        ).update(quantity=F('quantity') - quantity):
+            return
+
+    # Ни в одном шарде не хватило товара целиком: набираем из нескольких в одной транзакции
+    with transaction.atomic():
+        remaining = quantity
+        for index, available in shards:
+            take = min(available, remaining)
+            while take and not StockShard.objects.filter(
+                product_id=product_id, index=index, quantity__gte=take
+            ).update(quantity=F('quantity') - take):
+                # Шард успели уменьшить параллельно: берем то, что в нем осталось
+                available = StockShard.objects.values_list('quantity', flat=True).get(product_id=product_id, index=index)
+                take = min(available, remaining)
+            remaining -= take
+            if not remaining:
+                return
+        raise OutOfStock(product_id, quantity)
+
+
+def return_stock(product_id, quantity):
+    """Возвращает товар на склад (в случайный шард для товара с шардами)"""
+    with transaction.atomic():
+        if not Product.objects.filter(pk=product_id, stock_shards=0, stock__isnull=False).update(
+            stock=F('stock') + quantity
+        ):
+            shards = Product.objects.values_list('stock_shards', flat=True).get(pk=product_id)
+            if not shards:
+                return
+            StockShard.objects.filter(product_id=product_id, index=random.randrange(shards)).update(
+                quantity=F('quantity') + quantity
+            )
+        mark_restocked(product_id, quantity)
+
+
+def set_stock(product_id, quantity, shards=0):
+    """
+    Устанавливает остаток товара при поступлении или инвентаризации.
+    quantity=None отключает учет остатка. При shards > 0 остаток делится поровну
+    между shards строками StockShard — режим для товаров, которые покупают одновременно
+    многие покупатели. Нулевой остаток снимает товар с продажи, пополнение с нуля возвращает.
+    """
+    if quantity is None:
+        shards = 0
+    with transaction.atomic():
+        previous = Product.objects.annotate(total=stock_total()).values_list('total', flat=True).get(pk=product_id)
+        StockShard.objects.filter(product_id=product_id).delete()
+        if shards:
+            base, extra = divmod(quantity, shards)
+            StockShard.objects.bulk_create([
+                StockShard(product_id=product_id, index=index, quantity=base + (index < extra))
+                for index in range(shards)
+            ])
+        Product.objects.filter(pk=product_id).update(
+            stock=None if shards else quantity, stock_shards=shards, updated_at=timezone.now()
+        )
+        if quantity == 0:
+            mark_sold_out(product_id)
+        elif quantity and previous == 0:
+            mark_restocked(product_id, quantity)
+
+
+def reserve(product_id, quantity, ttl=None):
+    """
+    Резервирует товар: списывает его с остатка и создает StockReservation,
+    который нужно подтвердить (confirm) или отменить (release) до истечения ttl.
+    Если товара не хватает, сначала возвращаются просроченные резервы этого товара.
+    """
+    with transaction.atomic():
+        try:
+            take_stock(product_id, quantity)
+        except OutOfStock:
+            if not release_expired(product_id=product_id):
+                raise
+            take_stock(product_id, quantity)
+        return StockReservation.objects.create(
+            product_id=product_id, quantity=quantity, expires_at=timezone.now() + (ttl or reservation_ttl())
+        )
+
+
+def confirm(reservation):
+    """
+    Подтверждает резерв: товар остается списанным. Возвращает False, если резерв
+    уже был отменен или просрочен и возвращен на склад.
+    """
+    return StockReservation.objects.filter(pk=reservation.pk).delete()[0] > 0
+
+
+def release(reservation):
+    """Отменяет резерв и возвращает товар на склад; повторная отмена ничего не делает"""
+    with transaction.atomic():
+        # Условное удаление: из параллельных отмен товар вернет только одна
+        if not StockReservation.objects.filter(pk=reservation.pk).delete()[0]:
+            return False
+        return_stock(reservation.product_id, reservation.quantity)
+    return True
+
+
+def release_expired(product_id=None, now=None):
+    """Возвращает на склад просроченные резервы (все или одного товара). Возвращает их число"""
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    if product_id is not None:
+        expired = expired.filter(product_id=product_id)
+    return sum(release(reservation) for reservation in expired.only('id', 'product_id', 'quantity'))
@@ -1,3 +1,1384 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from datetime import timedelta
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils.http import http_date
+from PIL import Image
+from tasks.models import Task
+from tasks.queue import run_pending_tasks
+from .admin import ProductAdmin
+from .admin_tools import EstimatedCountPaginator, estimated_row_count
+from .models import Category, Section, Product, StockReservation, StockShard
+from .facets import product_facet_index
+from .image_variants import VariantCache, variant_cache, variant_url_prefix
+from .query_plans import find_full_scans
+from .response_cache import TaggedResponseCache, invalidation_tags, response_cache
+from .serializers import ProductSerializer, product_values_serializer
+from .search import product_search_index
+from .stemmer import stem
+from .stock import OutOfStock, confirm, release, release_expired, reserve, set_stock
+from .tree import ScheduledRebuild, rebuild_catalog_tree
 
-# Create your tests here.
+
+class CatalogTestMixin:
+    """Общие данные для тестов каталога"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name='Фрукты', slug='fruits')
+            self.section = Section.objects.create(category=self.category, name='Яблоки', slug='apples')
+            self.product = self.create_product('Антоновка', 'antonovka')
+
+    def create_product(self, name, slug, section=None, **kwargs):
+        kwargs.setdefault('price', Decimal('100.00'))
+        kwargs.setdefault('quantity_type', 'кг')
+        kwargs.setdefault('quantity_value', Decimal('1.00'))
+        return Product.objects.create(section=section or self.section, name=name, slug=slug, **kwargs)
+
+
+class CatalogTreeAPITest(CatalogTestMixin, TestCase):
+    """Тесты API дерева каталога"""
+
+    def test_tree_contains_only_available_items(self):
+        cache.clear()
+        hidden_section = Section.objects.create(
+            category=self.category, name='Скрытый', slug='hidden', available=False
+        )
+        self.create_product('Скрытый товар', 'hidden-product', section=hidden_section)
+        self.create_product('Нет в наличии', 'out-of-stock', available=False)
+        Category.objects.create(name='Недоступная', slug='unavailable', available=False)
+
+        response = self.client.get(reverse('catalog_api:catalog_tree'))
+
+        self.assertEqual(response.status_code, 200)
+        categories = response.json()['categories']
+        self.assertEqual([c['slug'] for c in categories], ['fruits'])
+        sections = categories[0]['sections']
+        self.assertEqual([s['slug'] for s in sections], ['apples'])
+        self.assertEqual([p['slug'] for p in sections[0]['products']], ['antonovka'])
+
+    def test_tree_is_built_with_fixed_number_of_queries(self):
+        for i in range(5):
+            section = Section.objects.create(category=self.category, name=f'Раздел {i}', slug=f'section-{i}')
+            for j in range(5):
+                self.create_product(f'Товар {i}-{j}', f'product-{i}-{j}', section=section)
+        cache.clear()
+
+        with self.assertNumQueries(3):
+            rebuild_catalog_tree()
+
+    def test_tree_is_served_without_queries(self):
+        rebuild_catalog_tree()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog_api:catalog_tree'))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_tree_is_rebuilt_on_save(self):
+        rebuild_catalog_tree()
+        self.product.name = 'Семеренко'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        response = self.client.get(reverse('catalog_api:category_tree', kwargs={'category_slug': 'fruits'}))
+
+        self.assertEqual(response.json()['sections'][0]['products'][0]['name'], 'Семеренко')
+
+    def test_rebuild_is_scheduled_once_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            # Перестройка из откаченной точки сохранения не подавляет перестройку внешней транзакции
+            with self.assertRaises(OutOfStock), transaction.atomic():
+                self.create_product('Мельба', 'melba')
+                raise OutOfStock(self.product.pk, 1)
+            self.product.name = 'Семеренко'
+            self.product.save()
+            self.create_product('Белый налив', 'white')
+
+        self.assertEqual(sum(isinstance(callback, ScheduledRebuild) for callback in callbacks), 1)
+
+    def test_unknown_category_subtree_returns_404(self):
+        response = self.client.get(reverse('catalog_api:category_tree', kwargs={'category_slug': 'missing'}))
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CATALOG_API_CACHE_TIMEOUT=0)
+class CatalogDetailQueryCountTest(CatalogTestMixin, TestCase):
+    """Тесты количества запросов для детальных API категорий и разделов"""
+
+    def fill_catalog(self, sections, products_per_section):
+        for i in range(sections):
+            section = Section.objects.create(category=self.category, name=f'Раздел {i}', slug=f'section-{i}')
+            for j in range(products_per_section):
+                self.create_product(f'Товар {i}-{j}', f'product-{i}-{j}', section=section)
+
+    def test_category_detail_query_count_is_fixed(self):
+        # Агрегат для ETag, категория, разделы, товары
+        url = reverse('catalog_api:category_detail', kwargs={'slug': 'fruits'})
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        self.fill_catalog(sections=5, products_per_section=5)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()['sections']), 6)
+
+    def test_section_detail_query_count_is_fixed(self):
+        url = reverse('catalog_api:section_detail', kwargs={'category_slug': 'fruits', 'slug': 'apples'})
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+        for i in range(10):
+            self.create_product(f'Товар {i}', f'product-{i}')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()['products']), 11)
+
+    def test_unavailable_nested_items_are_hidden(self):
+        Section.objects.create(category=self.category, name='Скрытый', slug='hidden', available=False)
+        self.create_product('Нет в наличии', 'out-of-stock', available=False)
+
+        response = self.client.get(reverse('catalog_api:category_detail', kwargs={'slug': 'fruits'}))
+
+        sections = response.json()['sections']
+        self.assertEqual([s['slug'] for s in sections], ['apples'])
+        self.assertEqual([p['slug'] for p in sections[0]['products']], ['antonovka'])
+
+
+@override_settings(CATALOG_API_CACHE_TIMEOUT=0)
+class ConditionalGetTest(CatalogTestMixin, TestCase):
+    """Тесты условных GET-запросов (ETag / Last-Modified) к API каталога"""
+
+    def urls(self):
+        return [
+            reverse('catalog_api:category_list'),
+            reverse('catalog_api:category_detail', kwargs={'slug': 'fruits'}),
+            reverse('catalog_api:section_list', kwargs={'category_slug': 'fruits'}),
+            reverse('catalog_api:section_detail', kwargs={'category_slug': 'fruits', 'slug': 'apples'}),
+            reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'}),
+            reverse('catalog_api:product_detail', kwargs={
+                'category_slug': 'fruits', 'section_slug': 'apples', 'slug': 'antonovka',
+            }),
+            reverse('catalog_api:product_search') + '?q=антоновка',
+        ]
+
+    def test_matching_etag_returns_304_with_one_query(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+                # Валидатор поиска берется из кэша и индексов в памяти, без запросов к базе
+                with self.assertNumQueries(0 if 'search' in url else 1):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_if_modified_since_returns_304(self):
+        url = self.urls()[5]
+        response = self.client.get(url)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_responses_with_row_counts_have_no_last_modified(self):
+        # Удаление строки не меняет max(updated_at): такие ответы проверяются только по ETag
+        for url in self.urls()[:5] + self.urls()[6:]:
+            with self.subTest(url=url):
+                self.assertNotIn('Last-Modified', self.client.get(url))
+
+    def test_deleted_row_is_not_hidden_by_if_modified_since(self):
+        url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+        self.create_product('Семеренко', 'semerenko')
+        self.client.get(url)
+        Product.objects.filter(slug='semerenko').delete()
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_etag_changes_when_catalog_changes(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.category.save()
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_string(self):
+        url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, {'price_min': '500'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_tree_304_without_queries(self):
+        url = reverse('catalog_api:catalog_tree')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.product.name = 'Семеренко'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_change_invalidates_product_list(self):
+        url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+        etag = self.client.get(url)['ETag']
+        self.create_product('Семеренко', 'semerenko')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class ResponseCacheTest(CatalogTestMixin, TestCase):
+    """Тесты кэша ответов API каталога с инвалидацией по тегам"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_section = Section.objects.create(category=self.category, name='Груши', slug='pears')
+        self.product_list_url = self.products_url('apples')
+        self.other_list_url = self.products_url('pears')
+        # Индексы строятся заново и сверены с текущей меткой сброса, иначе ответы не кэшируются
+        product_facet_index.clear()
+        product_search_index.clear()
+
+    def products_url(self, section_slug):
+        return reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': section_slug})
+
+    def assertCached(self, url):
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeated_request_is_served_from_cache(self):
+        urls = [
+            reverse('catalog_api:category_list'),
+            reverse('catalog_api:category_detail', kwargs={'slug': 'fruits'}),
+            reverse('catalog_api:section_list', kwargs={'category_slug': 'fruits'}),
+            reverse('catalog_api:section_detail', kwargs={'category_slug': 'fruits', 'slug': 'apples'}),
+            self.product_list_url,
+            reverse('catalog_api:product_detail', kwargs={
+                'category_slug': 'fruits', 'section_slug': 'apples', 'slug': 'antonovka',
+            }),
+            reverse('catalog_api:product_search') + '?q=антоновка',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                second = self.assertCached(url)
+                self.assertEqual(second.json(), first.json())
+                self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_cached_response_honours_if_none_match(self):
+        etag = self.client.get(self.product_list_url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.product_list_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_index_does_not_fill_shared_cache(self):
+        self.client.get(self.product_list_url)
+        # Другой процесс изменил товар и сбросил кэш; индекс фасетов этого процесса отстает
+        Product.objects.filter(pk=self.product.pk).update(
+            quantity_type='шт', updated_at=self.product.updated_at + timedelta(seconds=1)
+        )
+        response_cache.invalidate(invalidation_tags(self.product))
+
+        stale = self.client.get(self.product_list_url)
+        self.assertEqual([item['value'] for item in stale.json()['facets']['quantity_type']], ['кг'])
+        # Ответ по отстающему индексу не попал в кэш
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.product_list_url)
+        self.assertTrue(queries.captured_queries)
+
+        with mock.patch('catalog.memory_index.time.monotonic', return_value=time.monotonic() + 60):
+            fresh = self.client.get(self.product_list_url)
+        self.assertEqual([item['value'] for item in fresh.json()['facets']['quantity_type']], ['шт'])
+        self.assertNotEqual(fresh['ETag'], stale['ETag'])
+        self.assertEqual(self.assertCached(self.product_list_url).json(), fresh.json())
+
+    def test_save_invalidates_only_affected_entries(self):
+        category_list_url = reverse('catalog_api:category_list')
+        for url in (self.product_list_url, self.other_list_url, category_list_url):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product('Семеренко', 'semerenko')
+
+        self.assertEqual(len(self.client.get(self.product_list_url).json()['results']), 2)
+        self.assertCached(self.other_list_url)
+        self.assertCached(category_list_url)
+
+    def test_moved_product_leaves_old_section_list(self):
+        self.client.get(self.product_list_url)
+        self.client.get(self.other_list_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.section = self.other_section
+            self.product.save()
+
+        self.assertEqual(self.client.get(self.product_list_url).json()['results'], [])
+        self.assertEqual(len(self.client.get(self.other_list_url).json()['results']), 1)
+
+    def test_delete_invalidates_detail(self):
+        url = reverse('catalog_api:product_detail', kwargs={
+            'category_slug': 'fruits', 'section_slug': 'apples', 'slug': 'antonovka',
+        })
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_category_change_invalidates_nested_views(self):
+        url = reverse('catalog_api:section_detail', kwargs={'category_slug': 'fruits', 'slug': 'apples'})
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.available = False
+            self.category.save()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_file_based_cache_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+        with override_settings(CACHES=caches):
+            self.client.get(self.product_list_url)
+            self.assertCached(self.product_list_url)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_product('Семеренко', 'semerenko')
+
+            self.assertEqual(len(self.client.get(self.product_list_url).json()['results']), 2)
+
+
+class TaggedResponseCacheTest(TestCase):
+    """Тесты тегов и защиты от одновременного пересчета"""
+
+    def setUp(self):
+        cache.clear()
+        self.cache = TaggedResponseCache(prefix='test', timeout=60)
+
+    def test_invalidate_tag(self):
+        self.cache.set('a', 1, ['x'], self.cache.epoch())
+        self.cache.set('b', 2, ['y'], self.cache.epoch())
+
+        self.cache.invalidate(['x'])
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 2)
+
+    def test_value_read_before_invalidation_is_not_stored(self):
+        epoch = self.cache.epoch()
+        self.cache.invalidate(['x'])
+
+        self.assertFalse(self.cache.set('a', 1, ['x'], epoch))
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_concurrent_misses_compute_once(self):
+        computed = []
+
+        def worker():
+            if self.cache.get('key') is not None:
+                return
+            with self.cache.single_flight('key'):
+                if self.cache.get('key') is None:
+                    computed.append(1)
+                    time.sleep(0.1)
+                    self.cache.set('key', 'value', ['x'], self.cache.epoch())
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(self.cache.get('key'), 'value')
+
+
+    async def test_concurrent_async_misses_compute_once(self):
+        computed = []
+
+        async def worker():
+            if await self.cache.aget('key') is not None:
+                return
+            async with self.cache.asingle_flight('key'):
+                if await self.cache.aget('key') is None:
+                    computed.append(1)
+                    await asyncio.sleep(0.1)
+                    await self.cache.aset('key', 'value', ['x'], await self.cache.aepoch())
+
+        await asyncio.gather(*(worker() for _ in range(8)))
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(await self.cache.aget('key'), 'value')
+        self.assertEqual(self.cache._async_locks, {})
+
+
+@override_settings(CATALOG_API_CACHE_TIMEOUT=0)
+class ValuesSerializerTest(CatalogTestMixin, TestCase):
+    """Тесты быстрой сериализации списков из строк .values()"""
+
+    def setUp(self):
+        super().setUp()
+        Section.objects.create(category=self.category, name='Груши', slug='pears')
+        for i in range(5):
+            self.create_product(f'Товар {i}', f'product-{i}', price=Decimal('12.5'), quantity_value=Decimal('0.3'))
+        Product.objects.filter(slug='product-1').update(image='products/a.jpg', image_hash='f' * 64)
+        Product.objects.filter(slug='product-2').update(image='products/b.jpg')
+        Category.objects.filter(slug='fruits').update(image='categories/c.jpg', image_hash='e' * 64)
+
+    def test_output_is_identical(self):
+        urls = [
+            reverse('catalog_api:category_list'),
+            reverse('catalog_api:section_list', kwargs={'category_slug': 'fruits'}),
+            reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'}),
+            reverse('catalog_api:product_list', kwargs={
+                'category_slug': 'fruits', 'section_slug': 'apples',
+            }) + '?page_size=2&price_max=50',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with override_settings(CATALOG_FAST_SERIALIZERS=False):
+                    expected = self.client.get(url)
+                with override_settings(CATALOG_FAST_SERIALIZERS=True):
+                    actual = self.client.get(url)
+                self.assertEqual(actual.status_code, 200)
+                self.assertEqual(actual.content, expected.content)
+
+    def test_next_page_link_is_identical(self):
+        url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+        with override_settings(CATALOG_FAST_SERIALIZERS=True):
+            next_url = self.client.get(url, {'page_size': 2}).json()['next']
+            actual = self.client.get(next_url)
+        expected = self.client.get(next_url)
+
+        self.assertEqual(actual.content, expected.content)
+
+    def test_serialize_matches_model_serializer(self):
+        queryset = Product.objects.order_by('id')
+
+        rows = product_values_serializer.serialize(product_values_serializer.rows(queryset))
+
+        self.assertEqual(rows, ProductSerializer(queryset, many=True).data)
+
+    def test_model_serializer_reverses_variant_prefix_once(self):
+        Product.objects.update(image='products/a.jpg', image_hash='f' * 64)
+
+        with mock.patch('catalog.serializers.variant_url_prefix', wraps=variant_url_prefix) as prefix:
+            data = ProductSerializer(Product.objects.all(), many=True).data
+
+        self.assertEqual(prefix.call_count, 1)
+        self.assertTrue(all(product['image_srcset'] for product in data))
+
+
+class KeysetPaginationTest(CatalogTestMixin, TestCase):
+    """Тесты курсорной пагинации списка товаров"""
+
+    def setUp(self):
+        super().setUp()
+        self.product.delete()
+        # Одинаковые названия проверяют, что id работает как второй ключ сортировки
+        for i in range(7):
+            self.create_product(f'Товар {i % 3}', f'product-{i}')
+        self.url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+
+    def collect_pages(self, url):
+        slugs = []
+        pages = 0
+        while url:
+            data = self.client.get(url).json()
+            slugs.extend(p['slug'] for p in data['results'])
+            url = data['next']
+            pages += 1
+        return slugs, pages
+
+    def test_pages_cover_all_products_in_order(self):
+        slugs, pages = self.collect_pages(self.url + '?page_size=3')
+
+        expected = list(Product.objects.order_by('name', 'id').values_list('slug', flat=True))
+        self.assertEqual(slugs, expected)
+        self.assertEqual(pages, 3)
+
+    def test_previous_link_returns_preceding_page(self):
+        first = self.client.get(self.url + '?page_size=3').json()
+        second = self.client.get(first['next']).json()
+        previous = self.client.get(second['previous']).json()
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual(previous['results'], first['results'])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(self.url + '?cursor=broken')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTest(TestCase):
+    """Тесты планов запросов API каталога"""
+
+    def test_catalog_queries_do_not_scan_tables(self):
+        call_command('check_query_plans', stdout=StringIO())
+
+    def test_full_scan_is_detected(self):
+        self.assertEqual(find_full_scans('3 0 0 SCAN catalog_product'), ['catalog_product'])
+        self.assertEqual(find_full_scans('Seq Scan on catalog_product  (cost=0.00..1.01 rows=1)'), ['catalog_product'])
+        self.assertEqual(find_full_scans('4 0 0 SCAN catalog_category USING INDEX category_available_name_idx'), [])
+
+
+@override_settings(CATALOG_API_CACHE_TIMEOUT=0)
+class ProductSearchTest(CatalogTestMixin, TestCase):
+    """Тесты полнотекстового поиска товаров"""
+
+    def setUp(self):
+        product_search_index.clear()
+        super().setUp()
+        self.url = reverse('catalog_api:product_search')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk = self.create_product('Молоко пастеризованное', 'milk', description='Свежее коровье молоко')
+
+    def search(self, query):
+        return [p['slug'] for p in self.client.get(self.url, {'q': query}).json()['results']]
+
+    def test_stemmer(self):
+        self.assertEqual(stem('яблоками'), 'яблок')
+        self.assertEqual(stem('молочные'), 'молочн')
+        self.assertEqual(stem('свежий'), stem('свежее'))
+
+    def test_search_uses_morphology_and_related_names(self):
+        self.assertEqual(self.search('молока'), ['milk'])
+        self.assertEqual(self.search('яблоками'), ['antonovka', 'milk'])
+        self.assertEqual(self.search('фрукты антоновка'), ['antonovka'])
+
+    def test_last_word_matches_by_prefix(self):
+        self.assertEqual(self.search('пастер'), ['milk'])
+
+    def test_search_does_not_query_products_table_for_matching(self):
+        self.search('молоко')
+
+        # Только загрузка страницы результатов: ETag строится без агрегата по таблице товаров
+        with self.assertNumQueries(1):
+            self.search('молоко')
+
+    def test_index_is_updated_on_save_and_delete(self):
+        self.search('молоко')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.name = 'Кефир'
+            self.milk.save()
+        self.assertEqual(self.search('молоко'), ['milk'])
+        self.assertEqual(self.search('кефир'), ['milk'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.delete()
+        self.assertEqual(self.search('кефир'), [])
+
+    def test_index_is_updated_when_section_becomes_unavailable(self):
+        self.search('антоновка')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.section.available = False
+            self.section.save()
+
+        self.assertEqual(self.search('антоновка'), [])
+
+    def test_changes_from_other_processes_are_picked_up(self):
+        self.search('молоко')
+        # Массовое изменение без сигналов, как в import_catalog или в другом процессе
+        Product.objects.filter(pk=self.milk.pk).update(
+            name='Кефир', updated_at=self.milk.updated_at + timedelta(seconds=1)
+        )
+
+        self.assertEqual(self.search('кефир'), [])
+        with mock.patch('catalog.memory_index.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(self.search('кефир'), ['milk'])
+
+
+    def test_etag_changes_when_stale_index_catches_up(self):
+        etag = self.client.get(self.url, {'q': 'кефир'})['ETag']
+        # Другой процесс изменил товар и сбросил кэш ответов; индекс этого процесса еще не знает об этом
+        Product.objects.filter(pk=self.milk.pk).update(
+            name='Кефир', updated_at=self.milk.updated_at + timedelta(seconds=1)
+        )
+        response_cache.invalidate(invalidation_tags(self.milk))
+
+        stale = self.client.get(self.url, {'q': 'кефир'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.json()['results'], [])
+
+        with mock.patch('catalog.memory_index.time.monotonic', return_value=time.monotonic() + 60):
+            fresh = self.client.get(self.url, {'q': 'кефир'}, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual([p['slug'] for p in fresh.json()['results']], ['milk'])
+
+
+class FacetFilterTest(CatalogTestMixin, TestCase):
+    """Тесты фасетной фильтрации списка товаров и поиска"""
+
+    def setUp(self):
+        product_facet_index.clear()
+        product_search_index.clear()
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product('Яблочный сок', 'juice', price=Decimal('250.00'), quantity_type='л')
+            self.create_product('Яблоки сушеные', 'dried', price=Decimal('450.00'), quantity_value=Decimal('0.50'))
+        self.url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+
+    def facet(self, data, name):
+        return {item.get('value', item.get('min')): item['count'] for item in data['facets'][name]}
+
+    def test_unfiltered_facets(self):
+        data = self.client.get(self.url).json()
+
+        self.assertEqual(self.facet(data, 'quantity_type'), {'кг': 2, 'л': 1})
+        self.assertEqual(self.facet(data, 'price'), {'100': 2, '300': 1})
+        self.assertEqual(self.facet(data, 'quantity_value'), {'0.50': 1, '1.00': 2})
+
+    def test_filters_apply_to_results_and_other_facets(self):
+        data = self.client.get(self.url, {'quantity_type': 'кг', 'price_min': '200'}).json()
+
+        self.assertEqual([p['slug'] for p in data['results']], ['dried'])
+        # Фасет по единице измерения не учитывает собственный фильтр
+        self.assertEqual(self.facet(data, 'quantity_type'), {'кг': 1, 'л': 1})
+        self.assertEqual(self.facet(data, 'price'), {'100': 1, '300': 1})
+
+    def test_facet_counts_follow_updates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.quantity_type = 'шт'
+            self.product.save()
+
+        data = self.client.get(self.url).json()
+
+        self.assertEqual(self.facet(data, 'quantity_type'), {'кг': 1, 'л': 1, 'шт': 1})
+
+    def test_search_supports_filters_and_facets(self):
+        data = self.client.get(reverse('catalog_api:product_search'), {'q': 'яблоки', 'quantity_type': 'л'}).json()
+
+        self.assertEqual([p['slug'] for p in data['results']], ['juice'])
+        self.assertEqual(self.facet(data, 'quantity_type'), {'кг': 2, 'л': 1})
+
+    def test_invalid_filter_returns_400(self):
+        response = self.client.get(self.url, {'price_min': 'дорого'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_finite_filter_returns_400(self):
+        for params in (
+            {'price_min': 'NaN'}, {'price_min': 'sNaN'}, {'price_max': 'Infinity'}, {'quantity_value': 'NaN'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+def make_image_file(name='image.png', size=(800, 600), color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageProcessingTest(CatalogTestMixin, TestCase):
+    """Тесты фоновой обработки изображений"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        super().setUp()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_image_is_processed_in_background(self):
+        self.product.image = make_image_file()
+        self.product.save()
+
+        with Image.open(self.product.image.path) as img:
+            self.assertEqual(img.size, (800, 600))
+        self.assertEqual(Task.objects.filter(status=Task.STATUS_PENDING).count(), 1)
+
+        run_pending_tasks()
+
+        with Image.open(self.product.image.path) as img:
+            self.assertEqual(img.size, (500, 375))
+        self.product.refresh_from_db()
+        self.assertEqual(len(self.product.image_hash), 64)
+
+    def test_category_image_is_cropped_to_square(self):
+        self.category.image = make_image_file()
+        self.category.save()
+        run_pending_tasks()
+
+        with Image.open(self.category.image.path) as img:
+            self.assertEqual(img.size, (300, 300))
+
+    def test_saving_other_fields_does_not_enqueue_processing(self):
+        self.product.image = make_image_file()
+        self.product.save()
+        run_pending_tasks()
+
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal('150.00')
+        product.save()
+
+        self.assertFalse(Task.objects.filter(status=Task.STATUS_PENDING).exists())
+
+
+class ImportCatalogTest(CatalogTestMixin, TestCase):
+    """Тесты пакетного импорта каталога"""
+    header = 'category_slug,category_name,section_slug,section_name,slug,name,price,quantity_type,quantity_value,available,image\n'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=os.path.join(self.directory, 'media'))
+        self.settings_override.enable()
+        super().setUp()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def import_file(self, path, **options):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_csv_import_creates_and_updates_by_slug(self):
+        path = self.write_file('catalog.csv', self.header + (
+            'fruits,Фрукты,apples,Яблоки,antonovka,Антоновка,120.50,кг,1,1,\n'
+            'fruits,Фрукты,pears,Груши,duchess,Дюшес,200,кг,1,да,\n'
+            'vegetables,Овощи,potatoes,Картофель,gala,Гала,40,кг,2.5,0,\n'
+        ))
+
+        output = self.import_file(path, chunk_size=2)
+
+        self.assertIn('строк/с', output)
+        self.assertEqual(Product.objects.count(), 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('120.50'))
+        gala = Product.objects.select_related('section__category').get(slug='gala')
+        self.assertEqual(gala.section.category.name, 'Овощи')
+        self.assertFalse(gala.available)
+
+    def test_unchanged_rows_are_not_written(self):
+        path = self.write_file('catalog.csv', self.header + 'fruits,Фрукты,apples,Яблоки,antonovka,Антоновка,100,кг,1,1,\n')
+        self.import_file(path)
+        updated_at = Product.objects.get(slug='antonovka').updated_at
+
+        output = self.import_file(path)
+
+        self.assertIn('без изменений: 1', output)
+        self.assertEqual(Product.objects.get(slug='antonovka').updated_at, updated_at)
+
+    def test_jsonl_import_with_images(self):
+        images = os.path.join(self.directory, 'images')
+        os.makedirs(images)
+        with open(os.path.join(images, 'milk.png'), 'wb') as f:
+            f.write(make_image_file().read())
+        path = self.write_file('catalog.jsonl', (
+            '{"category_slug": "dairy", "section_slug": "milk", "slug": "milk", "name": "Молоко", '
+            '"price": "89.90", "quantity_type": "л", "quantity_value": "1", "image": "milk.png"}\n'
+        ))
+
+        self.import_file(path, images=images)
+        self.import_file(path, images=images)
+
+        milk = Product.objects.get(slug='milk')
+        self.assertEqual(milk.image.name, 'products/milk.png')
+        self.assertTrue(os.path.exists(milk.image.path))
+        self.assertEqual(Task.objects.filter(kwargs__pk=milk.pk).count(), 1)
+
+    def test_new_image_drops_old_hash(self):
+        images = os.path.join(self.directory, 'images')
+        os.makedirs(images)
+        with open(os.path.join(images, 'new.png'), 'wb') as f:
+            f.write(make_image_file().read())
+        Product.objects.filter(pk=self.product.pk).update(image='products/old.png', image_hash='f' * 64)
+        path = self.write_file('catalog.csv', self.header + 'fruits,Фрукты,apples,Яблоки,antonovka,Антоновка,100,кг,1,1,new.png\n')
+
+        self.import_file(path, images=images)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image.name, 'products/new.png')
+        # До обработки у товара нет вариантов со старым токеном
+        self.assertEqual(self.product.image_hash, '')
+        self.assertIsNone(ProductSerializer(self.product).data['image_srcset'])
+
+    def test_non_string_values_report_line(self):
+        path = self.write_file('catalog.jsonl', (
+            '{"category_slug": "dairy", "category_name": 1, "section_slug": "milk", "slug": "milk", '
+            '"name": "Молоко", "price": "89.90", "quantity_type": "л", "quantity_value": "1", "image": 5}\n'
+        ))
+
+        with self.assertRaisesMessage(CommandError, 'Строка 1: указано изображение'):
+            self.import_file(path)
+
+    def test_rolled_back_chunk_removes_copied_images(self):
+        images = os.path.join(self.directory, 'images')
+        os.makedirs(images)
+        with open(os.path.join(images, 'milk.png'), 'wb') as f:
+            f.write(make_image_file().read())
+        path = self.write_file('catalog.jsonl', (
+            '{"category_slug": "dairy", "section_slug": "milk", "slug": "milk", "name": "Молоко", '
+            '"price": "89.90", "quantity_type": "л", "quantity_value": "1", "image": "milk.png"}\n'
+            '{"category_slug": "dairy", "section_slug": "milk", "slug": "kefir", "name": "Кефир", '
+            '"price": "99.90", "quantity_type": "л", "quantity_value": "1", "image": "kefir.png"}\n'
+        ))
+
+        with self.assertRaisesMessage(CommandError, 'нет файла изображения kefir.png'):
+            self.import_file(path, images=images)
+
+        self.assertFalse(Product.objects.filter(slug='milk').exists())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'media', 'products', 'milk.png')))
+
+    def test_import_invalidates_api_cache(self):
+        url = reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+        self.client.get(url)
+        path = self.write_file('catalog.csv', self.header + 'fruits,Фрукты,apples,Яблоки,antonovka,Антоновка,150,кг,1,1,\n')
+
+        self.import_file(path)
+
+        self.assertEqual(self.client.get(url).json()['results'][0]['price'], '150.00')
+
+    def test_invalid_row_reports_line(self):
+        path = self.write_file('catalog.csv', self.header + 'fruits,Фрукты,apples,Яблоки,antonovka,Антоновка,дорого,кг,1,1,\n')
+
+        with self.assertRaisesMessage(CommandError, 'Строка 2'):
+            self.import_file(path)
+
+
+class ExportCatalogTest(CatalogTestMixin, TestCase):
+    """Тесты потоковой выгрузки каталога"""
+
+    def test_ndjson_export(self):
+        out = StringIO()
+        call_command('export_catalog', stdout=out)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(rows, [{
+            'category_slug': 'fruits', 'category_name': 'Фрукты', 'section_slug': 'apples',
+            'section_name': 'Яблоки', 'slug': 'antonovka', 'name': 'Антоновка', 'description': '',
+            'price': '100.00', 'quantity_type': 'кг', 'quantity_value': '1.00', 'available': True, 'image': '',
+        }])
+
+    def test_csv_export_can_be_imported_back(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'catalog.csv')
+        call_command('export_catalog', format='csv', output=path)
+        Product.objects.all().delete()
+
+        call_command('import_catalog', path, stdout=StringIO())
+
+        product = Product.objects.get(slug='antonovka')
+        self.assertEqual(product.section_id, self.section.pk)
+        self.assertEqual(product.price, Decimal('100.00'))
+
+    def test_admin_export_streams_for_staff(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('admin:catalog_product_export', kwargs={'fmt': 'csv'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['category_slug', 'category_name'])
+        self.assertEqual(len(lines), 2)
+
+    async def test_admin_export_streams_asynchronously_under_asgi(self):
+        user = await User.objects.acreate_superuser('admin', 'admin@example.com', 'password')
+        await self.async_client.aforce_login(user)
+
+        response = await self.async_client.get(reverse('admin:catalog_product_export', kwargs={'fmt': 'ndjson'}))
+
+        self.assertEqual(response.status_code, 200)
+        # Асинхронный итератор отдается ASGI без предварительного чтения в память
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        self.assertEqual([json.loads(line)['slug'] for line in content.splitlines()], ['antonovka'])
+
+    def test_admin_export_requires_login(self):
+        response = self.client.get(reverse('admin:catalog_product_export', kwargs={'fmt': 'ndjson'}))
+
+        self.assertEqual(response.status_code, 302)
+
+
+class ProductAdminAtScaleTest(CatalogTestMixin, TestCase):
+    """Тесты списка товаров в админке на больших таблицах"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.url = reverse('admin:catalog_product_changelist')
+
+    def search(self, term):
+        admin_site = ProductAdmin(Product, None)
+        queryset, _ = admin_site.get_search_results(None, Product.objects.all(), term)
+        return queryset
+
+    def test_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        for i in range(20):
+            section = Section.objects.create(category=self.category, name=f'Раздел {i}', slug=f'section-{i}')
+            self.create_product(f'Товар {i}', f'product-{i}', section=section)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+    def test_section_filter_does_not_list_sections(self):
+        Section.objects.create(category=self.category, name='Груши', slug='pears')
+
+        response = self.client.get(self.url, {'section__id__exact': self.section.pk})
+
+        self.assertContains(response, 'autocomplete-filter')
+        self.assertNotContains(response, 'Груши')
+        self.assertEqual(list(response.context['cl'].result_list), [self.product])
+
+    def test_search(self):
+        hidden = self.create_product('Белый налив', 'white', available=False, description='летний сорт')
+
+        self.assertEqual(list(self.search('антон')), [self.product])
+        self.assertEqual(list(self.search('белый')), [hidden])
+        self.assertEqual(list(self.search('white')), [hidden])
+        self.assertEqual(list(self.search(str(hidden.pk))), [hidden])
+        # Слова из раздела ищутся по полнотекстовому индексу (только доступные товары)
+        self.assertEqual(list(self.search('яблоки')), [self.product])
+
+    def test_search_uses_indexes(self):
+        plan = self.search('антон').explain()
+
+        self.assertEqual(find_full_scans(plan), [])
+
+    def test_estimated_count(self):
+        for i in range(5):
+            self.create_product(f'Товар {i}', f'product-{i}')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.assertEqual(estimated_row_count(Product), 6)
+        with mock.patch('catalog.admin_tools.EXACT_COUNT_THRESHOLD', 0):
+            with self.assertNumQueries(1) as context:
+                count = EstimatedCountPaginator(Product.objects.all(), 2).count
+        self.assertEqual(count, 6)
+        self.assertNotIn('COUNT', context.captured_queries[0]['sql'])
+
+    def test_filtered_count_is_limited(self):
+        for i in range(5):
+            self.create_product(f'Товар {i}', f'product-{i}')
+
+        with mock.patch('catalog.admin_tools.FILTERED_COUNT_LIMIT', 3):
+            count = EstimatedCountPaginator(Product.objects.filter(available=True), 2).count
+
+        self.assertEqual(count, 3)
+
+
+class ImageVariantTest(CatalogTestMixin, TestCase):
+    """Тесты вариантов изображений и дискового кэша"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        super().setUp()
+        self.product.image = make_image_file()
+        self.product.save()
+        run_pending_tasks()
+        self.product.refresh_from_db()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def get_srcset(self):
+        url = reverse('catalog_api:product_detail', kwargs={
+            'category_slug': 'fruits', 'section_slug': 'apples', 'slug': 'antonovka',
+        })
+        return self.client.get(url).json()['image_srcset']
+
+    def test_srcset_lists_content_hashed_variants(self):
+        srcset = self.get_srcset()
+
+        self.assertIn(self.product.image_hash[:16], srcset['webp'])
+        self.assertTrue(srcset['jpeg'].endswith('/500.jpeg 500w'))
+
+    def test_variant_is_resized_and_cached_forever(self):
+        url = self.get_srcset()['webp'].split(', ')[0].split(' ')[0]
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (100, 75))
+        variant_cache.clear()
+
+    def test_new_image_has_no_variants_until_processed(self):
+        old_hash = self.product.image_hash
+        self.product.image = make_image_file(color='blue')
+        self.product.save()
+
+        self.assertIsNone(self.get_srcset())
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending_tasks()
+        srcset = self.get_srcset()
+        self.assertNotIn(old_hash[:16], srcset['webp'])
+
+    def test_outdated_hash_returns_404(self):
+        url = reverse('catalog_api:image_variant', kwargs={
+            'kind': 'product', 'pk': self.product.pk, 'token': '0' * 16, 'width': 100, 'fmt': 'webp',
+        })
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cache_evicts_least_recently_used_files(self):
+        cache_dir = tempfile.mkdtemp(dir=self.media_root)
+        small_cache = VariantCache(directory=cache_dir, max_bytes=250)
+        small_cache.put('a', b'x' * 100)
+        small_cache.put('b', b'x' * 100)
+        os.utime(small_cache.path('a'), (1, 1))
+        os.utime(small_cache.path('b'), (2, 2))
+        small_cache.get('a')
+
+        small_cache.put('c', b'x' * 100)
+
+        self.assertIsNotNone(small_cache.get('a'))
+        self.assertIsNone(small_cache.get('b'))
+        self.assertIsNotNone(small_cache.get('c'))
+
+    def test_cache_counts_files_of_other_processes(self):
+        cache_dir = tempfile.mkdtemp(dir=self.media_root)
+        first = VariantCache(directory=cache_dir, max_bytes=1000)
+        second = VariantCache(directory=cache_dir, max_bytes=1000)
+        for index in range(5):
+            first.put(f'first-{index}', b'x' * 100)
+            second.put(f'second-{index}', b'x' * 100)
+
+        first.put('last', b'x' * 100)
+
+        self.assertLessEqual(sum(entry.stat().st_size for entry in os.scandir(cache_dir)), 1000)
+
+
+class MediaServingTest(TestCase):
+    """Тесты отдачи изображений каталога"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        with open(os.path.join(self.media_root, 'products', 'photo.jpg'), 'wb') as f:
+            f.write(b'0123456789')
+        self.url = '/media/products/photo.jpg'
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_full_response_has_validators(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+    def test_matching_etag_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_request_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+    def test_unsatisfiable_range_returns_416(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-30')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_accel_redirect_offload(self):
+        with self.settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/products/photo.jpg')
+        self.assertEqual(response.content, b'')
+
+    def test_path_outside_media_root_is_rejected(self):
+        response = self.client.get('/media/products/../../etc/passwd')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class StockTest(CatalogTestMixin, TestCase):
+    """Тесты учета остатка и резервов"""
+
+    def stock(self):
+        self.product.refresh_from_db()
+        shards = list(StockShard.objects.filter(product=self.product).values_list('quantity', flat=True))
+        return sum(shards) if shards else self.product.stock
+
+    def test_reserve_decrements_with_conditional_update(self):
+        set_stock(self.product.pk, 5)
+
+        # Списание, проверка нулевого остатка и запись резерва (плюс точка сохранения)
+        with self.assertNumQueries(5):
+            reserve(self.product.pk, 2)
+
+        self.assertEqual(self.stock(), 3)
+        with self.assertRaises(OutOfStock):
+            reserve(self.product.pk, 4)
+        self.assertEqual(self.stock(), 3)
+
+    def test_untracked_product_is_not_limited(self):
+        reserve(self.product.pk, 1000)
+
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.stock)
+        self.assertTrue(self.product.available)
+
+    def test_availability_follows_zero_stock(self):
+        set_stock(self.product.pk, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = reserve(self.product.pk, 2)
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.available)
+        self.assertNotIn(self.product.pk, product_search_index.search('антоновка'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release(reservation)
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.available)
+        self.assertEqual(self.product.stock, 2)
+        self.assertFalse(release(reservation))
+
+    def test_manually_hidden_product_stays_hidden(self):
+        set_stock(self.product.pk, 3)
+        Product.objects.filter(pk=self.product.pk).update(available=False)
+
+        release(reserve(self.product.pk, 1))
+
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.available)
+
+    def test_hidden_product_stays_hidden_after_selling_out(self):
+        set_stock(self.product.pk, 2)
+        Product.objects.filter(pk=self.product.pk).update(available=False)
+
+        release(reserve(self.product.pk, 2))
+        set_stock(self.product.pk, 0)
+        set_stock(self.product.pk, 5)
+
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.available)
+        self.assertFalse(self.product.sold_out)
+
+    def test_expired_reservations_return_to_stock(self):
+        set_stock(self.product.pk, 1)
+        expired = reserve(self.product.pk, 1, ttl=timedelta(seconds=-1))
+
+        # Товара нет, но просроченный резерв возвращается при следующей попытке
+        reservation = reserve(self.product.pk, 1)
+
+        self.assertFalse(confirm(expired))
+        self.assertTrue(confirm(reservation))
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(release_expired(), 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_sharded_stock(self):
+        set_stock(self.product.pk, 10, shards=4)
+        self.assertEqual(list(StockShard.objects.values_list('quantity', flat=True).order_by('index')), [3, 3, 2, 2])
+
+        reservations = [reserve(self.product.pk, 2) for _ in range(3)]
+        # Ни в одном шарде не осталось 4 единиц: резерв набирается из нескольких
+        reserve(self.product.pk, 4)
+        with self.assertRaises(OutOfStock):
+            reserve(self.product.pk, 1)
+
+        self.assertEqual(self.stock(), 0)
+        self.assertFalse(self.product.available)
+        release(reservations[0])
+        self.assertEqual(self.stock(), 2)
+        self.assertTrue(self.product.available)
+
+    def test_set_stock_command(self):
+        call_command('set_stock', 'antonovka', '7', '--shards', '2', stdout=StringIO())
+        self.assertEqual(self.stock(), 7)
+        self.assertIsNone(self.product.stock)
+
+        call_command('set_stock', 'antonovka', 'none', stdout=StringIO())
+        self.assertIsNone(self.stock())
+        self.assertEqual(self.product.stock_shards, 0)
+
+
+class StockConcurrencyTest(TransactionTestCase):
+    """Одновременные покупки одного товара из многих потоков"""
+
+    THREADS = 16
+    ATTEMPTS = 10
+    STOCK = 100
+
+    def setUp(self):
+        category = Category.objects.create(name='Фрукты', slug='fruits')
+        section = Section.objects.create(category=category, name='Яблоки', slug='apples')
+        self.product = Product.objects.create(
+            section=section, name='Антоновка', slug='antonovka',
+            price=Decimal('100.00'), quantity_type='кг', quantity_value=Decimal('1.00'),
+        )
+
+    def hammer(self):
+        results = []
+
+        def worker():
+            for _ in range(self.ATTEMPTS):
+                try:
+                    reserve(self.product.pk, 1)
+                    results.append(True)
+                except OutOfStock:
+                    results.append(False)
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def assert_not_oversold(self, results):
+        self.assertEqual(len(results), self.THREADS * self.ATTEMPTS)
+        self.assertEqual(results.count(True), self.STOCK)
+        self.assertEqual(StockReservation.objects.count(), self.STOCK)
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.available)
+
+    def test_single_counter(self):
+        set_stock(self.product.pk, self.STOCK)
+
+        self.assert_not_oversold(self.hammer())
+
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 0)
+
+    def test_sharded_counter(self):
+        set_stock(self.product.pk, self.STOCK, shards=8)
+
+        self.assert_not_oversold(self.hammer())
+
+        self.assertFalse(StockShard.objects.filter(quantity__gt=0).exists())
+
+
+# Корневой urlconf, в котором API каталога обслуживается асинхронными представлениями, как под ASGI
+class async_api_urlconf:
+    urlpatterns = [path('api/catalog/', include('catalog.async_api_urls', namespace='catalog_api'))]
+
+
+class AsyncCatalogAPITest(CatalogTestMixin, TestCase):
+    """Асинхронные представления API каталога отвечают так же, как синхронные"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_product('Белый налив', 'white', price=Decimal('80.00'))
+        self.urls = [
+            reverse('catalog_api:category_list'),
+            reverse('catalog_api:category_detail', kwargs={'slug': 'fruits'}),
+            reverse('catalog_api:section_list', kwargs={'category_slug': 'fruits'}),
+            reverse('catalog_api:section_detail', kwargs={'category_slug': 'fruits', 'slug': 'apples'}),
+            reverse('catalog_api:product_list', kwargs={'category_slug': 'fruits', 'section_slug': 'apples'})
+            + '?page_size=1&price_max=90',
+            reverse('catalog_api:product_detail', kwargs={
+                'category_slug': 'fruits', 'section_slug': 'apples', 'slug': 'antonovka',
+            }),
+        ]
+
+    @override_settings(CATALOG_API_CACHE_TIMEOUT=0)
+    async def test_responses_match_sync_views(self):
+        for url in self.urls:
+            expected = await self.async_client.get(url)
+            with self.settings(ROOT_URLCONF=async_api_urlconf):
+                response = await self.async_client.get(url)
+
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.json(), expected.json(), url)
+            self.assertEqual(response['ETag'], expected['ETag'], url)
+
+    @override_settings(ROOT_URLCONF=async_api_urlconf)
+    async def test_conditional_get_and_response_cache(self):
+        url = self.urls[1]
+        response = await self.async_client.get(url)
+
+        cached = await self.async_client.get(url)
+        self.assertEqual(cached.json(), response.json())
+        not_modified = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    @override_settings(ROOT_URLCONF=async_api_urlconf)
+    async def test_missing_object_returns_404(self):
+        response = await self.async_client.get(
+            reverse('catalog_api:category_detail', kwargs={'slug': 'missing'}, urlconf=async_api_urlconf)
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'No Category matches the given query.'})
@@ -0,0 +1,85 @@
+import json
+from django.core.cache import cache
+from django.db import transaction
+from shop.routers import primary_reads
+from .conditional import make_etag
+from .models import Category
+from .serializers import CategorySerializer
+
+# Ключ кэша, под которым хранится предрассчитанное дерево каталога
+CATALOG_TREE_CACHE_KEY = 'catalog:tree'
+
+
+def build_catalog_tree():
+    """
+    Строит дерево доступных категорий, разделов и товаров.
+    Выполняет ровно три запроса независимо от размера каталога.
+    """
+    categories = CategorySerializer.setup_eager_loading(Category.objects.filter(available=True))
+    return {'categories': CategorySerializer(categories, many=True).data}
+
+
+def rebuild_catalog_tree():
+    """
+    Перестраивает дерево каталога и сохраняет его в кэш вместе с ETag. Кэш общий
+    для всех процессов (CACHES), поэтому новое дерево сразу видят и другие воркеры.
+    """
+    # Дерево хранится в кэше до следующего изменения, поэтому строится по основной базе
+    with primary_reads():
+        tree = build_catalog_tree()
+    document = {'tree': tree, 'etag': make_etag(json.dumps(tree, sort_keys=True, default=str))}
+    cache.set(CATALOG_TREE_CACHE_KEY, document, timeout=None)
+    return document
+
+
+class ScheduledRebuild:
+    """Перестройка дерева, ожидающая фиксации транзакции"""
+
+    def __init__(self):
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        rebuild_catalog_tree()
+
+
+def schedule_catalog_tree_rebuild():
+    """
+    Планирует перестройку дерева после фиксации текущей транзакции.
+    При массовых изменениях в одной транзакции дерево перестраивается один раз.
+    Повтор ищется только среди колбэков этой же транзакции: колбэк другой транзакции
+    может не выполниться, если она откатится.
+    """
+    connection = transaction.get_connection()
+    # Колбэк, снятый откатом транзакции или точки сохранения, отсюда тоже пропадает
+    if any(isinstance(func, ScheduledRebuild) and not func.done for _, func, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(ScheduledRebuild())
+
+
+def get_catalog_tree_document():
+    """
+    Возвращает {'tree': дерево, 'etag': ETag дерева} из кэша,
+    при отсутствии строит дерево заново.
+    """
+    document = cache.get(CATALOG_TREE_CACHE_KEY)
+    if document is None:
+        document = rebuild_catalog_tree()
+    return document
+
+
+def get_catalog_tree():
+    """Возвращает дерево каталога"""
+    return get_catalog_tree_document()['tree']
+
+
+def find_category_subtree(tree, slug):
+    """Возвращает поддерево одной категории или None, если категория недоступна"""
+    for category in tree['categories']:
+        if category['slug'] == slug:
+            return category
+    return None
+
+
+def get_category_subtree(slug):
+    return find_category_subtree(get_catalog_tree(), slug)
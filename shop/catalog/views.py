@@ -1,7 +1,21 @@
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
 from django.views.generic import ListView, DetailView
+from .image_variants import VARIANT_FORMATS, VARIANT_WIDTHS, image_token, get_variant_path
+from .media import serve_file
 from .models import Category, Section, Product
 
+# Модели, изображения которых можно получить в виде вариантов
+IMAGE_MODELS = {
+    'category': Category,
+    'section': Section,
+    'product': Product,
+}
+
 # Create your views here.
 
 class CategoryListView(ListView):
@@ -74,3 +88,40 @@ class ProductDetailView(DetailView):
         product = get_object_or_404(Product, slug=product_slug, section=section, available=True)
         
         return product
+
+
+@require_safe
+def image_variant(request, kind, pk, token, width, fmt):
+    """
+    Отдает вариант изображения нужной ширины и формата.
+    URL содержит хеш содержимого, поэтому ответ кэшируется клиентом навсегда.
+    """
+    model = IMAGE_MODELS.get(kind)
+    if model is None or width not in VARIANT_WIDTHS or fmt not in VARIANT_FORMATS:
+        raise Http404("Вариант изображения не найден")
+
+    obj = model.objects.filter(pk=pk).only('image', 'image_hash').first()
+    if obj is None or image_token(obj) != token:
+        raise Http404("Вариант изображения не найден")
+
+    return serve_file(
+        request,
+        get_variant_path(kind, obj, width, fmt),
+        content_type=VARIANT_FORMATS[fmt][1],
+        cache_control='public, max-age=31536000, immutable',
+    )
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдает изображения категорий, разделов и товаров из MEDIA_ROOT.
+    Используется вместо django.conf.urls.static, который работает только при DEBUG.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Файл не найден")
+    # Имя файла меняется при загрузке нового изображения, но обработка может изменить
+    # файл на месте, поэтому клиент перепроверяет его через ETag при каждом обращении
+    return serve_file(request, full_path, cache_control='public, no-cache')
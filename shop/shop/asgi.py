@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop.settings')
+# Под ASGI API каталога обслуживается асинхронными представлениями
+os.environ.setdefault('CATALOG_ASYNC_API', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,77 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from functools import partial, wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+# Первая задержка перед повтором и ее предел, в секундах
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 1.0
+
+
+def is_database_locked(exc):
+    """Ошибка SQLite «database is locked»: блокировку записи не удалось получить за busy_timeout"""
+    return isinstance(exc, OperationalError) and 'database is locked' in str(exc)
+
+
+def retry_on_locked(func=None, *, using=DEFAULT_DB_ALIAS):
+    """
+    Повторяет функцию, которая пишет в базу в собственной транзакции, если SQLite
+    вернул «database is locked». Повторов не больше SQLITE_WRITE_RETRIES, задержка
+    растет экспоненциально и случайно уменьшается, чтобы повторы разных процессов
+    не совпадали. С BEGIN IMMEDIATE блокировка берется в начале транзакции,
+    поэтому неудачная попытка ничего не успевает записать.
+    Внутри внешней транзакции функция не повторяется: откатывать пришлось бы
+    всю транзакцию вызывающего кода.
+    """
+    if func is None:
+        return partial(retry_on_locked, using=using)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        connection = connections[using]
+        nested = connection.in_atomic_block
+        retries = getattr(settings, 'SQLITE_WRITE_RETRIES', 3)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if nested or attempt >= retries or not is_database_locked(exc):
+                    raise
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+            time.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+
+    return wrapper
+
+
+def snapshot_database(destination, using=DEFAULT_DB_ALIAS):
+    """
+    Копирует базу SQLite в файл destination (реплику для чтения). Копия создается
+    резервным копированием SQLite во временный файл рядом и подменяет destination
+    переименованием, поэтому читатели видят либо прежний снимок, либо новый целиком.
+    Соединения с репликой должны открываться заново (CONN_MAX_AGE=0), иначе
+    они продолжат читать прежний файл.
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.sqlite3')
+    os.close(descriptor)
+    try:
+        connection = connections[using]
+        connection.ensure_connection()
+        target = sqlite3.connect(temporary)
+        try:
+            connection.connection.backup(target)
+            # Снимок только читают, журнал WAL ему не нужен
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
@@ -0,0 +1,250 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Cookie, до истечения которой запросы клиента читают с основной базы
+PIN_COOKIE = 'db_primary_until'
+
+# Метка приложения модели DatabaseCache; ее таблица живет в базе CACHE_DATABASE
+CACHE_APP_LABEL = 'django_cache'
+
+# Запросы этими методами читают из основной базы с самого начала
+UNSAFE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# Чтение текущего запроса закреплено за основной базой. Вне запроса (команды manage.py)
+# значение живет до конца потока: после первой записи команда читает только из основной
+# базы. Воркер задач закрепляет чтение каждой задачи сам (см. tasks.queue.run_pending_tasks)
+_pinned = ContextVar('db_primary_pinned', default=False)
+# Текущий запрос писал в базу
+_wrote = ContextVar('db_wrote', default=False)
+# Реплика, выбранная для чтения текущего запроса
+_replica = ContextVar('db_replica', default=None)
+# Запрос к реплике в текущем запросе завершился ошибкой
+_replica_failed = ContextVar('db_replica_failed', default=False)
+
+
+def pin_to_primary():
+    """Направляет все последующие чтения текущего запроса в основную базу"""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def primary_reads():
+    """
+    Чтение внутри блока идет в основную базу. Нужен для долгоживущих данных, которые
+    строятся один раз на все процессы или запросы (дерево каталога, индексы в памяти,
+    задачи): снимок из отстающей реплики остался бы в них до следующего изменения.
+    """
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def read_from_replica():
+    """Читал ли текущий запрос каталог из реплики"""
+    return _replica.get() is not None
+
+
+def cache_database():
+    """База таблицы DatabaseCache: CACHE_DATABASE или основная"""
+    return getattr(settings, 'CACHE_DATABASE', DEFAULT_DB_ALIAS)
+
+
+class ReplicaHealth:
+    """
+    Состояние реплик в процессе: реплика, на которой произошла ошибка, не используется
+    REPLICA_RETRY_INTERVAL секунд, после чего снова проверяется подключением.
+    """
+
+    def __init__(self):
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_INTERVAL', 10)
+
+    def reset(self):
+        with self._lock:
+            self._down_until.clear()
+
+    def is_down(self, alias):
+        down_until = self._down_until.get(alias)
+        return down_until is not None and down_until > time.monotonic()
+
+    def is_up(self, alias):
+        """Проверяет реплику подключением, если она не выведена из ротации"""
+        if self.is_down(alias):
+            return False
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            self.mark_down(alias)
+            return False
+        with self._lock:
+            self._down_until.pop(alias, None)
+        return True
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """
+    Направляет чтение моделей из REPLICA_APPS в реплики REPLICA_DATABASES, все остальное —
+    в основную базу. Чтение остается в основной базе, если запрос уже писал в базу,
+    выполняется внутри транзакции или клиент недавно писал (cookie PIN_COOKIE,
+    см. PrimaryPinMiddleware), а также если ни одна реплика недоступна.
+    Реплика выбирается один раз на запрос: все его чтения видят один снимок,
+    а подключение проверяется только при выборе, а не перед каждым чтением.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return cache_database()
+        replicas = getattr(settings, 'REPLICA_DATABASES', [])
+        if (
+            not replicas
+            or model._meta.app_label not in getattr(settings, 'REPLICA_APPS', ['catalog'])
+            or is_pinned()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        alias = _replica.get()
+        # Открытое соединение с выбранной репликой не проверяется заново; закрытое
+        # (конец запроса или CONN_MAX_AGE) проверяется подключением при новом выборе
+        if alias in replicas and connections[alias].connection is not None and not replica_health.is_down(alias):
+            return alias
+        candidates = list(replicas)
+        random.shuffle(candidates)
+        for alias in candidates:
+            if replica_health.is_up(alias):
+                _replica.set(alias)
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Запись в кэш не меняет данных, которые запрос читает, и не закрепляет чтение
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return cache_database()
+        # Запрос, который пишет, дальше читает свои же изменения из основной базы
+        pin_to_primary()
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между объектами из них допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == CACHE_APP_LABEL or db == cache_database():
+            return app_label == CACHE_APP_LABEL and db == cache_database()
+        return db not in getattr(settings, 'REPLICA_DATABASES', [])
+
+
+class PrimaryPinMiddleware:
+    """
+    Закрепляет чтение за основной базой для запросов, которые пишут, и на
+    REPLICA_PIN_SECONDS секунд после них для того же клиента: реплика может
+    отставать, и клиент не должен увидеть данные до своего изменения.
+    Запрос, который завершился ошибкой сервера из-за сбоя запроса к реплике и ничего
+    не записал, выполняется повторно с чтением из основной базы. Потоковый ответ,
+    начатый до сбоя, повторить нельзя.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Под ASGI middleware работает без перехода в поток, как и остальные в цепочке
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            response = self.get_response(request)
+            if self.should_retry(response):
+                pin_to_primary()
+                response = self.get_response(request)
+            return self.finish(response)
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            response = await self.get_response(request)
+            if self.should_retry(response):
+                pin_to_primary()
+                response = await self.get_response(request)
+            return self.finish(response)
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        pinned = request.method in UNSAFE_METHODS or self.pinned_by_cookie(request)
+        return _pinned.set(pinned), _wrote.set(False), _replica.set(None), _replica_failed.set(False)
+
+    @staticmethod
+    def should_retry(response):
+        return response.status_code >= 500 and _replica_failed.get() and not _wrote.get()
+
+    @staticmethod
+    def finish(response):
+        if _wrote.get():
+            pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + pin_seconds), max_age=pin_seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+    @staticmethod
+    def reset(tokens):
+        pinned, wrote, replica, replica_failed = tokens
+        _pinned.reset(pinned)
+        _wrote.reset(wrote)
+        _replica.reset(replica)
+        _replica_failed.reset(replica_failed)
+
+    @staticmethod
+    def pinned_by_cookie(request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+@receiver(connection_created)
+def watch_replica_errors(sender, connection, **kwargs):
+    """Ошибка запроса к реплике выводит ее из ротации, следующие чтения идут в основную базу"""
+    # Сигнал приходит при каждом переподключении, обертка добавляется один раз
+    if connection.alias not in getattr(settings, 'REPLICA_DATABASES', []) or getattr(connection, '_watch_errors', False):
+        return
+    connection._watch_errors = True
+
+    def mark_down_on_error(execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError:
+            replica_health.mark_down(connection.alias)
+            _replica_failed.set(True)
+            raise
+
+    connection.execute_wrappers.append(mark_down_on_error)
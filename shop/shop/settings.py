@@ -41,12 +41,14 @@ INSTALLED_APPS = [
     'accounts',
     'catalog',
     'cart',
+    'tasks',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
 ]
 
 MIDDLEWARE = [
+    'shop.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -89,13 +91,112 @@ WSGI_APPLICATION = 'shop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Профиль SQLite для одновременных запросов Mini App (SQLITE_PRODUCTION=0 возвращает умолчания SQLite):
+# WAL, чтобы чтения не ждали записи; synchronous=NORMAL — fsync только при контрольной точке WAL;
+# отображение файла в память и страничный кэш (cache_size < 0 — в КиБ); ожидание блокировки
+# вместо немедленной ошибки «database is locked»; транзакции записи начинаются с BEGIN IMMEDIATE,
+# чтобы блокировка бралась в начале транзакции, где SQLite может ее ждать, а не при первой записи.
+SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', '1') == '1'
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+        f'PRAGMA cache_size={SQLITE_CACHE_SIZE};'
+        f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)};'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_BUSY_TIMEOUT,
+}
+
+# Сколько раз повторять транзакцию записи, не получившую блокировку за SQLITE_BUSY_TIMEOUT (shop/db.py)
+SQLITE_WRITE_RETRIES = int(os.environ.get('SQLITE_WRITE_RETRIES', 3))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS if SQLITE_PRODUCTION else {},
+        # Постоянные соединения: прагмы выполняются один раз на соединение, а не на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)) if SQLITE_PRODUCTION else 0,
+        'CONN_HEALTH_CHECKS': SQLITE_PRODUCTION,
+        # Тестовая база в файле, а не в памяти: в базе в памяти с общим кэшем параллельные
+        # записи из потоков сразу завершаются ошибкой «table is locked», а не ждут блокировку
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Реплики для чтения каталога (shop/routers.py): пути к копиям основной базы через запятую.
+# Локально реплику можно получать командой `manage.py snapshot_replica --interval 5`.
+# Соединения с репликой не переиспользуются, чтобы после подмены файла читался новый снимок.
+DB_REPLICA_PATHS = [path for path in os.environ.get('DB_REPLICA_PATHS', '').split(',') if path]
+REPLICA_DATABASES = []
+for index, path in enumerate(DB_REPLICA_PATHS):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{Path(path).resolve()}?mode=ro',
+        'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT},
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['shop.routers.ReplicaRouter']
+
+# Приложения, чтение моделей которых идет в реплики; остальные читают из основной базы
+REPLICA_APPS = ['catalog']
+
+# Сколько секунд после записи клиент читает из основной базы, чтобы не увидеть отстающую реплику
+# Столько же после сброса кэша ответов API каталога ответы, прочитанные из реплики, не сохраняются в кэш
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# Сколько секунд не использовать реплику после ошибки подключения или запроса к ней
+REPLICA_RETRY_INTERVAL = int(os.environ.get('REPLICA_RETRY_INTERVAL', 10))
+
+# Кэш, общий для всех процессов: дерево каталога, кэш ответов API с версиями тегов, токены
+# и документы профилей сбрасываются в процессе, который изменил данные (воркер gunicorn/uvicorn,
+# админка, import_catalog), а остальные процессы должны этот сброс увидеть. LocMemCache
+# у каждого процесса свой и для этого не подходит. По умолчанию кэш хранится в отдельной базе
+# SQLite (CACHE_DB_PATH), общей для процессов одной машины; таблицу создает
+# `manage.py createcachetable --database cache`. Если серверов несколько, укажите REDIS_URL.
+# Файловый кэш не используется: при каждой записи он перечисляет весь каталог для вытеснения,
+# и заполнение ответа с десятками версий тегов занимает секунды (около 40 мс на запись
+# при 15 тыс. файлов против 0,2 мс у DatabaseCache при тех же 15 тыс. строк).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Отдельный файл: записи кэша не ждут блокировку основной базы и не откатываются
+    # вместе с транзакцией запроса
+    CACHE_DATABASE = 'cache'
+    DATABASES[CACHE_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': Path(os.environ.get('CACHE_DB_PATH', BASE_DIR / 'cache.sqlite3')),
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS if SQLITE_PRODUCTION else {},
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': SQLITE_PRODUCTION,
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+            # Вытеснение проверяет число строк запросом COUNT, а не перечислением файлов
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 20000))},
+        }
+    }
+
+# Тесты работают с кэшем во временном каталоге, а не с кэшем сервера
+TEST_RUNNER = 'shop.test_runner.TemporaryCacheTestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,6 +242,43 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Разгрузка отдачи изображений каталога на веб-сервер.
+# Для nginx укажите internal location, который смотрит в MEDIA_ROOT, например '/protected-media/'
+# (заголовок X-Accel-Redirect); для Apache/lighttpd с mod_xsendfile включите MEDIA_X_SENDFILE.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+MEDIA_X_SENDFILE = os.environ.get('MEDIA_X_SENDFILE') == '1'
+
+# Кэш ответов API каталога (catalog/response_cache.py); 0 отключает кэширование.
+# Записи сбрасываются по тегам при изменении каталога, время жизни — страховка.
+# Версии тегов хранятся в кэше CATALOG_API_CACHE_ALIAS, поэтому он должен быть общим
+# для всех процессов (не LocMemCache), иначе сброс не дойдет до других воркеров.
+CATALOG_API_CACHE_ALIAS = 'default'
+CATALOG_API_CACHE_TIMEOUT = int(os.environ.get('CATALOG_API_CACHE_TIMEOUT', 300))
+
+# Асинхронные представления списков и детальных страниц API каталога (catalog/async_api_views.py).
+# shop/asgi.py включает их по умолчанию: под ASGI ожидающий запрос не занимает поток
+CATALOG_ASYNC_API = os.environ.get('CATALOG_ASYNC_API') == '1'
+
+# Как часто (в секундах) индексы поиска и фасетов в памяти процесса сверяются с базой, чтобы
+# подхватить изменения из других процессов (catalog/memory_index.py); 0 отключает проверку
+CATALOG_INDEX_CHECK_INTERVAL = int(os.environ.get('CATALOG_INDEX_CHECK_INTERVAL', 30))
+
+# Быстрая сериализация списков каталога из строк .values() (catalog/serializers.py, ValuesSerializer)
+CATALOG_FAST_SERIALIZERS = os.environ.get('CATALOG_FAST_SERIALIZERS') == '1'
+
+# Окно (в секундах), в течение которого нажатия «добавить в корзину» объединяются в одну запись;
+# 0 — записывать каждое изменение сразу
+CART_COALESCE_WINDOW = float(os.environ.get('CART_COALESCE_WINDOW', 0.3))
+
+# Токен бота для проверки подписи initData Telegram Mini App
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+
+# Сколько секунд после запуска Mini App ее initData принимаются для входа
+TELEGRAM_AUTH_MAX_AGE = int(os.environ.get('TELEGRAM_AUTH_MAX_AGE', 3600))
+
+# Время (в секундах), на которое резерв товара списывает его с остатка до подтверждения заказа
+STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 15 * 60))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -153,7 +291,22 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
+
+# Кэш соответствия токен → пользователь для CachedTokenAuthentication: общий кэш
+# на TOKEN_AUTH_CACHE_TTL секунд и LRU в памяти процесса на TOKEN_AUTH_LOCAL_TTL секунд.
+# TOKEN_AUTH_CACHE_ALIAS должен быть общим для всех процессов (не LocMemCache): иначе
+# деактивированный пользователь проходит аутентификацию в других воркерах до TOKEN_AUTH_CACHE_TTL.
+TOKEN_AUTH_CACHE_ALIAS = 'default'
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 300))
+TOKEN_AUTH_LOCAL_TTL = int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', 10))
+TOKEN_AUTH_LOCAL_SIZE = int(os.environ.get('TOKEN_AUTH_LOCAL_SIZE', 1024))
+
+# Время жизни (в секундах) кэшированного документа профиля /api/accounts/profiles/me/;
+# запись сбрасывается при изменении профиля или адресов, 0 отключает кэширование.
+# Версия профиля хранится в PROFILE_CACHE_ALIAS, поэтому он должен быть общим для всех процессов
+PROFILE_CACHE_ALIAS = 'default'
+PROFILE_CACHE_TIMEOUT = int(os.environ.get('PROFILE_CACHE_TIMEOUT', 300))
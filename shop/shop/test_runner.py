@@ -0,0 +1,28 @@
+import shutil
+import tempfile
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryCacheTestRunner(DiscoverRunner):
+    """
+    Направляет кэши во временный каталог на время тестов: кэш сервера общий для процессов,
+    и тесты не должны ни очищать его, ни оставлять в нем записи о тестовых данных.
+    Файловый кэш здесь подходит: записей мало, а экземпляры кэша видят записи друг друга.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.mkdtemp(prefix='shop-test-cache-')
+        self.cache_settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.cache_directory,
+            },
+        })
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
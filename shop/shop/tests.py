@@ -0,0 +1,292 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.contrib.auth.models import User
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from catalog.models import Category
+from catalog.response_cache import CATALOG_TAG, response_cache
+from tasks.models import Task
+from tasks.queue import enqueue, run_pending_tasks
+from .db import retry_on_locked, snapshot_database
+from .routers import PIN_COOKIE, PrimaryPinMiddleware, ReplicaRouter, _pinned, _replica, primary_reads, replica_health
+
+
+def count_categories():
+    # Задача видит категорию, записанную перед постановкой в очередь, а не снимок реплики
+    if Category.objects.count() != 2:
+        raise AssertionError('Задача прочитала отстающую реплику')
+
+
+class FlakyWrite:
+    """Функция, которая первые failures вызовов завершается ошибкой error"""
+
+    def __init__(self, failures, error='database is locked'):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OperationalError(self.error)
+        return 'ok'
+
+
+@override_settings(SQLITE_WRITE_RETRIES=3)
+@mock.patch('shop.db.time.sleep')
+class RetryOnLockedTest(SimpleTestCase):
+    """Тесты повтора записи при «database is locked»"""
+
+    def test_locked_write_is_retried_with_backoff(self, sleep):
+        write = FlakyWrite(failures=2)
+
+        self.assertEqual(retry_on_locked(write)(), 'ok')
+
+        self.assertEqual(write.calls, 3)
+        first, second = [call.args[0] for call in sleep.call_args_list]
+        self.assertLess(first, second * 2)
+        self.assertLessEqual(second, 0.1)
+
+    def test_retries_are_limited(self, sleep):
+        write = FlakyWrite(failures=10)
+
+        with self.assertRaises(OperationalError):
+            retry_on_locked(write)()
+        self.assertEqual(write.calls, 4)
+
+    def test_other_errors_are_not_retried(self, sleep):
+        write = FlakyWrite(failures=1, error='no such table: catalog_product')
+
+        with self.assertRaises(OperationalError):
+            retry_on_locked(write)()
+        self.assertEqual(write.calls, 1)
+
+
+class SharedCacheTest(SimpleTestCase):
+    def test_default_cache_is_shared_between_processes(self):
+        # Сбросы кэша в одном процессе должны быть видны остальным (см. CACHES)
+        self.assertNotIsInstance(caches['default'], LocMemCache)
+
+    def test_entries_are_visible_to_another_cache_instance(self):
+        writer = caches.create_connection('default')
+        reader = caches.create_connection('default')
+
+        writer.set('shared-cache-test', 1)
+        self.assertEqual(reader.get('shared-cache-test'), 1)
+        writer.delete('shared-cache-test')
+        self.assertIsNone(reader.get('shared-cache-test'))
+
+
+    def test_tests_do_not_use_server_cache(self):
+        location = caches['default']._dir
+        self.assertFalse(location.startswith(str(settings.BASE_DIR)))
+
+
+class CacheDatabaseRoutingTest(SimpleTestCase):
+    """Таблица DatabaseCache живет в отдельной базе и не закрепляет чтение за основной"""
+
+    @override_settings(CACHE_DATABASE='cache')
+    def test_cache_entries_use_cache_database(self):
+        router = ReplicaRouter()
+        model = DatabaseCache('django_cache', {}).cache_model_class
+
+        with unpinned():
+            self.assertEqual(router.db_for_write(model), 'cache')
+            self.assertEqual(router.db_for_read(model), 'cache')
+            self.assertFalse(_pinned.get())
+        self.assertTrue(router.allow_migrate('cache', 'django_cache'))
+        self.assertFalse(router.allow_migrate('default', 'django_cache'))
+        self.assertFalse(router.allow_migrate('cache', 'catalog'))
+
+
+@mock.patch('shop.db.time.sleep')
+class RetryInsideTransactionTest(TestCase):
+    def test_write_inside_outer_transaction_is_not_retried(self, sleep):
+        write = FlakyWrite(failures=1)
+
+        with transaction.atomic(), self.assertRaises(OperationalError):
+            retry_on_locked(write)()
+        self.assertEqual(write.calls, 1)
+
+
+@skipUnless(settings.SQLITE_PRODUCTION, 'профиль SQLITE_PRODUCTION отключен')
+class SQLiteProductionProfileTest(TestCase):
+    """Соединение с базой настраивается профилем SQLITE_PRODUCTION_OPTIONS"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        # 1 — NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), settings.SQLITE_CACHE_SIZE)
+        self.assertEqual(self.pragma('busy_timeout'), int(settings.SQLITE_BUSY_TIMEOUT * 1000))
+
+    def test_transactions_begin_immediate(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@contextmanager
+def unpinned():
+    """Чтение как в начале нового запроса: без закрепления за основной базой"""
+    tokens = _pinned.set(False), _replica.set(None)
+    try:
+        yield
+    finally:
+        _pinned.reset(tokens[0])
+        _replica.reset(tokens[1])
+
+
+@override_settings(REPLICA_DATABASES=['replica_test'], REPLICA_RETRY_INTERVAL=60)
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    Маршрутизация чтения каталога в реплику: основная база — тестовая, реплика —
+    снимок ее файла, сделанный snapshot_database до последних изменений.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'replica.sqlite3')
+        Category.objects.create(name='Фрукты', slug='fruits')
+        snapshot_database(self.path)
+        Category.objects.create(name='Овощи', slug='vegetables')
+        # Соединение с репликой создается динамически: такие тестам разрешены без databases
+        connections.settings['replica_test'] = connections.configure_settings({
+            'default': {},
+            'replica_test': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'file:{self.path}?mode=ro'},
+        })['replica_test']
+        connections['replica_test']
+        del connections.settings['replica_test']
+        replica_health.reset()
+
+    def tearDown(self):
+        connections['replica_test'].close()
+        del connections['replica_test']
+        replica_health.reset()
+        self.directory.cleanup()
+
+    def test_catalog_reads_use_replica(self):
+        with unpinned():
+            self.assertEqual(Category.objects.db, 'replica_test')
+            self.assertEqual(Category.objects.count(), 1)
+            self.assertEqual(User.objects.db, 'default')
+
+    def test_write_pins_reads_to_primary(self):
+        with unpinned():
+            Category.objects.create(name='Ягоды', slug='berries')
+
+            self.assertEqual(Category.objects.count(), 3)
+
+    def test_reads_inside_transaction_use_primary(self):
+        with unpinned(), transaction.atomic():
+            self.assertEqual(Category.objects.count(), 2)
+
+    def test_cache_fills_read_primary(self):
+        with unpinned(), primary_reads():
+            self.assertEqual(Category.objects.count(), 2)
+
+    def test_replica_response_is_cached_only_after_replica_lag(self):
+        url = reverse('catalog_api:category_list')
+        key = response_cache.key(f'http://testserver{url}')
+        # Сброс, как при создании категории в setUp
+        response_cache.invalidate([CATALOG_TAG])
+
+        # Категория создана только что: реплика может ее не содержать, ответ не кэшируется
+        self.assertEqual(len(self.client.get(url).json()), 1)
+        self.assertIsNone(response_cache.get(key))
+
+        # Реплика догнала основную базу
+        snapshot_database(self.path)
+        connections['replica_test'].close()
+        with mock.patch('catalog.response_cache.time.time', return_value=time.time() + 60):
+            self.assertEqual(len(self.client.get(url).json()), 2)
+        self.assertEqual(len(response_cache.get(key)['data']), 2)
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        os.remove(self.path)
+
+        with unpinned():
+            self.assertEqual(Category.objects.count(), 2)
+            self.assertFalse(replica_health.is_up('replica_test'))
+
+    def test_failed_replica_read_is_retried_on_primary(self):
+        replica = connections['replica_test']
+        replica.ensure_connection()
+
+        def read(request):
+            return HttpResponse(str(Category.objects.count()))
+
+        def fail(execute, sql, params, many, context):
+            raise OperationalError('disk I/O error')
+
+        # Обработчик Django превращает исключение представления в ответ 500
+        middleware = PrimaryPinMiddleware(convert_exception_to_response(read))
+        with replica.execute_wrapper(fail), self.assertLogs('django.request', 'ERROR'):
+            response = middleware(RequestFactory().get('/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'2')
+        self.assertTrue(replica_health.is_down('replica_test'))
+
+    def test_replica_is_chosen_once_per_request(self):
+        with unpinned():
+            Category.objects.count()
+            with mock.patch.object(replica_health, 'is_up') as is_up:
+                self.assertEqual(Category.objects.count(), 1)
+            is_up.assert_not_called()
+            self.assertEqual(_replica.get(), 'replica_test')
+
+    def test_task_worker_reads_primary_and_resets_pin(self):
+        enqueue(count_categories)
+
+        with unpinned():
+            run_pending_tasks()
+            self.assertFalse(_pinned.get())
+
+        self.assertEqual(Task.objects.get().status, Task.STATUS_DONE)
+
+    def test_recent_writer_reads_from_primary(self):
+        factory = RequestFactory()
+
+        def write(request):
+            Category.objects.create(name='Ягоды', slug='berries')
+            return HttpResponse()
+
+        def read(request):
+            return HttpResponse(str(Category.objects.count()))
+
+        response = PrimaryPinMiddleware(write)(factory.post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        self.assertEqual(PrimaryPinMiddleware(read)(request).content, b'3')
+        # Другой клиент читает отстающую реплику
+        self.assertEqual(PrimaryPinMiddleware(read)(factory.get('/')).content, b'1')
+
+    def test_middleware_runs_natively_under_asgi(self):
+        async def write(request):
+            await Category.objects.acreate(name='Ягоды', slug='berries')
+            return HttpResponse()
+
+        middleware = PrimaryPinMiddleware(write)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        with unpinned():
+            response = async_to_sync(middleware)(RequestFactory().post('/'))
+            self.assertIn(PIN_COOKIE, response.cookies)
+            self.assertFalse(_pinned.get())
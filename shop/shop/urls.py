@@ -15,11 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.authtoken import views
 from django.conf import settings
 from django.conf.urls.static import static
 from accounts.views import telegram_app_view
+from catalog.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,7 +28,14 @@ urlpatterns = [
     path('api-token-auth/', views.obtain_auth_token),  # Для получения токена аутентификации
     path('', telegram_app_view, name='telegram-app'),  # Главная страница - Telegram Mini App
     path('catalog/', include('catalog.urls', namespace='catalog')),  # URL для каталога товаров
-    path('api/catalog/', include('catalog.api_urls', namespace='catalog_api')),  # API URL для каталога товаров
+    # API URL для каталога товаров; при CATALOG_ASYNC_API списки и детальные страницы асинхронные
+    path('api/catalog/', include(
+        'catalog.async_api_urls' if settings.CATALOG_ASYNC_API else 'catalog.api_urls', namespace='catalog_api'
+    )),
+    path('api/cart/', include('cart.urls')),  # API корзины
+    # Изображения каталога отдаются в любом режиме, с поддержкой Range, ETag и X-Accel-Redirect
+    re_path(r'^%s(?P<path>(?:categories|sections|products)/.+)$' % settings.MEDIA_URL.lstrip('/'),
+            serve_media, name='catalog-media'),
 ]
 
 # Добавляем обработку статических файлов в режиме разработки
@@ -0,0 +1,13 @@
+// Фильтры списка в админке с автодополнением: при выборе значения
+// переходим на список с соответствующим параметром запроса
+'use strict';
+(function($) {
+    $(document).on('change', '.autocomplete-filter select', function() {
+        const container = this.closest('.autocomplete-filter');
+        const params = new URLSearchParams(container.dataset.queryString);
+        if (this.value) {
+            params.set(container.dataset.lookup, this.value);
+        }
+        window.location.search = params.toString();
+    });
+})(django.jQuery);
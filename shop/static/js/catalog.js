@@ -18,7 +18,7 @@ function initCatalog() {
     document.getElementById('back-to-categories').addEventListener('click', showCategories);
     document.getElementById('back-to-sections').addEventListener('click', () => {
         if (currentCategory) {
-            showSections(currentCategory.slug);
+            showSections(currentCategory.sections);
         } else {
             showCategories();
         }
@@ -47,20 +47,20 @@ function applyTelegramTheme() {
     }
 }
 
-// Загрузка списка категорий
+// Загрузка дерева каталога (категории, разделы и товары) одним запросом
 function loadCategories() {
     // Показываем индикатор загрузки
     showLoading('catalog-content');
     
-    fetch('/api/catalog/categories/')
+    fetch('/api/catalog/tree/')
         .then(response => {
             if (!response.ok) {
-                throw new Error('Ошибка при получении категорий');
+                throw new Error('Ошибка при получении каталога');
             }
             return response.json();
         })
         .then(data => {
-            categories = data;
+            categories = data.categories;
             showCategories();
         })
         .catch(error => {
@@ -70,6 +70,21 @@ function loadCategories() {
         });
 }
 
+// Выбор варианта изображения нужной ширины из image_srcset с учетом плотности пикселей экрана
+function imageUrl(item, displayWidth) {
+    if (!item.image_srcset) {
+        return item.image;
+    }
+    
+    const targetWidth = displayWidth * (window.devicePixelRatio || 1);
+    const variants = item.image_srcset.webp.split(', ').map(candidate => {
+        const [url, width] = candidate.split(' ');
+        return { url, width: parseInt(width, 10) };
+    });
+    const variant = variants.find(v => v.width >= targetWidth) || variants[variants.length - 1];
+    return variant.url;
+}
+
 // Отображение списка категорий
 function showCategories() {
     // Сбрасываем текущие выбранные элементы
@@ -130,7 +145,7 @@ function createCategoryCard(category) {
     
     // Добавляем изображение категории
     if (category.image) {
-        categoryCard.style.backgroundImage = `url(${category.image})`;
+        categoryCard.style.backgroundImage = `url(${imageUrl(category, 150)})`;
     } else {
         // Если изображения нет, добавляем заглушку
         categoryCard.classList.add('no-image');
@@ -144,31 +159,17 @@ function createCategoryCard(category) {
     return categoryCard;
 }
 
-// Загрузка разделов выбранной категории
+// Отображение разделов выбранной категории из загруженного дерева
 function loadSections(categorySlug) {
-    // Показываем индикатор загрузки
-    showLoading('catalog-content');
-    
     // Находим выбранную категорию
     currentCategory = categories.find(cat => cat.slug === categorySlug);
     
-    fetch(`/api/catalog/categories/${categorySlug}/sections/`)
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Ошибка при получении разделов');
-            }
-            return response.json();
-        })
-        .then(data => {
-            const sections = data;
-            showSections(sections);
-            hideLoading('catalog-content');
-        })
-        .catch(error => {
-            console.error('Error:', error);
-            showError("Не удалось загрузить разделы категории");
-            hideLoading('catalog-content');
-        });
+    if (!currentCategory) {
+        showError("Не удалось загрузить разделы категории");
+        return;
+    }
+    
+    showSections(currentCategory.sections);
 }
 
 // Отображение разделов категории
@@ -228,7 +229,7 @@ function createSectionCard(section) {
     
     // Добавляем изображение раздела
     if (section.image) {
-        sectionCard.style.backgroundImage = `url(${section.image})`;
+        sectionCard.style.backgroundImage = `url(${imageUrl(section, 150)})`;
     } else {
         // Если изображения нет, добавляем заглушку
         sectionCard.classList.add('no-image');
@@ -242,41 +243,18 @@ function createSectionCard(section) {
     return sectionCard;
 }
 
-// Загрузка товаров выбранного раздела
+// Отображение товаров выбранного раздела из загруженного дерева
 function loadProducts(categorySlug, sectionSlug) {
-    // Показываем индикатор загрузки
-    showLoading('catalog-content');
+    const category = categories.find(cat => cat.slug === categorySlug);
+    currentSection = category ? category.sections.find(sec => sec.slug === sectionSlug) : null;
     
-    // Получаем выбранный раздел через API
-    fetch(`/api/catalog/categories/${categorySlug}/sections/${sectionSlug}/`)
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Ошибка при получении информации о разделе');
-            }
-            return response.json();
-        })
-        .then(section => {
-            currentSection = section;
-            
-            // После получения раздела загружаем товары
-            return fetch(`/api/catalog/categories/${categorySlug}/sections/${sectionSlug}/products/`);
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Ошибка при получении товаров');
-            }
-            return response.json();
-        })
-        .then(data => {
-            currentProducts = data;
-            showProducts();
-            hideLoading('catalog-content');
-        })
-        .catch(error => {
-            console.error('Error:', error);
-            showError("Не удалось загрузить данные раздела или товары");
-            hideLoading('catalog-content');
-        });
+    if (!currentSection) {
+        showError("Не удалось загрузить данные раздела или товары");
+        return;
+    }
+    
+    currentProducts = currentSection.products;
+    showProducts();
 }
 
 // Отображение товаров раздела
@@ -332,7 +310,7 @@ function createProductCard(product) {
     const productImage = document.createElement('div');
     productImage.className = 'product-image';
     if (product.image) {
-        productImage.style.backgroundImage = `url(${product.image})`;
+        productImage.style.backgroundImage = `url(${imageUrl(product, 80)})`;
     } else {
         productImage.classList.add('no-image');
     }
@@ -32,7 +32,8 @@ function updateProfileInfo() {
     })
     .then(profileData => {
         displayProfileData(profileData);
-        loadUserAddresses();
+        // Addresses are part of the profile document, no second request needed
+        displayAddresses(profileData.addresses || []);
     })
     .catch(error => {
         console.error('Error:', error);
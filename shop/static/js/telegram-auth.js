@@ -26,23 +26,9 @@ function initTelegramApp() {
 
 // Register or login a Telegram user
 function registerTelegramUser(user) {
-    // Get the hash for validation
-    const initData = tg.initData;
-    
-    // Prepare user data
+    // The server takes the user from the signed initData and verifies its hash
     const userData = {
-        username: `tg_${user.id}`,
-        password: generateRandomPassword(), // Generate a random password for the user
-        password2: generateRandomPassword(), // Same password for confirmation
-        email: `${user.id}@telegram.user`, // Placeholder email
-        telegram_id: user.id,
-        telegram_username: user.username,
-        telegram_first_name: user.first_name,
-        telegram_last_name: user.last_name,
-        telegram_photo_url: user.photo_url,
-        telegram_auth_date: tg.initDataUnsafe.auth_date,
-        telegram_hash: tg.initDataUnsafe.hash,
-        init_data: initData
+        init_data: tg.initData
     };
     
     // Send registration request
@@ -75,11 +61,6 @@ function registerTelegramUser(user) {
     });
 }
 
-// Generate a random password for the user
-function generateRandomPassword() {
-    return Math.random().toString(36).slice(-10) + Math.random().toString(36).slice(-10);
-}
-
 // Show error message
 function showError(message) {
     const errorElement = document.getElementById('error-message');
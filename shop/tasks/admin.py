@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at']
+    list_filter = ['status']
+    search_fields = ['name']
+    readonly_fields = ['created_at', 'updated_at', 'started_at', 'finished_at']
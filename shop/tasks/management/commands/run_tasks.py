@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tasks.queue import run_pending_tasks
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер фоновых задач из базы данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и завершиться')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Пауза между опросами очереди, в секундах')
+        parser.add_argument('--max-tasks', type=int, default=None, help='Завершиться после указанного числа задач')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            close_old_connections()
+            limit = None if options['max_tasks'] is None else options['max_tasks'] - processed
+            count = run_pending_tasks(limit=limit)
+            processed += count
+            if count:
+                self.stdout.write(f'Выполнено задач: {count}')
+            if options['once'] or (options['max_tasks'] is not None and processed >= options['max_tasks']):
+                break
+            if not count:
+                time.sleep(options['sleep'])
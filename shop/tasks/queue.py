@@ -0,0 +1,104 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from shop.routers import primary_reads
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Базовая задержка перед повтором; удваивается с каждой неудачной попыткой
+RETRY_DELAY = timedelta(seconds=30)
+
+# Задача в статусе «выполняется» дольше этого времени считается брошенной упавшим воркером
+STALE_TASK_TIMEOUT = timedelta(minutes=10)
+
+
+def _task_name(func):
+    return func if isinstance(func, str) else f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, max_attempts=3, delay=None, **kwargs):
+    """
+    Ставит функцию в очередь. func — функция уровня модуля или ее полный путь.
+    Аргументы должны сериализоваться в JSON. Задача создается в текущей транзакции,
+    поэтому при ее откате в очередь ничего не попадет.
+    """
+    run_after = timezone.now() + (delay or timedelta())
+    return Task.objects.create(name=_task_name(func), kwargs=kwargs, max_attempts=max_attempts, run_after=run_after)
+
+
+def enqueue_many(func, kwargs_list, max_attempts=3):
+    """Ставит в очередь по задаче на каждый словарь аргументов одним bulk_create"""
+    name = _task_name(func)
+    run_after = timezone.now()
+    return Task.objects.bulk_create([
+        Task(name=name, kwargs=kwargs, max_attempts=max_attempts, run_after=run_after)
+        for kwargs in kwargs_list
+    ])
+
+
+def claim_next_task():
+    """
+    Захватывает следующую готовую к выполнению задачу.
+    Захват выполняется условным UPDATE, поэтому несколько воркеров не возьмут одну задачу
+    и блокировка строк не требуется. Брошенная задача, попытки которой исчерпаны
+    (например, воркер каждый раз падает по памяти), помечается ошибочной, а не повторяется.
+    """
+    now = timezone.now()
+    stale = Q(status=Task.STATUS_RUNNING, started_at__lt=now - STALE_TASK_TIMEOUT)
+    exhausted = Task.objects.filter(stale, attempts__gte=F('max_attempts')).update(
+        status=Task.STATUS_FAILED, last_error='Воркер не завершил последнюю попытку', finished_at=now, updated_at=now
+    )
+    if exhausted:
+        logger.error('Брошенных задач с исчерпанными попытками: %s, помечены ошибочными', exhausted)
+    ready = Q(status=Task.STATUS_PENDING, run_after__lte=now) | (stale & Q(attempts__lt=F('max_attempts')))
+    for task in Task.objects.filter(ready).order_by('run_after', 'id')[:10]:
+        claimed = Task.objects.filter(pk=task.pk, status=task.status, attempts=task.attempts).update(
+            status=Task.STATUS_RUNNING, started_at=now, attempts=task.attempts + 1, updated_at=now
+        )
+        if claimed:
+            task.status = Task.STATUS_RUNNING
+            task.started_at = now
+            task.attempts += 1
+            return task
+    return None
+
+
+def run_task(task):
+    """Выполняет захваченную задачу и сохраняет результат или планирует повтор"""
+    try:
+        import_string(task.name)(**task.kwargs)
+    except Exception:
+        task.last_error = traceback.format_exc()
+        if task.attempts < task.max_attempts:
+            task.status = Task.STATUS_PENDING
+            task.run_after = timezone.now() + RETRY_DELAY * 2 ** (task.attempts - 1)
+            logger.warning('Задача %s (%s) завершилась ошибкой, повтор запланирован', task.pk, task.name)
+        else:
+            task.status = Task.STATUS_FAILED
+            task.finished_at = timezone.now()
+            logger.error('Задача %s (%s) завершилась ошибкой после %s попыток', task.pk, task.name, task.attempts)
+    else:
+        task.status = Task.STATUS_DONE
+        task.last_error = ''
+        task.finished_at = timezone.now()
+    task.save(update_fields=['status', 'last_error', 'run_after', 'finished_at', 'updated_at'])
+    return task
+
+
+def run_pending_tasks(limit=None):
+    """Выполняет готовые задачи, пока они есть. Возвращает количество выполненных задач"""
+    processed = 0
+    while limit is None or processed < limit:
+        # Задача читает то, что записали перед ее постановкой в очередь, а реплика может
+        # отставать; закрепление за основной базой снимается после каждой задачи
+        with primary_reads():
+            task = claim_next_task()
+            if task is None:
+                break
+            run_task(task)
+        processed += 1
+    return processed
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from .models import Task
+from .queue import enqueue, run_pending_tasks
+
+calls = []
+
+
+def record_call(value):
+    calls.append(value)
+
+
+def always_fail():
+    raise RuntimeError('ошибка задачи')
+
+
+class TaskQueueTest(TestCase):
+    """Тесты очереди фоновых задач"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_task_runs_and_is_marked_done(self):
+        task = enqueue(record_call, value=42)
+
+        self.assertEqual(run_pending_tasks(), 1)
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_DONE)
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(calls, [42])
+
+    def test_delayed_task_is_not_run_early(self):
+        enqueue(record_call, delay=timedelta(minutes=5), value=1)
+
+        self.assertEqual(run_pending_tasks(), 0)
+        self.assertEqual(calls, [])
+
+    def test_failed_task_is_retried_then_marked_failed(self):
+        task = enqueue(always_fail, max_attempts=2)
+
+        with self.assertLogs('tasks.queue', 'WARNING'):
+            run_pending_tasks()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_PENDING)
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertIn('ошибка задачи', task.last_error)
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            run_pending_tasks()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_FAILED)
+        self.assertEqual(task.attempts, 2)
+
+    def test_stale_running_task_is_reclaimed(self):
+        task = enqueue(record_call, value=7)
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.STATUS_RUNNING, attempts=1, started_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(run_pending_tasks(), 1)
+        self.assertEqual(calls, [7])
+
+    def test_stale_task_without_attempts_left_is_failed(self):
+        task = enqueue(record_call, max_attempts=2, value=7)
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.STATUS_RUNNING, attempts=2, started_at=timezone.now() - timedelta(hours=1)
+        )
+
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            self.assertEqual(run_pending_tasks(), 0)
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertEqual(calls, [])